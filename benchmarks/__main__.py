@@ -0,0 +1,108 @@
+"""
+Benchmarks conda_parser against a generated local channel, offline:
+
+    $ python -m benchmarks --output results.json
+    $ python -m benchmarks --compare results.json  # exits 1 on a regression
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import typing
+
+from .channel import PLATFORMS, write_channel
+from .harness import compare, measure
+
+
+def configure(root: str) -> None:
+    """
+    Writes the local channels as a mirror (see conda_parser.mirror) and points
+    conda at it, so "defaults", "anaconda" and "conda-forge" are all local,
+    with packages for this platform and each of PLATFORMS
+    """
+    from conda.base.context import context
+    from conda_parser import mirror
+
+    for subdir in dict.fromkeys((context.subdir,) + PLATFORMS):
+        for channel in ("pkgs/main", "anaconda", "conda-forge"):
+            write_channel(root, channel, subdir)
+
+    os.environ["CONDA_PKGS_DIRS"] = os.path.join(root, "package-cache")
+    mirror.configure(root)
+
+
+def main(argv: typing.Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Benchmarks conda_parser"
+    )
+    parser.add_argument("--output", help="write the results json here, not stdout")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--only", action="append", help="run just these benchmarks")
+    parser.add_argument("--compare", help="results json of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="how much slower, or bigger, is a regression (default 0.25, 25%%)",
+    )
+    parser.add_argument("--channel-dir", help="where to write the local channels")
+    args = parser.parse_args(argv)
+
+    configure(args.channel_dir or tempfile.mkdtemp(prefix="conda-parser-bench-"))
+    from conda import __version__ as conda_version
+    from conda.base.context import context
+
+    from .suite import BENCHMARKS
+
+    names = args.only or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    # conda prints solve progress, keep stdout for the json
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in names:
+            results[name] = result = measure(BENCHMARKS[name](), args.iterations)
+            print(
+                f"{name:<28} {result['throughput']:>10.1f}/s "
+                f"p50 {result['p50_ms']:>9.2f}ms p99 {result['p99_ms']:>9.2f}ms "
+                f"peak {result['peak_memory'] / 1024:>9.0f}KiB"
+            )
+
+    output = {
+        "meta": {
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "conda": conda_version,
+            "solver": getattr(context, "solver", "classic"),
+            "subdir": context.subdir,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        for name, metric, before, after in regressions:
+            print(
+                f"REGRESSION {name} {metric}: {before:.2f} -> {after:.2f}",
+                file=sys.stderr,
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
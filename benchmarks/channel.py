@@ -0,0 +1,74 @@
+"""
+A generated local conda channel, so benchmarks run offline and always solve
+against the same packages.
+"""
+import json
+import os
+import random
+import typing
+
+# the platforms multi-platform solves are benchmarked for
+PLATFORMS = ("linux-64", "osx-64", "win-64")
+
+
+def package_names(count: int) -> typing.List[str]:
+    return [f"bench-{i:04d}" for i in range(count)]
+
+
+def repodata(
+    subdir: str, packages: int = 300, versions: int = 4, seed: int = 0
+) -> dict:
+    """
+    `packages` packages with `versions` versions each. Every package depends on
+    a few packages before it in the list, so solves have some depth to them.
+    """
+    rng = random.Random(seed)
+    names = package_names(packages)
+    records = {}
+    for i, name in enumerate(names):
+        for version in range(1, versions + 1):
+            depends = [
+                f"{names[d]} >={rng.randint(1, versions - 1)}"
+                for d in sorted(rng.sample(range(i), min(i, rng.randint(0, 3))))
+            ]
+            fn = f"{name}-{version}.0-0.tar.bz2"
+            records[fn] = {
+                "name": name,
+                "version": f"{version}.0",
+                "build": "0",
+                "build_number": 0,
+                "depends": depends,
+                "license": "MIT",
+                "md5": "0" * 32,
+                "sha256": "0" * 64,
+                "size": 1024,
+                "subdir": subdir,
+                "timestamp": 1500000000000 + version,
+            }
+    return {"info": {"subdir": subdir}, "packages": records}
+
+
+def write_channel(root: str, name: str, subdir: str, **kwargs) -> str:
+    """ Writes the channel to root/name, returns its file:// url """
+    for each, data in ((subdir, repodata(subdir, **kwargs)), ("noarch", None)):
+        path = os.path.join(root, name, each)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "repodata.json"), "w") as f:
+            json.dump(data or {"info": {"subdir": each}, "packages": {}}, f)
+    return "file://" + os.path.join(os.path.abspath(root), name)
+
+
+def environment_file(
+    names: typing.Sequence[str], channels: typing.Sequence[str] = ("conda-forge",)
+) -> str:
+    """
+    An environment.yml for `names`, in the formats people write them, every
+    spec allows the newest version so the environment is always solvable
+    """
+    styles = ["{}", "{} >=1.0", "{}=4", "{} 4.0", "{} >=2.0,<5"]
+    lines = ["name: benchmark", "channels:"]
+    lines += [f"  - {channel}" for channel in channels]
+    lines.append("dependencies:")
+    lines += [f"  - {styles[i % len(styles)].format(n)}" for i, n in enumerate(names)]
+    lines += ["  - pip", "  - pip:", "    - requests==2.22.0"]
+    return "\n".join(lines) + "\n"
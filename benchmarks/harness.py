@@ -0,0 +1,69 @@
+import time
+import tracemalloc
+import typing
+
+
+def measure(function: typing.Callable, iterations: int, warmup: int = 1) -> dict:
+    """
+    Times `iterations` calls of `function`, after `warmup` untimed ones, then
+    makes one more call under tracemalloc for its peak memory.
+    """
+    for _ in range(warmup):
+        function()
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return summarize(times, peak)
+
+
+def percentile(ordered: typing.Sequence[float], percent: float) -> float:
+    """ Nearest rank percentile of an already sorted list """
+    rank = max(1, -(-len(ordered) * percent // 100))  # ceiling
+    return ordered[int(rank) - 1]
+
+
+def summarize(times: typing.Sequence[float], peak_memory: int) -> dict:
+    """ Latencies are in milliseconds, throughput in calls per second """
+    ordered = sorted(times)
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "throughput": len(ordered) / total if total else 0.0,
+        "mean_ms": total / len(ordered) * 1000,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p90_ms": percentile(ordered, 90) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "peak_memory": peak_memory,
+    }
+
+
+COMPARED = ("p50_ms", "p90_ms", "peak_memory")
+
+
+def compare(
+    baseline: dict, results: dict, threshold: float
+) -> typing.List[typing.Tuple[str, str, float, float]]:
+    """
+    (benchmark, metric, baseline value, new value) for each of COMPARED that
+    grew by more than `threshold` (eg: 0.2 for 20%), for benchmarks in both
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric in COMPARED:
+            if result[metric] > before[metric] * (1 + threshold):
+                regressions.append((name, metric, before[metric], result[metric]))
+    return regressions
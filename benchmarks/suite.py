@@ -0,0 +1,246 @@
+"""
+The benchmarks. conda has to be pointed at the local channel before this is
+imported, see __main__.configure. Each one is a function returning the
+callable to time, which starts from cold conda_parser caches, but with the
+channel's repodata already loaded.
+"""
+import subprocess
+import sys
+import typing
+
+from conda_parser import create_app
+from conda_parser.info import PACKAGE_CACHE, package_info
+from conda_parser.parse import (
+    PARSE_CACHE,
+    PIP_CACHE,
+    SOLVE_CACHE,
+    SPEC_CACHE,
+    clean_channels,
+    clean_out_pip,
+    match_pip,
+    match_specs,
+    parse_environment,
+    read_environment,
+    solve_environment,
+    solve_platforms,
+)
+
+from .channel import PLATFORMS, environment_file, package_names
+
+SIZES = {"small": 5, "medium": 25, "large": 100}
+BENCHMARKS = {}
+
+
+def benchmark(name: str) -> typing.Callable:
+    def register(function: typing.Callable) -> typing.Callable:
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def clear_caches() -> None:
+    SOLVE_CACHE.clear()
+    SPEC_CACHE.clear()
+    PIP_CACHE.clear()
+    PARSE_CACHE.clear()
+    PACKAGE_CACHE.clear()
+
+
+def _body(size: str) -> str:
+    return environment_file(package_names(SIZES[size]))
+
+
+@benchmark("read_environment")
+def bench_read_environment():
+    body = _body("large")
+    return lambda: read_environment(body)
+
+
+@benchmark("match_specs")
+def bench_match_specs():
+    specs = clean_out_pip(read_environment(_body("large"))["dependencies"])
+
+    def run():
+        SPEC_CACHE.clear()
+        match_specs(specs)
+
+    return run
+
+
+@benchmark("match_specs_cached")
+def bench_match_specs_cached():
+    specs = clean_out_pip(read_environment(_body("large"))["dependencies"])
+    return lambda: match_specs(specs)
+
+
+PIP_STYLES = [
+    "{}",
+    "{}==1.0",
+    "{}>=1.0,<2",
+    "{}[extra] ~= 1.4",
+    "{} >=1.0 ; python_version < '3.8'",
+    "git+https://github.com/librariesio/{0}.git@v1#egg={0}",
+]
+
+
+@benchmark("match_pip")
+def bench_match_pip():
+    names = package_names(SIZES["large"])
+    lines = [PIP_STYLES[i % len(PIP_STYLES)].format(n) for i, n in enumerate(names)]
+
+    def run():
+        PIP_CACHE.clear()
+        match_pip(lines)
+
+    return run
+
+
+@benchmark("parse_environment")
+def bench_parse_environment():
+    body = _body("large")
+
+    def run():
+        clear_caches()
+        parse_environment("environment.yml", body)
+
+    return run
+
+
+def _environment(size: str) -> dict:
+    environment = read_environment(_body(size))
+    environment["dependencies"] = match_specs(
+        clean_out_pip(environment["dependencies"])
+    )
+    environment["channels"] = clean_channels(environment["channels"])
+    return environment
+
+
+def _bench_solve(size: str) -> typing.Callable:
+    environment = _environment(size)
+
+    def run():
+        clear_caches()
+        solve_environment(dict(environment))
+
+    return run
+
+
+@benchmark("solve_environment_small")
+def bench_solve_environment_small():
+    return _bench_solve("small")
+
+
+@benchmark("solve_environment_medium")
+def bench_solve_environment_medium():
+    return _bench_solve("medium")
+
+
+@benchmark("solve_environment_large")
+def bench_solve_environment_large():
+    return _bench_solve("large")
+
+
+def _bench_solve_incremental(changed: typing.Callable) -> typing.Callable:
+    environment = _environment("medium")
+    previous, _ = solve_environment(dict(environment))
+    environment["dependencies"] = changed(environment["dependencies"])
+
+    def run():
+        clear_caches()
+        solve_environment(dict(environment), previous=previous)
+
+    return run
+
+
+@benchmark("solve_incremental_reused")
+def bench_solve_incremental_reused():
+    """ A spec removed, the previous lockfile still satisfies the rest """
+    return _bench_solve_incremental(lambda specs: specs[1:])
+
+
+@benchmark("solve_incremental_pinned")
+def bench_solve_incremental_pinned():
+    """ A spec added, solved with the previous lockfile's packages pinned """
+    name = package_names(SIZES["large"])[-1]
+    return _bench_solve_incremental(lambda specs: specs + [{"name": name}])
+
+
+@benchmark("solve_platforms")
+def bench_solve_platforms():
+    environment = _environment("medium")
+
+    def run():
+        clear_caches()
+        solve_platforms(dict(environment), PLATFORMS)
+
+    return run
+
+
+@benchmark("solve_platforms_serial")
+def bench_solve_platforms_serial():
+    """ The same solves one after another, what solve_platforms is compared to """
+    environment = _environment("medium")
+
+    def run():
+        clear_caches()
+        for platform in PLATFORMS:
+            solve_environment(dict(environment), platform)
+
+    return run
+
+
+def _bench_startup(code: str) -> typing.Callable:
+    # a fresh interpreter each time, as a gunicorn worker or the CLI starts
+    command = [sys.executable, "-c", f"import conda_parser; {code}"]
+    return lambda: subprocess.run(command, check=True)
+
+
+@benchmark("startup")
+def bench_startup():
+    """ Importing the package and creating the app, conda isn't imported """
+    return _bench_startup("conda_parser.create_app()")
+
+
+@benchmark("startup_preload")
+def bench_startup_preload():
+    """ The same, with everything a request needs imported up front """
+    return _bench_startup("conda_parser.create_app(); conda_parser.preload_imports()")
+
+
+@benchmark("package_info")
+def bench_package_info():
+    names = package_names(SIZES["large"])
+
+    def run():
+        PACKAGE_CACHE.clear()
+        for name in names:
+            package_info("conda-forge", name, "2.0")
+
+    return run
+
+
+def _bench_parse_endpoint(size: str, force_solve: bool) -> typing.Callable:
+    client = create_app().test_client()
+    data = {"file": _body(size), "filename": "environment.yml"}
+    url = "/parse?force_solve=1" if force_solve else "/parse"
+
+    def run():
+        clear_caches()
+        response = client.post(
+            url, data=data, content_type="application/x-www-form-urlencoded"
+        )
+        if response.status_code != 200 or "error" in response.get_json():
+            raise RuntimeError(f"{url} failed: {response.data[:200]}")
+
+    return run
+
+
+@benchmark("parse_endpoint")
+def bench_parse_endpoint():
+    return _bench_parse_endpoint("large", False)
+
+
+@benchmark("parse_endpoint_solve")
+def bench_parse_endpoint_solve():
+    return _bench_parse_endpoint("medium", True)
@@ -1,78 +1,50 @@
-from flask import Flask, request, jsonify, abort, redirect
-
-from .exceptions import MissingParameters
-from .info import package_info
-from .parse import parse_environment
-
-from conda.exceptions import ResolvePackageNotFound
+"""
+Parses conda environment files, and solves them into lockfiles. Importing the
+package is cheap: Flask and conda are imported when they're first used, or
+up front by preload_imports(), eg: in the gunicorn master before it forks.
+"""
+import importlib
+
+from . import mirror, settings
+
+if settings.MIRROR_DIR:
+    mirror.configure(settings.MIRROR_DIR)
+
+# what a request can need, in the order they're imported
+PRELOAD_MODULES = (
+    "flask",
+    "conda.base.context",
+    "conda.exceptions",
+    "conda.models.match_spec",
+    "conda.api",
+    "conda_parser.app",
+    "conda_parser.executor",
+    "conda_parser.index",
+    "conda_parser.info",
+    "conda_parser.jobs",
+    "conda_parser.parse",
+)
 
 
 def create_app():
-    app = Flask(__name__)
-
-    @app.route("/")
-    def index():
-        return "OK"
-
-    @app.route("/package")
-    def package():
-        name = request.args.get("name")  # Support package, or name being key
-        if not name:
-            raise MissingParameters
+    from .app import create_app
 
-        channel = request.args.get("channel", "pkgs/main")
-        version = request.args.get("version", "")  # Optional
-        _pkg = package_info(channel, name, version)
-        if request.args.get("download"):
-            return redirect(_pkg["url"])
-        else:
-            return jsonify(_pkg), 200
+    return create_app()
 
-    @app.route("/parse", methods=["POST"])
-    def parse():
-        """
-            Page for posting a file to to get the Conda dependencies back.
-            Solves a conda environment
 
-            POST Parameters two options:
-                multipart/form-data:
-                    file: an environment.y(a)ml file
-                application/x-www-form-urlencoded:
-                    file: the text of the environment file
-                    filename: the filename (needs to be .yml or .yaml)
-            Query Parameters:
-                [force_solve=1]
-                    existance of any value will cause this flag to be set and solve
-                    whether there is a lock file or not.
-            Returns:
-                json with "error" or with "dependencies"/"channels"
-        """
-        force_solve = bool(request.args.get("force_solve", False))
+def create_asgi_app():
+    from .frontend import create_asgi_app
 
-        # get the file from either files or form
-        if request.content_type.startswith("application/x-www-form-urlencoded"):
-            body = request.form.get("file")
-            filename = request.form.get("filename")
-        elif request.content_type.startswith("multipart/form-data"):
-            f = request.files.get("file")
-            filename = f.filename if hasattr(f, "filename") else f.name
-            body = f.read()
+    return create_asgi_app()
 
-        return jsonify(parse_environment(filename, body, force_solve)), 200
 
-    @app.errorhandler(ResolvePackageNotFound)
-    def not_found(e):
-        message = f"Error: Package(s) not found: {e}"
-        return jsonify(error=404, text=message), 404
-
-    @app.errorhandler(MissingParameters)
-    def missing_params(e):
-        message = f"Error: Please provide a `name=` query parameter"
-        return jsonify(error=404, text=message), 404
+def main(debug=False):
+    from .app import main
 
-    return app
+    main(debug=debug)
 
 
-def main(debug=False):
-    app = create_app()
-    app.run(host="0.0.0.0", debug=debug)
+def preload_imports() -> None:
+    """ Imports everything a request can need, so no request pays for it """
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
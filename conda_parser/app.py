@@ -0,0 +1,465 @@
+"""
+The Flask app. It doesn't import conda, the modules that solve or look
+packages up import it when they're first used.
+"""
+import functools
+import json
+import time
+import typing
+
+from flask import Flask, Response, g, request, jsonify, abort, redirect
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from . import metrics, profiling, settings
+from .exceptions import (
+    InvalidLockfile,
+    MissingParameters,
+    PackageNotFound,
+    QueueFull,
+    SolveFailed,
+    UnknownLockfile,
+)
+from .index import ready
+from .info import PACKAGE_CACHE, PACKAGE_LOOKUPS, package_info
+from .jobs import JOBS
+from .parse import (
+    LOCKFILES,
+    PARSE_CACHE,
+    PIP_CACHE,
+    SOLVE_CACHE,
+    SPEC_CACHE,
+    environment_digest,
+    error_message,
+    iter_parse_environment,
+    iter_parse_environments,
+    needs_solve,
+    parse_environment,
+    parse_environments,
+)
+
+# what refs=1 leaves out of a /parse, when there's a solved lockfile
+LOCKFILE_SECTIONS = ("lockfile", "lockfiles")
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = settings.MAX_CONTENT_LENGTH
+
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+        if profiling.PROFILER is not None:
+            profiling.PROFILER.start(request.headers.get(settings.PROFILE_HEADER))
+
+    @app.after_request
+    def record_request(response):
+        # streamed responses are timed until their first byte
+        endpoint = request.endpoint or "unknown"
+        metrics.inc(
+            "conda_parser_requests_total",
+            endpoint=endpoint,
+            method=request.method,
+            status=str(response.status_code),
+        )
+        if "started" in g:
+            elapsed = time.perf_counter() - g.started
+            metrics.observe("conda_parser_request_seconds", elapsed, endpoint=endpoint)
+        return response
+
+    @app.after_request
+    def finish_streamed_profile(response):
+        # the body is streamed after the request's torn down, on this thread
+        if profiling.PROFILER is not None and response.is_streamed:
+            g.profile_on_close = True
+            response.call_on_close(
+                functools.partial(
+                    profiling.PROFILER.finish,
+                    method=request.method,
+                    path=request.full_path,
+                    exception=None,
+                )
+            )
+        return response
+
+    @app.teardown_request
+    def finish_profile(exception):
+        if profiling.PROFILER is not None and not g.get("profile_on_close"):
+            profiling.PROFILER.finish(
+                method=request.method,
+                path=request.full_path,
+                exception=repr(exception) if exception else None,
+            )
+
+    @app.route("/")
+    def index():
+        return "OK"
+
+    @app.route("/ready")
+    def readiness():
+        """
+            Whether the preloaded channels' repodata is loaded
+            Returns:
+                json of channel -> when it was loaded, 200 if they all are, or 503
+        """
+        channels = ready()
+        status = 200 if all(channels.values()) else 503
+        return jsonify(ready=status == 200, channels=channels), status
+
+    @app.route("/stats")
+    def stats():
+        return (
+            jsonify(
+                solve_cache=SOLVE_CACHE.stats(),
+                spec_cache=SPEC_CACHE.stats(),
+                pip_cache=PIP_CACHE.stats(),
+                parse_cache=PARSE_CACHE.stats(),
+                lockfile_cache=LOCKFILES.stats(),
+                package_cache=dict(
+                    PACKAGE_CACHE.stats(), coalesced=PACKAGE_LOOKUPS.coalesced
+                ),
+                jobs=dict(queued=JOBS.queued(), max_queued=JOBS.max_queued),
+            ),
+            200,
+        )
+
+    @app.route("/metrics")
+    def metrics_page():
+        """ Prometheus metrics, added up across every gunicorn worker """
+        return Response(
+            metrics.exposition(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    @app.route("/package")
+    def package():
+        name = request.args.get("name")  # Support package, or name being key
+        if not name:
+            raise MissingParameters
+
+        channel = request.args.get("channel", "pkgs/main")
+        version = request.args.get("version", "")  # Optional
+        solve = bool(request.args.get("solve", False))  # Optional, use the solver
+        _pkg = package_info(channel, name, version, solve)
+        if request.args.get("download"):
+            return redirect(_pkg["url"])
+        else:
+            return jsonify(_pkg), 200
+
+    @app.route("/parse", methods=["POST"])
+    def parse():
+        """
+            Page for posting a file to to get the Conda dependencies back.
+            Solves a conda environment
+
+            POST Parameters two options:
+                multipart/form-data:
+                    file: an environment.y(a)ml file
+                application/x-www-form-urlencoded:
+                    file: the text of the environment file
+                    filename: the filename (needs to be .yml or .yaml)
+            Query Parameters:
+                [force_solve=1]
+                    existance of any value will cause this flag to be set and solve
+                    whether there is a lock file or not.
+                [platforms=linux-64,osx-64,win-64]
+                    solve for each of these platforms instead of the server's,
+                    returning "lockfiles" of platform -> lockfile, can be repeated
+                [graph=1]
+                    with a solve, return a "graph" of which packages in the
+                    lockfile depend on which, see parse.dependency_graph
+                [previous=<lockfile_digest>]
+                    solve starting from an earlier solve's lockfile, returning
+                    a "lockfile_diff" from it, the lockfile can be posted as
+                    `previous_lockfile` instead, a json list of name/requirement
+                [refs=1]
+                    leave solved lockfiles out, returning only their
+                    "lockfile_digest" (or "lockfile_digests"), fetch the ones
+                    you don't have already from /lockfile/<digest>
+                [async=1]
+                    run in the background, returns 202 with a job "id" to poll
+                    at /jobs/<id>, or 503 when too many jobs are queued
+            Headers:
+                [Accept: application/x-ndjson]
+                    stream the result as newline delimited json, see `ndjson_lines`
+            Returns:
+                json with "error" or with "dependencies"/"channels", and
+                without a solve an ETag, send it back as If-None-Match to get a 304
+        """
+        force_solve = bool(request.args.get("force_solve", False))
+        platforms = request_platforms()
+        previous = request_previous_lockfile()
+        graph = bool(request.args.get("graph", False))
+        refs = bool(request.args.get("refs", False))
+
+        # get the file from either files or form
+        if request.content_type.startswith("application/x-www-form-urlencoded"):
+            body = request.form.get("file")
+            filename = request.form.get("filename")
+        elif request.content_type.startswith("multipart/form-data"):
+            f = request.files.get("file")
+            filename = f.filename if hasattr(f, "filename") else f.name
+            body = f.read()
+
+        if request.args.get("async"):
+            job_id = JOBS.submit(
+                filename, body, force_solve, platforms, previous, graph
+            )
+            return jsonify(JOBS.status(job_id)), 202
+
+        if wants_ndjson():
+            sections = iter_parse_environment(
+                filename, body, force_solve, platforms, previous, graph
+            )
+            sections = streamed_errors((None, k, v) for k, v in sections)
+            return ndjson_response(without_lockfiles(sections) if refs else sections)
+
+        if not body or needs_solve(filename, force_solve, platforms, previous):
+            result = parse_environment(
+                filename, body, force_solve, platforms, previous, graph
+            )
+            return jsonify(lockfile_refs(result) if refs else result), 200
+
+        # without a solve the result only depends on the file, so its hash is the ETag
+        etag = environment_digest(filename, body, force_solve)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(parse_environment(filename, body, force_solve))
+        response.set_etag(etag)
+        return response
+
+    @app.route("/parse/batch", methods=["POST"])
+    def parse_batch():
+        """
+            Page for posting many files at once to get the Conda dependencies back.
+
+            POST Parameters two options:
+                application/json:
+                    a list of {"filename": the filename, "file": the text of the file}
+                multipart/form-data:
+                    file: an environment.y(a)ml file, repeated for each file
+            Query Parameters:
+                [force_solve=1], [platforms=linux-64,osx-64], [graph=1], [refs=1]
+                    same as /parse, applied to every file
+            Headers:
+                [Accept: application/x-ndjson]
+                    stream the results as newline delimited json, each line has
+                    the "index" of the file it belongs to
+            Returns:
+                json list in the same order as the files, each item is what
+                /parse would return for that file
+        """
+        force_solve = bool(request.args.get("force_solve", False))
+        platforms = request_platforms()
+        graph = bool(request.args.get("graph", False))
+        refs = bool(request.args.get("refs", False))
+
+        if request.is_json:
+            items = request.get_json()
+            if not isinstance(items, list) or not all(
+                isinstance(item, dict) for item in items
+            ):
+                message = "Error: Please provide a list of `filename`/`file` objects"
+                return jsonify(error=400, text=message), 400
+            files = [(item.get("filename"), item.get("file")) for item in items]
+        else:
+            files = [(f.filename, f.read()) for f in request.files.getlist("file")]
+
+        if len(files) > settings.BATCH_MAX_FILES:
+            message = f"Error: Please provide at most {settings.BATCH_MAX_FILES} files"
+            return jsonify(error=413, text=message), 413
+
+        if wants_ndjson():
+            sections = iter_parse_environments(files, force_solve, platforms, graph)
+            return ndjson_response(without_lockfiles(sections) if refs else sections)
+
+        results = parse_environments(files, force_solve, platforms, graph)
+        if refs:
+            results = [lockfile_refs(result) for result in results]
+        return jsonify(results), 200
+
+    @app.route("/lockfile/<digest>")
+    def lockfile(digest):
+        """
+            A solved lockfile by the "lockfile_digest" /parse returned
+            Returns:
+                json with the "lockfile", or 404 when it isn't kept anymore.
+                It never changes, so it has its digest as an ETag, send it
+                back as If-None-Match to get a 304
+        """
+        if request.if_none_match.contains(digest):
+            response = Response(status=304)
+        else:
+            lockfile = LOCKFILES.get(digest)
+            if lockfile is None:
+                return jsonify(error=404, text=f"Error: No lockfile `{digest}`"), 404
+            response = jsonify(lockfile=lockfile, lockfile_digest=digest)
+        response.set_etag(digest)
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        return response
+
+    @app.route("/jobs/<job_id>")
+    def job(job_id):
+        """
+            Polls a job started by /parse?async=1
+            Returns:
+                json with the job's "status", which is "pending", "failed" with
+                an "error" or "done" with the /parse "result"
+        """
+        status = JOBS.status(job_id)
+        if status is None:
+            return jsonify(error=404, text=f"Error: No job `{job_id}`"), 404
+        return jsonify(status), 200
+
+    @app.errorhandler(PackageNotFound)
+    def not_found(e):
+        message = f"Error: Package(s) not found: {e}"
+        return jsonify(error=404, text=message), 404
+
+    @app.errorhandler(MissingParameters)
+    def missing_params(e):
+        message = f"Error: Please provide a `name=` query parameter"
+        return jsonify(error=404, text=message), 404
+
+    @app.errorhandler(SolveFailed)
+    def solve_failed(e):
+        message = f"Error: Solving failed: {e}"
+        return jsonify(error=500, text=message), 500
+
+    @app.errorhandler(UnknownLockfile)
+    def unknown_lockfile(e):
+        message = f"Error: No lockfile `{e}`, post it as `previous_lockfile`"
+        return jsonify(error=404, text=message), 404
+
+    @app.errorhandler(InvalidLockfile)
+    def invalid_lockfile(e):
+        message = "Error: `previous_lockfile` must be a json list of lockfile entries"
+        return jsonify(error=400, text=message), 400
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def too_large(e):
+        message = f"Error: Requests can be at most {settings.MAX_CONTENT_LENGTH} bytes"
+        return jsonify(error=413, text=message), 413
+
+    @app.errorhandler(QueueFull)
+    def queue_full(e):
+        message = f"Error: Too many jobs are queued, please try again later"
+        response = jsonify(error=503, text=message)
+        response.headers["Retry-After"] = "60"
+        return response, 503
+
+    return app
+
+
+def request_platforms() -> list:
+    """ The platforms= query parameter, comma separated and/or repeated """
+    return [
+        platform.strip()
+        for value in request.args.getlist("platforms")
+        for platform in value.split(",")
+        if platform.strip()
+    ]
+
+
+def request_previous_lockfile() -> typing.Optional[list]:
+    """
+    The lockfile named by the previous= query parameter, or posted as the
+    previous_lockfile form field
+    """
+    key = request.args.get("previous")
+    if key:
+        previous = LOCKFILES.get(key)
+        if previous is None:
+            raise UnknownLockfile(key)
+        return previous
+
+    posted = request.form.get("previous_lockfile")
+    if not posted:
+        return None
+    try:
+        previous = json.loads(posted)
+    except ValueError:
+        raise InvalidLockfile
+    if not isinstance(previous, list) or not all(
+        isinstance(entry, dict)
+        and isinstance(entry.get("name"), str)
+        and isinstance(entry.get("requirement"), str)
+        for entry in previous
+    ):
+        raise InvalidLockfile
+    return [{"name": e["name"], "requirement": e["requirement"]} for e in previous]
+
+
+def streamed_errors(sections):
+    """
+    The sections, ending with an "error" section if a package is missing or
+    the solve fails part way through, as the 200 has been sent by then
+    """
+    try:
+        yield from sections
+    except (PackageNotFound, SolveFailed) as e:
+        yield None, "error", error_message(e)
+
+
+def lockfile_refs(result: dict) -> dict:
+    """ The result without its solved lockfiles, their digests refer to them """
+    return {
+        section: value
+        for section, value in result.items()
+        if section not in LOCKFILE_SECTIONS or value is None
+    }
+
+
+def without_lockfiles(sections):
+    """ lockfile_refs for (index, section, value) sections """
+    for index, section, value in sections:
+        if section not in LOCKFILE_SECTIONS or value is None:
+            yield index, section, value
+
+
+def wants_ndjson() -> bool:
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    )
+    return best == "application/x-ndjson"
+
+
+def ndjson_lines(sections):
+    """
+    Turns (index, section, value) tuples into lines of json, one line per
+    manifest, pip and lockfile entry, then one each for channels and bad_specs, eg:
+        {"manifest": {"name": "numpy", "requirement": "1.16.4"}}
+        {"pip": {"name": "requests", "requirement": "==2.22.0"}}
+        {"lockfile": {"name": "blas", "requirement": "1.0"}}
+        {"channels": ["anaconda", "defaults"]}
+        {"bad_specs": []}
+    or {"error": "message"}. A `null` lockfile is sent as {"lockfile": null}.
+    With platforms, each lockfile entry is sent with its "platform", eg:
+        {"lockfiles": {"name": "blas", "requirement": "1.0"}, "platform": "osx-64"}
+    When index isn't None, it's added to every line as "index".
+    """
+    for index, section, value in sections:
+        if section in ("manifest", "pip", "lockfile") and value is not None:
+            lines = [{section: entry} for entry in value]
+        elif section == "lockfiles":
+            lines = [
+                {section: entry, "platform": platform}
+                for platform, lockfile in value.items()
+                for entry in lockfile
+            ]
+        else:
+            lines = [{section: value}]
+
+        for line in lines:
+            if index is not None:
+                line["index"] = index
+            yield json.dumps(line) + "\n"
+
+
+def ndjson_response(sections) -> Response:
+    return Response(ndjson_lines(sections), mimetype="application/x-ndjson")
+
+
+def main(debug=False):
+    app = create_app()
+    app.run(host="0.0.0.0", debug=debug)
@@ -0,0 +1,3 @@
+from conda_parser import create_asgi_app
+
+app = create_asgi_app()
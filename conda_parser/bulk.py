@@ -0,0 +1,225 @@
+"""
+Parses environment files in bulk, without going through /parse, eg: for
+backfills. Reads a directory tree, a tar archive, or ndjson of
+{"filename", "file"} objects on stdin, and writes a line of ndjson for each
+file, {"filename", "result"}, where the result is what /parse returns:
+
+    $ python -m conda_parser.bulk environments/ --output results.ndjson
+    $ python -m conda_parser.bulk environments.tar.gz --unordered --workers 16
+    $ python -m conda_parser.bulk - < environments.ndjson
+
+Files are sent to a pool of worker processes in chunks, only a few chunks
+ahead of the results being written, so memory doesn't grow with the number
+of files. Each worker keeps its own spec, parse and solve caches for the whole
+run, and with CONDA_PARSER_SOLVE_CACHE_PATH set they share solves on disk.
+"""
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import tarfile
+import time
+import typing
+
+from .exceptions import PackageNotFound, SolveFailed
+from .parse import error_message, parse_environment, supported_filename
+
+File = typing.Tuple[str, typing.Union[str, bytes, "InvalidLine"]]
+
+
+class InvalidLine(typing.NamedTuple):
+    """ In place of the file of an ndjson line that couldn't be read """
+
+    error: str
+
+
+def iter_directory(root: str) -> typing.Iterator[File]:
+    """ The environment files under root, named by their path relative to it """
+    for directory, directories, filenames in os.walk(root):
+        directories.sort()  # so the files come in the same order every run
+        for filename in sorted(filenames):
+            if supported_filename(filename):
+                path = os.path.join(directory, filename)
+                with open(path, "rb") as f:
+                    yield os.path.relpath(path, root), f.read()
+
+
+def iter_tarball(path: str) -> typing.Iterator[File]:
+    """ The environment files in a tar archive, which can be compressed """
+    with tarfile.open(path, "r:*") as archive:
+        for member in archive:
+            if member.isfile() and supported_filename(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+
+def iter_ndjson(lines: typing.Iterable[str]) -> typing.Iterator[File]:
+    """
+    Files from lines of {"filename", "file"} json, blank lines are skipped.
+    A line that isn't one is an InvalidLine named `<line N>`, so it's an
+    error in the results rather than the end of the run.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            filename, body = item.get("filename"), item.get("file")
+        except (ValueError, AttributeError):
+            filename = f"<line {number}>"
+            body = InvalidLine(f'Line {number} isn\'t a {{"filename", "file"}} object')
+        yield filename, body
+
+
+def read_files(source: str) -> typing.Iterator[File]:
+    if source == "-":
+        return iter_ndjson(sys.stdin)
+    if os.path.isdir(source):
+        return iter_directory(source)
+    return iter_tarball(source)
+
+
+def chunked(files: typing.Iterable[File], size: int) -> typing.Iterator[list]:
+    files = iter(files)
+    while True:
+        chunk = list(itertools.islice(files, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_chunk(
+    chunk: typing.List[File],
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    graph: bool = False,
+) -> typing.List[typing.Tuple[str, dict]]:
+    """
+    Each file's (filename, result). Anything that goes wrong with a file, eg:
+    a missing package or a failed solve, is its "error", so the other files'
+    results aren't lost.
+    """
+    results = []
+    for filename, body in chunk:
+        if isinstance(body, InvalidLine):
+            results.append((filename, {"error": body.error}))
+            continue
+        try:
+            result = parse_environment(
+                filename, body, force_solve, platforms, graph=graph
+            )
+        except (PackageNotFound, SolveFailed) as e:
+            result = {"error": error_message(e)}
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        results.append((filename, result))
+    return results
+
+
+def _start_worker() -> None:
+    # the workers are already apart from this process, so solve in them
+    from .executor import InProcessSolverExecutor, set_executor
+
+    set_executor(InProcessSolverExecutor())
+
+
+def parse_files(
+    files: typing.Iterable[File],
+    workers: int = os.cpu_count() or 1,
+    chunk_size: int = 16,
+    ordered: bool = True,
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    graph: bool = False,
+) -> typing.Iterator[typing.Tuple[str, dict]]:
+    """
+    Parses the files on a pool of `workers` processes, yielding each file's
+    (filename, result), in the same order as `files` when `ordered`, otherwise
+    as they finish. With no workers they're parsed in this process.
+    """
+    if workers < 1:
+        for chunk in chunked(files, chunk_size):
+            yield from parse_chunk(chunk, force_solve, platforms, graph)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_start_worker
+    ) as pool:
+        pending = collections.deque()
+        for chunk in chunked(files, chunk_size):
+            pending.append(
+                pool.submit(parse_chunk, chunk, force_solve, platforms, graph)
+            )
+            # enough chunks to keep the workers busy, without reading every file
+            if len(pending) >= workers * 2:
+                for future in _finished(pending, ordered):
+                    yield from future.result()
+        while pending:
+            for future in _finished(pending, ordered):
+                yield from future.result()
+
+
+def _finished(pending: collections.deque, ordered: bool) -> list:
+    """ Takes the next chunks to write out of `pending`, waiting for them """
+    if ordered:
+        return [pending.popleft()]
+    done, _ = concurrent.futures.wait(
+        pending, return_when=concurrent.futures.FIRST_COMPLETED
+    )
+    for future in done:
+        pending.remove(future)
+    return list(done)
+
+
+def main(argv: typing.Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m conda_parser.bulk",
+        description="Parses a directory, tar archive or ndjson stream of "
+        "environment files, writing ndjson results",
+    )
+    parser.add_argument(
+        "source", help="a directory, a tar archive, or - for ndjson on stdin"
+    )
+    parser.add_argument("--output", help="write the results here, not stdout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument(
+        "--unordered", action="store_true", help="write results as they finish"
+    )
+    parser.add_argument("--force-solve", action="store_true")
+    parser.add_argument("--platform", action="append", dest="platforms")
+    parser.add_argument("--graph", action="store_true")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    started = time.perf_counter()
+    count = errors = 0
+    try:
+        for filename, result in parse_files(
+            read_files(args.source),
+            args.workers,
+            args.chunk_size,
+            not args.unordered,
+            args.force_solve,
+            args.platforms,
+            args.graph,
+        ):
+            output.write(json.dumps({"filename": filename, "result": result}) + "\n")
+            count += 1
+            errors += "error" in result
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"parsed {count} files ({errors} errors) in {elapsed:.1f}s, "
+        f"{count / elapsed if elapsed else 0:.1f} files/s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+
+class LRUCache:
+    """
+    A thread-safe, size bounded, least recently used cache, entries can
+    optionally expire `ttl` seconds after they are set.
+    `get` returns None on a miss, so don't store None values.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: typing.Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: typing.Hashable) -> typing.Any:
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        if self.maxsize <= 0:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        """ Whether `key` is kept and unexpired, without counting or using it """
+        with self._lock:
+            try:
+                expires, _ = self._data[key]
+            except KeyError:
+                return False
+            return expires is None or expires > time.monotonic()
+
+
+class SQLiteCache:
+    """
+    An on-disk cache of JSON values, one file can be shared by every gunicorn
+    worker. When there are more than `maxsize` rows the oldest are evicted.
+    """
+
+    def __init__(self, path: str, maxsize: int = 100000, table: str = "cache"):
+        self.path = path
+        self.maxsize = maxsize
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self.hits = self.misses = self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections can't be shared across a fork, so open one per process
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str) -> typing.Any:
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,))
+                .fetchone()
+            )
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value: typing.Any) -> None:
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            (count,) = connection.execute(
+                f"SELECT COUNT(*) FROM {self.table}"
+            ).fetchone()
+            if count > self.maxsize:
+                evicted = connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY created LIMIT ?)",
+                    (count - self.maxsize,),
+                ).rowcount
+                self.evictions += evicted
+            connection.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            connection = self._connect()
+            connection.execute(f"DELETE FROM {self.table}")
+            connection.commit()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            (size,) = (
+                self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            )
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class TieredCache:
+    """
+    An in-memory LRUCache in front of an optional, shared SQLiteCache.
+    Disk hits are promoted into memory.
+    """
+
+    def __init__(self, memory: LRUCache, disk: typing.Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> typing.Any:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: typing.Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key, the first caller runs the
+    function and everyone else waits for, and shares, its result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: typing.Hashable, function: typing.Callable, *args) -> typing.Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def digest(*parts: typing.Any) -> str:
+    """ A stable key for JSON-able parts """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,342 @@
+"""
+A compact, read-only channel index that workers mmap instead of loading
+repodata into Python objects.
+
+Build (or rebuild, only changed subdirs are rewritten) with:
+
+    $ python -m conda_parser.compact --dir /var/lib/conda_parser defaults conda-forge
+
+Each channel url (eg: https://conda.anaconda.org/conda-forge/linux-64) gets its
+own file, made of a header followed by 8 byte aligned, native-endian columns:
+
+    string_offsets, string_data   every string once, looked up by id
+    name_strings, name_first      package names, sorted, and their first record
+    rec_*                         one entry per record, grouped by name, newest first
+    depends                       string ids, record i's are from rec_depends[i]
+                                  to rec_depends[i + 1]
+    rec_extra                     string id of the rest of the record, as json
+"""
+import argparse
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import typing
+from urllib.parse import quote
+
+from conda.api import SubdirData
+from conda.base.context import context
+from conda.models.channel import Channel
+from conda.models.match_spec import GlobStrMatch, MatchSpec
+from conda.models.records import PackageRecord
+from conda.models.version import VersionOrder, VersionSpec
+
+from . import settings
+from .cache import digest
+
+MAGIC = b"CPIDX\x00\x00\x01"
+BYTEORDER = {"little": 1, "big": 2}[sys.byteorder]
+HEADER = struct.Struct("<8sII")  # magic, byte order, signature string id
+SECTION = struct.Struct("<QQ")  # offset, length in bytes
+SECTIONS = (
+    ("string_offsets", "Q"),
+    ("string_data", "B"),
+    ("name_strings", "I"),
+    ("name_first", "I"),
+    ("rec_version", "I"),
+    ("rec_build", "I"),
+    ("rec_build_number", "I"),
+    ("rec_timestamp", "Q"),
+    ("rec_depends", "I"),
+    ("depends", "I"),
+    ("rec_extra", "I"),
+)
+COLUMNS = {"name", "version", "build", "build_number", "timestamp", "depends"}
+
+
+def write_index(path: str, records: typing.Iterable, signature: str = "") -> None:
+    """ Writes records (PackageRecords or dicts) to a compact index at `path` """
+    strings = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    by_name = {}
+    for record in records:
+        record = dict(record.dump()) if hasattr(record, "dump") else dict(record)
+        by_name.setdefault(record["name"], []).append(record)
+
+    columns = {name: array.array(typecode) for name, typecode in SECTIONS}
+    columns["rec_depends"].append(0)
+    signature_id = intern(signature)
+
+    for name in sorted(by_name, key=lambda n: n.encode("utf-8")):
+        columns["name_strings"].append(intern(name))
+        columns["name_first"].append(len(columns["rec_version"]))
+        for record in sorted(by_name[name], key=_order, reverse=True):
+            columns["rec_version"].append(intern(record["version"]))
+            columns["rec_build"].append(intern(record["build"]))
+            columns["rec_build_number"].append(record.get("build_number") or 0)
+            columns["rec_timestamp"].append(record.get("timestamp") or 0)
+            columns["depends"].extend(intern(d) for d in record.get("depends") or ())
+            columns["rec_depends"].append(len(columns["depends"]))
+            extra = {k: v for k, v in record.items() if k not in COLUMNS}
+            columns["rec_extra"].append(intern(json.dumps(extra, sort_keys=True)))
+    columns["name_first"].append(len(columns["rec_version"]))
+
+    data = bytearray()
+    for value in strings:  # dicts keep insertion order, which is the id order
+        columns["string_offsets"].append(len(data))
+        data += value.encode("utf-8")
+    columns["string_offsets"].append(len(data))
+    columns["string_data"] = array.array("B", data)
+
+    offset = _align(HEADER.size + SECTION.size * len(SECTIONS))
+    sections = []
+    for name, _ in SECTIONS:
+        sections.append((offset, len(columns[name]) * columns[name].itemsize))
+        offset = _align(offset + sections[-1][1])
+
+    # write somewhere else and swap, workers may have the old file mapped
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, BYTEORDER, signature_id))
+        for section in sections:
+            f.write(SECTION.pack(*section))
+        for (name, _), (offset, _) in zip(SECTIONS, sections):
+            f.write(b"\0" * (offset - f.tell()))
+            columns[name].tofile(f)
+    os.replace(tmp_path, path)
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _order(record: dict) -> tuple:
+    return (
+        VersionOrder(record["version"]),
+        record.get("build_number") or 0,
+        record.get("timestamp") or 0,
+    )
+
+
+class CompactIndex:
+    """ A read-only, mmap'd compact index file """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, byteorder, signature_id = HEADER.unpack_from(view)
+        if magic != MAGIC or byteorder != BYTEORDER:
+            raise ValueError(f"{path} is not a compact index for this machine")
+
+        self._columns = {}
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(view, HEADER.size + SECTION.size * i)
+            self._columns[name] = view[offset : offset + length].cast(typecode)
+        self.signature = self.string(signature_id)
+
+    def string(self, string_id: int) -> str:
+        offsets = self._columns["string_offsets"]
+        start, end = offsets[string_id], offsets[string_id + 1]
+        return str(self._columns["string_data"][start:end], "utf-8")
+
+    def _rows(self, name: str) -> range:
+        """ Binary search of the sorted names, for the rows of `name`'s records """
+        target = name.encode("utf-8")
+        names, offsets = self._columns["name_strings"], self._columns["string_offsets"]
+        data = self._columns["string_data"]
+        low, high = 0, len(names)
+        while low < high:
+            middle = (low + high) // 2
+            string_id = names[middle]
+            found = data[offsets[string_id] : offsets[string_id + 1]].tobytes()
+            if found < target:
+                low = middle + 1
+            elif found > target:
+                high = middle
+            else:
+                first = self._columns["name_first"]
+                return range(first[middle], first[middle + 1])
+        return range(0)
+
+    def record(self, name: str, row: int) -> dict:
+        columns = self._columns
+        depends = columns["depends"][
+            columns["rec_depends"][row] : columns["rec_depends"][row + 1]
+        ]
+        record = json.loads(self.string(columns["rec_extra"][row]))
+        record.update(
+            name=name,
+            version=self.string(columns["rec_version"][row]),
+            build=self.string(columns["rec_build"][row]),
+            build_number=columns["rec_build_number"][row],
+            timestamp=columns["rec_timestamp"][row],
+            depends=[self.string(d) for d in depends],
+        )
+        return record
+
+    def query(self, spec: MatchSpec) -> typing.Optional[dict]:
+        """ The newest record matching the spec, or None """
+        # the raw values are the spec's strings, make matchers of them once
+        version = spec.get_raw_value("version")
+        version = VersionSpec(version) if version is not None else None
+        build = spec.get_raw_value("build")
+        build = GlobStrMatch(build) if build is not None else None
+        exotic = any(
+            spec.get_raw_value(field) is not None
+            for field in MatchSpec.FIELD_NAMES
+            if field not in ("name", "version", "build")
+        )
+
+        columns = self._columns
+        for row in self._rows(spec.name):
+            # name, version and build are checked against the columns, only
+            # records that pass, or specs with other fields, are decoded
+            if version is not None and not version.match(
+                self.string(columns["rec_version"][row])
+            ):
+                continue
+            if build is not None and not build.match(
+                self.string(columns["rec_build"][row])
+            ):
+                continue
+            record = self.record(spec.name, row)
+            if not exotic or spec.match(PackageRecord(**record)):
+                return record
+        return None
+
+    def close(self) -> None:
+        self._columns = {}
+        self._mmap.close()
+
+
+def index_path(directory: str, url: str) -> str:
+    return os.path.join(directory, quote(url, safe="") + ".idx")
+
+
+def channel_urls(channel: str, subdirs: typing.Optional[tuple] = None) -> list:
+    subdirs = subdirs or (context.subdir, "noarch")
+    return Channel(channel).urls(with_credentials=True, subdirs=subdirs)
+
+
+class CompactChannelIndex:
+    """
+    The compact indexes for every url of a channel, with the same interface
+    as index.ChannelIndex, so it can be used in its place.
+    """
+
+    def __init__(
+        self, channel: str, subdirs: typing.Optional[tuple] = None, directory=None
+    ):
+        self.channel = channel
+        self.subdirs = subdirs
+        self.directory = directory or settings.COMPACT_INDEX_DIR
+        self.loaded_at = None
+        self.signature = None
+        self._indexes = None
+
+    def paths(self) -> list:
+        return [
+            index_path(self.directory, url)
+            for url in channel_urls(self.channel, self.subdirs)
+        ]
+
+    def exists(self) -> bool:
+        return all(os.path.exists(path) for path in self.paths())
+
+    def load(self, refresh: bool = False) -> "CompactChannelIndex":
+        # rebuilt files are swapped in, so reopening maps the new ones
+        self._indexes = [CompactIndex(path) for path in self.paths()]
+        self.loaded_at = max(os.path.getmtime(i.path) for i in self._indexes)
+        self.signature = digest([i.signature for i in self._indexes])
+        return self
+
+    def repodata_signature(self) -> str:
+        """ The hashes of the repodata the indexes were built from """
+        if self._indexes is None:
+            self.load()
+        return self.signature
+
+    def query(
+        self, spec: typing.Union[str, MatchSpec]
+    ) -> typing.Optional[PackageRecord]:
+        """ The newest record matching the spec, or None """
+        if self._indexes is None:
+            self.load()
+        spec = MatchSpec(spec)
+        found = [i.query(spec) for i in self._indexes]
+        found = [record for record in found if record is not None]
+        return PackageRecord(**max(found, key=_order)) if found else None
+
+
+def signature(subdir_data: SubdirData) -> str:
+    """ A hash of conda's cached repodata, it changes when the repodata does """
+    path = getattr(subdir_data, "cache_path_json", None)
+    if not path or not os.path.exists(path):
+        return ""
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _built_signature(path: str) -> typing.Optional[str]:
+    if not os.path.exists(path):
+        return None
+    index = CompactIndex(path)
+    try:
+        return index.signature
+    finally:
+        index.close()
+
+
+def build(
+    channel: str, directory: str, subdirs: typing.Optional[tuple] = None
+) -> typing.List[str]:
+    """
+    Writes a compact index for each of the channel's urls, skipping those whose
+    repodata hasn't changed since they were built. Returns the paths written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for url in channel_urls(channel, subdirs):
+        subdir_data = SubdirData(Channel(url)).reload()
+        path = index_path(directory, url)
+        current = signature(subdir_data)
+        if current and _built_signature(path) == current:
+            continue
+        write_index(path, subdir_data.iter_records(), current)
+        written.append(path)
+    return written
+
+
+def main(argv: typing.Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m conda_parser.compact",
+        description="Builds, or incrementally rebuilds, compact channel indexes",
+    )
+    parser.add_argument("channels", nargs="*", default=settings.PRELOAD_CHANNELS)
+    parser.add_argument("--dir", default=settings.COMPACT_INDEX_DIR, required=False)
+    parser.add_argument("--subdir", action="append", dest="subdirs")
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("--dir or CONDA_PARSER_COMPACT_INDEX_DIR is required")
+
+    subdirs = tuple(args.subdirs) if args.subdirs else None
+    for channel in args.channels:
+        for path in build(channel, args.dir, subdirs):
+            print(f"wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
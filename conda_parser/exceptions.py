@@ -1,2 +1,32 @@
+import yaml
+
+
 class MissingParameters(Exception):
     pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class SolveFailed(Exception):
+    pass
+
+
+class UnknownLockfile(Exception):
+    """ A previous lockfile digest that isn't in LOCKFILES """
+
+
+class InvalidLockfile(Exception):
+    """ A previous lockfile that isn't a list of name/requirement objects """
+
+
+class EnvironmentFileError(yaml.YAMLError):
+    """ An environment file that's too big, or isn't shaped like one """
+
+
+class PackageNotFound(Exception):
+    """
+    Specs no channel has a package for, in place of conda's
+    ResolvePackageNotFound so catching it doesn't need conda imported
+    """
@@ -0,0 +1,322 @@
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import typing
+
+from conda.api import Solver
+from conda.exceptions import ResolvePackageNotFound, UnsatisfiableError
+
+from . import settings
+from .exceptions import PackageNotFound, SolveFailed
+from .index import get_index
+
+
+def solve_final_state(
+    prefix: str,
+    channels: list,
+    specs: list,
+    subdir: typing.Optional[str] = None,
+    pins: typing.Sequence[str] = (),
+) -> list:
+    """
+    Solves the specs with conda, for `subdir` rather than this platform if
+    it's set, returns every record in the final state as a dict. Packages in
+    the solve are kept to `pins` if they can be, otherwise it's solved again
+    without them. Raises PackageNotFound for specs no channel has.
+    """
+    subdirs = (subdir, "noarch") if subdir else ()
+    try:
+        if pins:
+            try:
+                return _solve_pinned(channels, specs, subdirs, pins)
+            except UnsatisfiableError:
+                pass  # the specs need some of the pinned packages to change
+
+        solver = Solver(prefix, channels, subdirs=subdirs, specs_to_add=specs)
+        return _dump(solver.solve_final_state())
+    except ResolvePackageNotFound as e:
+        raise PackageNotFound(str(e)) from e
+
+
+def _solve_pinned(channels: list, specs: list, subdirs: tuple, pins) -> list:
+    # conda reads pins from a prefix's conda-meta/pinned, they only constrain
+    # the packages the specs need, they don't add any
+    with tempfile.TemporaryDirectory(prefix="conda-parser-") as prefix:
+        os.mkdir(os.path.join(prefix, "conda-meta"))
+        with open(os.path.join(prefix, "conda-meta", "pinned"), "w") as f:
+            f.writelines(f"{pin}\n" for pin in pins)
+        solver = Solver(prefix, channels, subdirs=subdirs, specs_to_add=specs)
+        return _dump(solver.solve_final_state())
+
+
+def _dump(records) -> list:
+    return [dict(r.dump()) if hasattr(r, "dump") else dict(r) for r in records]
+
+
+class InProcessSolverExecutor:
+    """ Solves in the calling thread """
+
+    def solve(
+        self,
+        prefix: str,
+        channels: list,
+        specs: list,
+        subdir: typing.Optional[str] = None,
+        pins: typing.Sequence[str] = (),
+    ) -> list:
+        return solve_final_state(prefix, channels, specs, subdir, pins)
+
+
+class ProcessSolverExecutor:
+    """
+    Solves on a pool of long running processes, each with repodata for
+    `warm_channels` already loaded, so solves use every core and don't hold
+    the GIL of the web worker. A solve that takes longer than `timeout`
+    seconds, or dies (eg: going over `memory_limit` bytes), kills its process,
+    which is replaced with a fresh one, and raises SolveFailed. The processes
+    get `environ` on top of this one's, and CONDA_OVERRIDE_CUDA is set to ""
+    for them unless it's set already, as conda detects CUDA with a child
+    process, which they can't start.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        timeout: float,
+        memory_limit: int = 0,
+        warm_channels: typing.Sequence[str] = (),
+        function: typing.Callable = solve_final_state,
+        environ: typing.Optional[dict] = None,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.warm_channels = tuple(warm_channels)
+        self.function = function
+        self.environ = {
+            "CONDA_OVERRIDE_CUDA": os.environ.get("CONDA_OVERRIDE_CUDA", ""),
+            **(environ or {}),
+        }
+        self.replaced = 0
+        self._idle = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> queue.Queue:
+        # processes can't be shared across a fork, so start them per process
+        with self._lock:
+            if self._idle is None or self._pid != os.getpid():
+                self._idle = queue.Queue()
+                for _ in range(self.workers):
+                    self._idle.put(self._start())
+                self._pid = os.getpid()
+        return self._idle
+
+    def _start(self) -> "_Worker":
+        return _Worker(
+            self.function, self.memory_limit, self.warm_channels, self.environ
+        )
+
+    def solve(
+        self,
+        prefix: str,
+        channels: list,
+        specs: list,
+        subdir: typing.Optional[str] = None,
+        pins: typing.Sequence[str] = (),
+    ) -> list:
+        return self.call(prefix, channels, specs, subdir, list(pins))
+
+    def call(self, *args) -> typing.Any:
+        timeout = self.timeout
+        if _deadline is not None:
+            timeout = min(timeout, _deadline - time.time())
+            if timeout <= 0:
+                raise SolveFailed("Solve timed out before it started")
+
+        idle = self._pool()
+        worker = idle.get()  # waits for a free process
+        try:
+            return worker.call(timeout, *args)
+        except _WorkerLost:
+            worker.kill()
+            worker = self._start()
+            self.replaced += 1
+            raise
+        finally:
+            idle.put(worker)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._idle is not None and self._pid == os.getpid():
+                while not self._idle.empty():
+                    self._idle.get().kill()
+            self._idle = None
+
+
+class _WorkerLost(SolveFailed):
+    """ The process timed out or died, and needs to be replaced """
+
+
+class _Worker:
+    def __init__(self, function, memory_limit, warm_channels, environ):
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child, function, memory_limit, warm_channels, environ),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+
+    def call(self, timeout: float, *args) -> typing.Any:
+        try:
+            self.connection.send(args)
+            if not self.connection.poll(timeout):
+                raise _WorkerLost(f"Solve timed out after {timeout:g} seconds")
+            status, value = self.connection.recv()
+        except (EOFError, OSError):
+            raise _WorkerLost("Solver process died")
+
+        if status == "ok":
+            return value
+        elif status == "not_found":
+            raise PackageNotFound(value)
+        elif status == "fatal":
+            raise _WorkerLost(value)
+        raise SolveFailed(value)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _worker_main(connection, function, memory_limit, warm_channels, environ):
+    if memory_limit:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    if environ:
+        from conda.base.context import reset_context
+
+        # conda's context is read from the environment, once for the process
+        os.environ.update(environ)
+        reset_context()
+
+    for channel in warm_channels:
+        try:
+            get_index(channel).load()
+        except Exception:
+            pass  # it'll be loaded, or fail properly, on the first solve
+
+    while True:
+        try:
+            args = connection.recv()
+        except EOFError:
+            return  # the web worker went away
+
+        try:
+            connection.send(("ok", function(*args)))
+        except PackageNotFound as e:
+            connection.send(("not_found", str(e)))
+        except MemoryError:
+            connection.send(("fatal", "Solve ran out of memory"))
+            return
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+
+
+_executor = None
+_platform_executors = {}
+_executor_lock = threading.Lock()
+
+# the time.time() solves on solver processes have to finish by, eg: a job's
+_deadline = None
+
+
+def get_executor():
+    """ The executor set by CONDA_PARSER_SOLVER_EXECUTOR, created on first use """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if settings.SOLVER_EXECUTOR == "process":
+                _executor = ProcessSolverExecutor(
+                    settings.SOLVER_WORKERS,
+                    settings.SOLVER_TIMEOUT,
+                    settings.SOLVER_MEMORY_LIMIT * 1024 * 1024,
+                    settings.SOLVER_WARM_CHANNELS,
+                )
+            else:
+                _executor = InProcessSolverExecutor()
+        return _executor
+
+
+def set_executor(executor) -> None:
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+def set_deadline(deadline: typing.Optional[float]) -> None:
+    """
+    Solves on solver processes in this process, from now on, are killed at
+    `deadline` if they haven't finished, or None for just their timeout
+    """
+    global _deadline
+    _deadline = deadline
+
+
+def get_platform_executor(subdir: str) -> ProcessSolverExecutor:
+    """
+    Solves for another platform than this one, on processes whose conda
+    context is that platform's, so the solves get its virtual packages, eg:
+    __osx for osx-64, rather than this machine's. The context is global to a
+    process, so it can't be changed for one solve, or solves on other threads.
+    """
+    with _executor_lock:
+        executor = _platform_executors.get(subdir)
+        if executor is None:
+            executor = _platform_executors[subdir] = ProcessSolverExecutor(
+                settings.SOLVER_PLATFORM_WORKERS,
+                settings.SOLVER_TIMEOUT,
+                settings.SOLVER_MEMORY_LIMIT * 1024 * 1024,
+                environ=platform_environ(subdir),
+            )
+        return executor
+
+
+def shutdown_platform_executors() -> None:
+    """ Stops the platforms' processes, eg: once conda is pointed elsewhere """
+    with _executor_lock:
+        for executor in _platform_executors.values():
+            executor.shutdown()
+        _platform_executors.clear()
+
+
+def platform_environ(subdir: str) -> dict:
+    """
+    The environment variables conda solves as `subdir` with. conda only
+    detects virtual package versions for the platform it runs on, so the
+    others' are overridden, unless CONDA_OVERRIDE_* is set already.
+    """
+    environ = {"CONDA_SUBDIR": subdir}
+    system = subdir.split("-", 1)[0]
+    for name, version in settings.SOLVER_VIRTUAL_PACKAGES.get(system, {}).items():
+        variable = f"CONDA_OVERRIDE_{name.upper()}"
+        environ[variable] = os.environ.get(variable, version)
+    return environ
+
+
+def get_subdir_executor(subdir: typing.Optional[str] = None):
+    """ The executor to solve for subdir with, get_executor's for this platform """
+    from conda.base.context import context
+
+    if subdir and subdir != context.subdir:
+        return get_platform_executor(subdir)
+    return get_executor()
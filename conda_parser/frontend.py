@@ -0,0 +1,277 @@
+"""
+An ASGI front end for the Flask app, for running under an asyncio server:
+
+    $ gunicorn -k uvicorn.workers.UvicornWorker conda_parser.asgi:app
+
+Requests are read, and answered, on the event loop, and handled by the Flask
+app on a thread pool. Bodies over MAX_CONTENT_LENGTH are answered 413 as soon
+as they're past it, without reading the rest. Requests that can run the
+solver, eg: /parse of a lockfile or with force_solve, and /package?solve=1,
+are limited to ASGI_SOLVE_CONCURRENCY at once, with ASGI_SOLVE_QUEUE more
+waiting, past that they're answered 429 with a Retry-After straight away.
+Everything else is limited to ASGI_CONCURRENCY at once, so a burst of solves
+can't hold up health checks and manifest-only parses, and the other way around.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import json
+import sys
+import typing
+
+from werkzeug.wrappers import Request
+
+from . import metrics, settings
+from .parse import needs_solve
+
+# the requests that are solves, going by the same rules the Flask app uses
+SOLVE_PATHS = ("/parse", "/parse/batch", "/package")
+
+
+class Limit:
+    """ At most `concurrency` requests at once, with at most `queue` waiting """
+
+    def __init__(self, concurrency: int, queue: typing.Optional[int] = None):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.active = 0  # running and waiting
+        self._semaphore = None
+
+    def full(self) -> bool:
+        return self.queue is not None and self.active >= self.concurrency + self.queue
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> typing.AsyncIterator[None]:
+        # made on first use, so it's made in the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.active += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self.active -= 1
+
+
+class ASGIApp:
+    """ Runs a WSGI app on a thread pool, with separate limits for solves """
+
+    def __init__(
+        self,
+        wsgi_app: typing.Callable,
+        concurrency: int = settings.ASGI_CONCURRENCY,
+        solve_concurrency: int = settings.ASGI_SOLVE_CONCURRENCY,
+        solve_queue: int = settings.ASGI_SOLVE_QUEUE,
+        retry_after: int = settings.ASGI_RETRY_AFTER,
+        max_content_length: int = settings.MAX_CONTENT_LENGTH,
+    ):
+        self.wsgi_app = wsgi_app
+        self.max_content_length = max_content_length
+        self.limits = {
+            "cheap": Limit(concurrency),
+            "solve": Limit(solve_concurrency, solve_queue),
+        }
+        self.retry_after = retry_after
+        # enough threads for both limits to be used up at once
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            concurrency + solve_concurrency, thread_name_prefix="conda-parser-asgi"
+        )
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        body = await read_body(scope, receive, self.max_content_length)
+        if body is None:
+            text = f"Error: Requests can be at most {self.max_content_length} bytes"
+            await self.error(send, 413, text)
+            return
+
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, body)
+        # the form is parsed on the loop's default executor, so a big one
+        # doesn't hold up the loop, or wait for a thread of our own
+        solve = environ["PATH_INFO"] in SOLVE_PATHS and await loop.run_in_executor(
+            None, is_solve, environ
+        )
+        limit = self.limits["solve" if solve else "cheap"]
+        if limit.full():
+            metrics.inc("conda_parser_shed_requests_total", path=scope["path"])
+            text = "Error: Too many solves are queued, please try again later"
+            retry_after = [(b"retry-after", str(self.retry_after).encode())]
+            await self.error(send, 429, text, retry_after)
+            return
+
+        async with limit.slot():
+            await loop.run_in_executor(
+                self.executor, self.run_wsgi, loop, environ, send
+            )
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def error(self, send, status: int, text: str, headers=()) -> None:
+        """ Answers with the Flask app's error json, straight from the loop """
+        body = json.dumps({"error": status, "text": text}).encode()
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ]
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def run_wsgi(self, loop, environ: dict, send) -> None:
+        """ Calls the WSGI app in this thread, sending what it returns as it comes """
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+
+        def send_now(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def send_start():
+            message = dict(type="http.response.start", **started)
+            send_now(message)
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            sent_start = False
+            # streamed responses, eg: ndjson, are sent a chunk at a time
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not sent_start:
+                    send_start()
+                    sent_start = True
+                send_now(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            if not sent_start:
+                send_start()
+            send_now({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+async def read_body(scope: dict, receive, max_length: int) -> typing.Optional[bytes]:
+    """ The request's body, or None as soon as it's over `max_length` bytes """
+    for name, value in scope["headers"]:
+        if name.lower() == b"content-length" and value.isdigit():
+            if int(value) > max_length:
+                return None
+    chunks = []
+    length = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        length += len(chunk)
+        if length > max_length:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """ The WSGI environ of an ASGI http request """
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            continue
+        if name != "CONTENT_TYPE":
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def is_solve(environ: dict) -> bool:
+    """ Whether the request can run the solver, see the /parse docs in app.py """
+    if environ["PATH_INFO"] not in SOLVE_PATHS:
+        return False
+
+    request = Request(environ, populate_request=False)
+    try:
+        if environ["PATH_INFO"] == "/package":
+            return bool(request.args.get("solve"))
+        if request.args.get("async"):
+            return False  # it's solved by a job process
+
+        force_solve = bool(request.args.get("force_solve"))
+        platforms = [p for p in request.args.getlist("platforms") if p.strip()]
+        if environ["PATH_INFO"] == "/parse/batch":
+            return any(
+                needs_solve(filename, force_solve, platforms)
+                for filename in batch_filenames(request)
+            )
+
+        previous = request.args.get("previous") or request.form.get("previous_lockfile")
+        if request.files.get("file") is not None:
+            filename = request.files["file"].filename
+        else:
+            filename = request.form.get("filename")
+        return needs_solve(filename, force_solve, platforms, previous)
+    finally:
+        # the form was read from it, the Flask app reads it again
+        environ["wsgi.input"].seek(0)
+
+
+def batch_filenames(request: Request) -> list:
+    if request.is_json:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return []
+        return [
+            item.get("filename")
+            for item in items
+            if isinstance(item, dict) and isinstance(item.get("filename"), str)
+        ]
+    return [f.filename for f in request.files.getlist("file")]
+
+
+def create_asgi_app(wsgi_app: typing.Optional[typing.Callable] = None) -> ASGIApp:
+    if wsgi_app is None:
+        from .app import create_app
+
+        wsgi_app = create_app()
+    return ASGIApp(wsgi_app)
@@ -0,0 +1,225 @@
+import collections
+import logging
+import threading
+import time
+import typing
+
+from . import metrics, settings
+
+if typing.TYPE_CHECKING:
+    from conda.models.match_spec import MatchSpec
+    from conda.models.records import PackageRecord
+
+log = logging.getLogger(__name__)
+
+
+class ChannelIndex:
+    """
+    Every package record in a channel, looked up by name, newest first.
+    Finding the best record for a spec is a dictionary lookup and a scan of
+    that name's records, rather than a solve of its whole dependency tree.
+    """
+
+    def __init__(self, channel: str, subdirs: typing.Optional[tuple] = None):
+        from conda.base.context import context
+
+        self.channel = channel
+        self.subdirs = subdirs or (context.subdir, "noarch")
+        self.loaded_at = None
+        self.signature = None
+        self._names = None
+        self._lock = threading.Lock()
+
+    def _load_records(self, refresh: bool = False) -> typing.Iterator["PackageRecord"]:
+        from conda.api import SubdirData
+        from conda.models.channel import Channel
+
+        urls = Channel(self.channel).urls(with_credentials=True, subdirs=self.subdirs)
+        for url in urls:
+            # conda keeps one SubdirData per url for the life of the process,
+            # which the Solver shares, so reloading it refreshes solves too
+            subdir_data = SubdirData(Channel(url))
+            if refresh:
+                subdir_data.reload()
+            yield from subdir_data.iter_records()
+
+    def load(self, refresh: bool = False) -> "ChannelIndex":
+        from conda.models.version import VersionOrder
+
+        def order(record: "PackageRecord") -> tuple:
+            return (
+                VersionOrder(record.version),
+                record.build_number,
+                record.get("timestamp", 0) or 0,
+            )
+
+        names = collections.defaultdict(list)
+        count = newest = 0
+        with metrics.stage("load_repodata"):
+            for record in self._load_records(refresh):
+                names[record.name].append(record)
+                count += 1
+                newest = max(newest, record.get("timestamp", 0) or 0)
+            for records in names.values():
+                records.sort(key=order, reverse=True)
+        self._names = dict(names)
+        self.loaded_at = time.time()
+        # packages are added with a newer timestamp, or removed
+        self.signature = f"{count}:{newest}"
+        return self
+
+    def _loaded(self) -> None:
+        if self._names is None:
+            with self._lock:
+                if self._names is None:
+                    self.load()
+
+    def records(self, name: str) -> list:
+        self._loaded()
+        return self._names.get(name, [])
+
+    def repodata_signature(self) -> str:
+        """
+        Which repodata is loaded, the same in every process that's loaded the
+        same repodata, however long ago, it changes when the repodata does
+        """
+        self._loaded()
+        return self.signature
+
+    def query(
+        self, spec: typing.Union[str, "MatchSpec"]
+    ) -> typing.Optional["PackageRecord"]:
+        """ The newest record matching the spec, or None """
+        from conda.models.match_spec import MatchSpec
+
+        spec = MatchSpec(spec)
+        return next((r for r in self.records(spec.name) if spec.match(r)), None)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def new_index(channel: str, subdirs: typing.Optional[tuple] = None):
+    """ The channel's compact index if one's been built, otherwise a ChannelIndex """
+    if settings.COMPACT_INDEX_DIR:
+        from .compact import CompactChannelIndex
+
+        compact = CompactChannelIndex(channel, subdirs)
+        if compact.exists():
+            return compact
+    return ChannelIndex(channel, subdirs)
+
+
+def get_index(channel: str, subdirs: typing.Optional[tuple] = None):
+    """ One index per channel and subdirs for each worker, loaded on first use """
+    key = (channel, subdirs)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = new_index(channel, subdirs)
+        return _indexes[key]
+
+
+def clear_indexes() -> None:
+    global _preloaded_at
+    with _indexes_lock:
+        _indexes.clear()
+        _preloaded_at = None
+
+
+_preloaded_at = None
+
+
+def preload(
+    channels: typing.Sequence[str] = settings.PRELOAD_CHANNELS, refresh: bool = False
+) -> None:
+    """
+    Loads each channel's index, or with `refresh` downloads fresh repodata for
+    it, then swaps it in, so lookups never see a half loaded index. Run in the
+    gunicorn master before forking, workers share the loaded repodata.
+    """
+    global _preloaded_at
+    for channel in channels:
+        index = new_index(channel).load(refresh)
+        with _indexes_lock:
+            _indexes[(channel, None)] = index
+    _preloaded_at = time.time()
+
+
+def preloaded_at() -> typing.Optional[float]:
+    """ When the preloaded repodata was last loaded or refreshed """
+    return _preloaded_at
+
+
+def ready() -> dict:
+    """ Which of the preload channels are loaded, and when """
+    with _indexes_lock:
+        indexes = {
+            channel: _indexes.get((channel, None))
+            for channel in settings.PRELOAD_CHANNELS
+        }
+    return {
+        channel: index.loaded_at if index is not None else None
+        for channel, index in indexes.items()
+    }
+
+
+class RepodataRefresher(threading.Thread):
+    """
+    Refreshes the preloaded repodata every `interval` seconds, 0 for never.
+    Until every channel has loaded, eg: the master couldn't download one,
+    it tries again every `retry` seconds instead, 0 to wait for `interval`.
+    """
+
+    def __init__(
+        self, interval: float, channels: typing.Sequence[str], retry: float = 0
+    ):
+        super().__init__(name="repodata-refresher", daemon=True)
+        self.interval = interval
+        self.channels = channels
+        self.retry = retry
+        self._stopped = threading.Event()
+
+    def wait(self) -> float:
+        """ Seconds until the next refresh, 0 for no more refreshes """
+        if self.retry and not loaded(self.channels):
+            return self.retry
+        return self.interval
+
+    def run(self) -> None:
+        while True:
+            wait = self.wait()
+            if not wait or self._stopped.wait(wait):
+                return
+            try:
+                preload(self.channels, refresh=True)
+            except Exception:
+                log.exception("Refreshing repodata failed, keeping the old repodata")
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def loaded(channels: typing.Sequence[str]) -> bool:
+    """ Whether every one of the channels' repodata has loaded """
+    with _indexes_lock:
+        indexes = [_indexes.get((channel, None)) for channel in channels]
+    # get_index adds an index before loading it, which can then fail
+    return all(index is not None and index.loaded_at for index in indexes)
+
+
+def start_refresher(retry: bool = False) -> typing.Optional[RepodataRefresher]:
+    """
+    Threads don't survive a fork, so this is run in each worker. With
+    `retry`, channels the master failed to preload are tried again every
+    REPODATA_RETRY seconds until they load.
+    """
+    refresher = RepodataRefresher(
+        settings.REPODATA_REFRESH,
+        settings.PRELOAD_CHANNELS,
+        settings.REPODATA_RETRY if retry else 0,
+    )
+    if not refresher.wait():
+        return None
+    refresher.start()
+    return refresher
@@ -1,19 +1,62 @@
-from conda.api import Solver
 from urllib.parse import unquote
 
+from . import metrics, mirror, profiling, settings
+from .cache import LRUCache, SingleFlight
+from .exceptions import PackageNotFound
 
-def package_info(channel: str, name: str, version: str) -> dict:
-    channel, name, version = unquote_params(channel, name, version)
+# package records, keyed on the unquoted (channel, name, version) and whether
+# they were solved for, a solve's record can differ from the index's
+PACKAGE_CACHE = LRUCache(settings.PACKAGE_CACHE_SIZE, ttl=settings.PACKAGE_CACHE_TTL)
+PACKAGE_LOOKUPS = SingleFlight()
 
+
+def package_info(channel: str, name: str, version: str, solve: bool = False) -> dict:
+    """
+    The record for a package, looked up in the channel's index, or when
+    `solve` is set, by solving for the package with conda.
+    """
+    key = (*unquote_params(channel, name, version), bool(solve))
+
+    record = PACKAGE_CACHE.get(key)
+    metrics.cache_lookup("package", record is not None)
+    if record is None:
+        # concurrent requests for the same package wait on a single lookup
+        with metrics.stage("package_info_solve" if solve else "package_info"):
+            record = PACKAGE_LOOKUPS.do(key, _cached_package_info, *key)
+    return dict(record)
+
+
+def _cached_package_info(channel: str, name: str, version: str, solve: bool) -> dict:
+    record = _package_info(channel, name, version, solve)
+    PACKAGE_CACHE.set((channel, name, version, solve), record)
+    return record
+
+
+def _package_info(channel: str, name: str, version: str, solve: bool) -> dict:
+    # with a mirror the record's urls are file:// ones, send the upstream's
+    return mirror.upstream_record(_find_package(channel, name, version, solve))
+
+
+def _find_package(channel: str, name: str, version: str, solve: bool) -> dict:
     # join the name and version together with equals if it's provided
     spec = "==".join([name, version]) if version else name
+    profiling.annotate(specs=[spec], channels=[channel])
+
+    from .executor import get_executor
+    from .index import get_index
+
+    if not solve:
+        record = get_index(channel).query(spec)
+        if record is None:
+            metrics.inc("conda_parser_not_found_total", stage="package_info")
+            raise PackageNotFound(f"\n  - {spec}")
+        return dict(record.dump())
 
     # solve the spec for this package.
-    packages = Solver(".", [channel], specs_to_add=[spec]).solve_final_state()
+    packages = get_executor().solve(".", [channel], [spec])
 
     # find the package passed in, it will be there, as Solver rasies if not found
-    first_package_record = [dep for dep in packages if dep.name == name][0]
-    return dict(first_package_record.dump())
+    return [dep for dep in packages if dep["name"] == name][0]
 
 
 def unquote_params(*args: str) -> list:
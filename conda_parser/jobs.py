@@ -0,0 +1,169 @@
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import threading
+import time
+import typing
+import uuid
+
+from . import settings
+from .cache import LRUCache, SQLiteCache
+from .exceptions import PackageNotFound, QueueFull
+from .parse import parse_environment
+
+
+class JobQueue:
+    """
+    Runs parse_environment on a pool of processes, so long solves don't tie up
+    the web workers. Each job gets an ID, and its status, then its result,
+    are kept in `store`. When that's backed by the shared SQLite file any
+    gunicorn worker can answer a poll for any job.
+
+    A job still waiting at `timeout` is cancelled, and a running one has its
+    solve killed, see set_deadline. Either way it's failed straight away, but
+    a running one counts towards `max_queued` until its process is free.
+
+    A job's status is one of:
+        {"id": id, "status": "pending"}
+        {"id": id, "status": "done", "result": parse_environment result}
+        {"id": id, "status": "failed", "error": "message"}
+    """
+
+    def __init__(self, workers: int, max_queued: int, timeout: float, store):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.store = store
+        self._pending = {}  # job id -> (future, submitted at)
+        self._expired = {}  # job id -> future, timed out but still running
+        self._executor = None
+        self._pid = None
+        self._lock = threading.RLock()
+
+    def _pool(self) -> concurrent.futures.Executor:
+        # pools can't be shared across a fork, so start one per process
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start_job_process,
+                initargs=(self.timeout,),
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(
+        self,
+        filename: str,
+        environment_file,
+        force_solve: bool,
+        platforms: typing.Optional[typing.Sequence[str]] = None,
+        previous: typing.Optional[list] = None,
+        graph: bool = False,
+    ) -> str:
+        with self._lock:
+            self._expire()
+            if self.queued() >= self.max_queued:
+                raise QueueFull
+
+            job_id = uuid.uuid4().hex
+            self.store.set(job_id, {"id": job_id, "status": "pending"})
+            future = self._pool().submit(
+                _run,
+                filename,
+                environment_file,
+                force_solve,
+                platforms,
+                previous,
+                graph,
+                time.time() + self.timeout,
+            )
+            self._pending[job_id] = (future, time.monotonic())
+
+        future.add_done_callback(functools.partial(self._finished, job_id))
+        return job_id
+
+    def status(self, job_id: str) -> typing.Optional[dict]:
+        with self._lock:
+            self._expire()
+        return self.store.get(job_id)
+
+    def queued(self) -> int:
+        return len(self._pending) + len(self._expired)
+
+    def _finished(self, job_id: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            # jobs that timed out have already been marked as failed
+            self._expired.pop(job_id, None)
+            if self._pending.pop(job_id, None) is None:
+                return
+
+        try:
+            status = {"id": job_id, "status": "done", "result": future.result()}
+        except Exception as e:
+            status = {"id": job_id, "status": "failed", "error": str(e)}
+        self.store.set(job_id, status)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for job_id, (future, submitted) in list(self._pending.items()):
+            if now - submitted > self.timeout:
+                # cancelling runs _finished right away, in this thread, so
+                # the job has to be gone from _pending, and the lock reentrant
+                del self._pending[job_id]
+                if not future.cancel():
+                    # it's running, its solve is killed at the same deadline
+                    self._expired[job_id] = future
+                error = f"Timed out after {self.timeout} seconds"
+                self.store.set(
+                    job_id, {"id": job_id, "status": "failed", "error": error}
+                )
+
+
+def _start_job_process(timeout: float) -> None:
+    # solves run on a process of their own, so one running past its job's
+    # deadline can be killed, freeing this process for the next job
+    from .executor import ProcessSolverExecutor, set_executor
+
+    set_executor(
+        ProcessSolverExecutor(
+            1,
+            timeout,
+            settings.SOLVER_MEMORY_LIMIT * 1024 * 1024,
+            settings.SOLVER_WARM_CHANNELS,
+        )
+    )
+
+
+def _run(
+    filename: str,
+    environment_file,
+    force_solve: bool,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    previous: typing.Optional[list] = None,
+    graph: bool = False,
+    deadline: typing.Optional[float] = None,
+) -> dict:
+    from .executor import set_deadline
+
+    set_deadline(deadline)
+    try:
+        return parse_environment(
+            filename, environment_file, force_solve, platforms, previous, graph
+        )
+    except PackageNotFound as e:
+        return {"error": f"Package(s) not found: {e}"}
+    finally:
+        set_deadline(None)
+
+
+# statuses change, so jobs are only kept in one place, the shared file if it's set
+JOBS = JobQueue(
+    settings.JOB_WORKERS,
+    settings.JOB_QUEUE_DEPTH,
+    settings.JOB_TIMEOUT,
+    SQLiteCache(settings.SOLVE_CACHE_PATH, settings.JOB_STORE_SIZE, table="jobs")
+    if settings.SOLVE_CACHE_PATH
+    else LRUCache(settings.JOB_STORE_SIZE),
+)
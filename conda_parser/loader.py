@@ -0,0 +1,186 @@
+"""
+A restricted loader for environment files. It works from yaml's event stream,
+so only the top level keys that are asked for are built, everything else is
+skipped over without making nodes or python objects for it, and values are
+built with the SafeConstructor.
+"""
+import typing
+
+import yaml
+from yaml import CSafeLoader
+from yaml.constructor import SafeConstructor
+from yaml.nodes import MappingNode, ScalarNode, SequenceNode
+from yaml.resolver import Resolver
+
+from . import settings
+from .exceptions import EnvironmentFileError
+
+MERGE_TAG = "tag:yaml.org,2002:merge"
+MAP_TAG = "tag:yaml.org,2002:map"
+
+
+def load_environment(
+    environment_file: typing.Union[str, bytes, typing.IO],
+    keys: typing.Container[str],
+    max_size: int = settings.MAX_FILE_SIZE,
+    max_nodes: int = settings.MAX_YAML_NODES,
+    max_depth: int = settings.MAX_YAML_DEPTH,
+) -> dict:
+    """
+    Loads the `keys` of an environment file's top level mapping, raises
+    EnvironmentFileError (a yaml.YAMLError) when the file isn't text, is over
+    `max_size` bytes, isn't a mapping, nests more than `max_depth` deep, or
+    its kept values have more than `max_nodes` nodes once aliases are expanded.
+    """
+    if hasattr(environment_file, "read"):
+        environment_file = environment_file.read(max_size + 1)
+    if isinstance(environment_file, str):
+        size = len(environment_file.encode("utf-8", "surrogatepass"))
+    elif isinstance(environment_file, bytes):
+        size = len(environment_file)
+    else:
+        raise EnvironmentFileError(
+            f"environment file must be text, not {type(environment_file).__name__}"
+        )
+    if size > max_size:
+        raise EnvironmentFileError(f"environment file is over {max_size} bytes")
+
+    events = yaml.parse(environment_file, Loader=CSafeLoader)
+    return _Composer(events, max_nodes, max_depth).load(keys)
+
+
+class _Composer:
+    """ yaml's Composer, for one document, with limits and skipping """
+
+    def __init__(self, events: typing.Iterator, max_nodes: int, max_depth: int):
+        self.events = events
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.nodes = 0
+        self.anchors = {}
+        self.resolver = Resolver()
+
+    def load(self, keys: typing.Container[str]) -> dict:
+        next(self.events)  # StreamStartEvent
+        if isinstance(next(self.events), yaml.StreamEndEvent):
+            raise EnvironmentFileError("environment file is empty")
+
+        event = next(self.events)
+        if not isinstance(event, yaml.MappingStartEvent):
+            raise EnvironmentFileError(
+                "environment file must be a mapping of keys, like `dependencies:`"
+            )
+
+        environment = {}
+        merged = {}
+        constructor = SafeConstructor()
+        for event in self.events:
+            if isinstance(event, yaml.MappingEndEvent):
+                break
+            key = self.compose(event, 1)
+            value = next(self.events)
+            if isinstance(key, ScalarNode) and key.tag == MERGE_TAG:
+                # `<<: *base`, the constructor merges it the way yaml.load would
+                node = MappingNode(MAP_TAG, [(key, self.compose(value, 1))])
+                node.start_mark = key.start_mark
+                for name, item in constructor.construct_document(node).items():
+                    if name in keys:
+                        merged.setdefault(name, item)
+            elif isinstance(key, ScalarNode) and key.value in keys:
+                node = self.compose(value, 1)
+                environment[key.value] = constructor.construct_document(node)
+            else:
+                self.skip(value, 1)
+
+        next(self.events)  # DocumentEndEvent
+        event = next(self.events)
+        if not isinstance(event, yaml.StreamEndEvent):
+            raise EnvironmentFileError(
+                "environment file must be a single document, found another "
+                f"on line {event.start_mark.line + 1}"
+            )
+        # keys given in the file win over merged ones, wherever the merge is
+        return {**merged, **environment}
+
+    def _count(self, nodes: int) -> None:
+        self.nodes += nodes
+        if self.nodes > self.max_nodes:
+            raise EnvironmentFileError(
+                f"environment file has more than {self.max_nodes} values"
+            )
+
+    def _check_depth(self, event: yaml.Event, depth: int) -> None:
+        if depth > self.max_depth:
+            raise EnvironmentFileError(
+                f"environment file nests more than {self.max_depth} deep, "
+                f"on line {event.start_mark.line + 1}"
+            )
+
+    def compose(self, event: yaml.Event, depth: int) -> yaml.Node:
+        self._check_depth(event, depth)
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in self.anchors:
+                raise EnvironmentFileError(
+                    f"found undefined alias {event.anchor!r}, "
+                    f"on line {event.start_mark.line + 1}"
+                )
+            node, nodes = self.anchors[event.anchor]
+            self._count(nodes)  # the alias expands to a copy of everything in it
+            return node
+
+        start = self.nodes
+        self._count(1)
+        if isinstance(event, yaml.ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == "!":
+                tag = self.resolver.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(
+                tag, event.value, event.start_mark, event.end_mark, style=event.style
+            )
+        elif isinstance(event, yaml.SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == "!":
+                tag = self.resolver.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(
+                tag, [], event.start_mark, None, flow_style=event.flow_style
+            )
+            for item in self.events:
+                if isinstance(item, yaml.SequenceEndEvent):
+                    node.end_mark = item.end_mark
+                    break
+                node.value.append(self.compose(item, depth + 1))
+        elif isinstance(event, yaml.MappingStartEvent):
+            tag = event.tag
+            if tag is None or tag == "!":
+                tag = self.resolver.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(
+                tag, [], event.start_mark, None, flow_style=event.flow_style
+            )
+            for key in self.events:
+                if isinstance(key, yaml.MappingEndEvent):
+                    node.end_mark = key.end_mark
+                    break
+                pair = (
+                    self.compose(key, depth + 1),
+                    self.compose(next(self.events), depth + 1),
+                )
+                node.value.append(pair)
+        else:
+            raise EnvironmentFileError(f"unexpected {type(event).__name__}")
+
+        if event.anchor is not None:
+            self.anchors[event.anchor] = (node, self.nodes - start)
+        return node
+
+    def skip(self, event: yaml.Event, depth: int) -> None:
+        """ Consumes a value without building it, unless an alias could use it """
+        self._check_depth(event, depth)
+        if isinstance(event, yaml.AliasEvent):
+            return
+        if event.anchor is not None:
+            self.compose(event, depth)
+        elif isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            for item in self.events:
+                if isinstance(item, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+                    return
+                self.skip(item, depth + 1)
@@ -0,0 +1,275 @@
+"""
+Counters and latency histograms, rendered in Prometheus' text format at
+/metrics. Each gunicorn worker keeps its own, and with METRICS_DIR set writes
+them to <METRICS_DIR>/<pid>.json every METRICS_FLUSH seconds, so any worker
+can answer a scrape with every worker's metrics added together. Files of
+workers that have exited are kept, so counters never go backwards.
+"""
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+import typing
+
+from . import settings
+
+# seconds, solves can take minutes
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    1800.0,
+    float("inf"),
+)
+
+# name: (type, help), everything recorded has to be described here
+METRICS = {
+    "conda_parser_requests_total": ("counter", "HTTP requests by endpoint and status"),
+    "conda_parser_request_seconds": ("histogram", "HTTP request latency by endpoint"),
+    "conda_parser_stage_seconds": (
+        "histogram",
+        "Time spent in each stage of parsing, solving and package lookups",
+    ),
+    "conda_parser_bad_specs_total": (
+        "counter",
+        "Specs left out of solves as no channel has a package for them",
+    ),
+    "conda_parser_not_found_total": (
+        "counter",
+        "Solves and package lookups of packages no channel has",
+    ),
+    "conda_parser_incremental_solves_total": (
+        "counter",
+        "Solves from a previous lockfile, by whether it was reused or a pinned solve",
+    ),
+    "conda_parser_shed_requests_total": (
+        "counter",
+        "Requests the ASGI front end answered 429 as too many solves were queued",
+    ),
+    "conda_parser_cache_requests_total": (
+        "counter",
+        "Cache lookups by cache and result (hit or miss)",
+    ),
+}
+
+
+class Metrics:
+    """ One process' counters and histograms """
+
+    def __init__(self, directory: typing.Optional[str] = None, flush_every=1.0):
+        self.directory = directory
+        self.flush_every = flush_every
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum]
+        self._flushed = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._timer = None
+        self._timer_pid = None
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self.flush()
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(BUCKETS) + 1)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-1] += seconds
+        self.flush()
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> typing.Iterator[None]:
+        """ Observes how long the block took, even when it raises """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [
+                    [name, labels, value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, labels, list(values)]
+                    for (name, labels), values in self._histograms.items()
+                ],
+            }
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Writes this process' snapshot, at most every `flush_every` seconds,
+        a write that's too soon is done by a timer, so an idle worker's last
+        requests still make it to its file
+        """
+        if not self.directory:
+            return
+        with self._flush_lock:
+            wait = self._flushed + self.flush_every - time.monotonic()
+            if not force and wait > 0:
+                if self._timer is None or self._timer_pid != os.getpid():
+                    self._timer = threading.Timer(wait, self._flush_later)
+                    self._timer.daemon = True
+                    self._timer.start()
+                    self._timer_pid = os.getpid()
+                return
+            self._flushed = time.monotonic()
+
+            path = os.path.join(self.directory, f"{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+
+    def _flush_later(self) -> None:
+        with self._flush_lock:
+            self._timer = None
+        self.flush(force=True)
+
+    def snapshots(self) -> typing.List[dict]:
+        """ Every worker's snapshot, this process' is always current """
+        if not self.directory:
+            return [self.snapshot()]
+
+        self.flush(force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # a worker replaced it as we read it, it'll be back
+        return snapshots
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def merge(snapshots: typing.Iterable[dict]) -> dict:
+    """ Adds the snapshots up into one """
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    return {"counters": counters, "histograms": histograms}
+
+
+def _labels(labels: typing.Iterable[typing.Tuple[str, str]]) -> str:
+    pairs = [f'{k}="{_escape(str(v))}"' for k, v in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged: dict) -> str:
+    """ Prometheus' text exposition format """
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        if kind == "counter":
+            for (metric, labels), value in sorted(merged["counters"].items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            continue
+
+        for (metric, labels), values in sorted(merged["histograms"].items()):
+            if metric != name:
+                continue
+            count = 0
+            for bound, bucket in zip(BUCKETS, values):
+                count += bucket
+                bucket_labels = _labels(labels + (("le", _number(bound)),))
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(values[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+METRICS_STORE = Metrics(settings.METRICS_DIR, settings.METRICS_FLUSH)
+
+
+def inc(name: str, amount: float = 1, **labels: str) -> None:
+    METRICS_STORE.inc(name, amount, **labels)
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    METRICS_STORE.observe(name, seconds, **labels)
+
+
+def stage(name: str) -> typing.ContextManager[None]:
+    """ Times a stage of a request, eg: with stage("read_environment"): """
+    return METRICS_STORE.timer("conda_parser_stage_seconds", stage=name)
+
+
+def cache_lookup(cache: str, hit: bool, count: int = 1) -> None:
+    if count:
+        result = "hit" if hit else "miss"
+        inc("conda_parser_cache_requests_total", count, cache=cache, result=result)
+
+
+def exposition() -> str:
+    return render(merge(METRICS_STORE.snapshots()))
+
+
+def flush() -> None:
+    METRICS_STORE.flush(force=True)
+
+
+def after_fork() -> None:
+    """
+    Workers start without the metrics the master recorded before forking,
+    eg: preloading, otherwise they'd be counted once per worker. The master
+    has to flush() them to its own file before it forks.
+    """
+    METRICS_STORE.clear()
+
+
+def clear_directory(directory: typing.Optional[str] = settings.METRICS_DIR) -> None:
+    """ Removes old workers' files, run in the gunicorn master at start """
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            os.remove(path)
@@ -0,0 +1,180 @@
+"""
+A local, file based mirror of the supported channels' repodata, so solves and
+package lookups never wait on the network. Sync it, then point the service
+at it with CONDA_PARSER_MIRROR_DIR:
+
+    $ python -m conda_parser.mirror --dir /var/lib/conda_parser/mirror
+    $ CONDA_PARSER_MIRROR_DIR=/var/lib/conda_parser/mirror ./gunicorn_start.sh
+
+The mirror has the same layout as the channels, eg: <dir>/conda-forge/linux-64
+and <dir>/pkgs/main/noarch, each with a repodata.json. Syncing again only
+downloads the repodata that changed upstream.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import typing
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+from . import settings
+
+# where each channel name's repodata comes from
+UPSTREAMS = {
+    "defaults": (
+        "https://repo.anaconda.com/pkgs/main",
+        "https://repo.anaconda.com/pkgs/r",
+    ),
+    "anaconda": ("https://conda.anaconda.org/anaconda",),
+    "conda-forge": ("https://conda.anaconda.org/conda-forge",),
+}
+UPSTREAM_ALIAS = "https://conda.anaconda.org"  # for any other channel name
+DEFAULT_CHANNELS = ("pkgs/main", "pkgs/r")
+
+_root = None  # the file:// url of the mirror conda's pointed at
+
+
+def configure(directory: str) -> None:
+    """
+    Points conda at the mirror: channel names resolve under it and "defaults"
+    is its pkgs/main and pkgs/r, so every channel is a file:// url. conda isn't
+    put in offline mode, as libmamba then only reads repodata already cached.
+    """
+    global _root
+    root = _root = "file://" + os.path.abspath(directory)
+    defaults = [
+        f"{root}/{name}"
+        for name in DEFAULT_CHANNELS
+        if os.path.isdir(os.path.join(directory, name))
+    ]
+    # environment variables, so solver and job processes get them too
+    os.environ["CONDA_CHANNEL_ALIAS"] = root
+    os.environ["CONDA_DEFAULT_CHANNELS"] = ",".join(defaults or [f"{root}/pkgs/main"])
+    # conda reads them when its context is first imported, if it hasn't been yet
+    if "conda.base.context" in sys.modules:
+        from conda.base.context import reset_context
+
+        reset_context()
+
+
+def upstream_url(url: str) -> str:
+    """
+    The upstream url for a url in the mirror, eg: a record's "url", so they
+    don't give away the mirror's path, other urls are returned as they are
+    """
+    if _root is None or not url.startswith(_root + "/"):
+        return url
+    path = url[len(_root) + 1 :]
+    for upstreams in UPSTREAMS.values():
+        for upstream in upstreams:
+            channel = urlparse(upstream).path.strip("/")
+            if path == channel or path.startswith(channel + "/"):
+                return upstream + path[len(channel) :]
+    return f"{UPSTREAM_ALIAS}/{path}"
+
+
+def upstream_record(record: dict) -> dict:
+    """ The record with its "url" and "channel" pointing upstream """
+    for key in ("url", "channel"):
+        if isinstance(record.get(key), str):
+            record[key] = upstream_url(record[key])
+    return record
+
+
+def mirror_path(directory: str, upstream: str, subdir: str) -> str:
+    """ Where an upstream channel url's repodata goes in the mirror """
+    channel = urlparse(upstream).path.strip("/")
+    return os.path.join(directory, channel, subdir, "repodata.json")
+
+
+def fetch(url: str, path: str, timeout: float = 300) -> bool:
+    """
+    Downloads url to path, unless it hasn't changed since the last time,
+    going by its ETag and Last-Modified headers. Returns whether it changed.
+    """
+    state_path = path + ".state"
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if not os.path.exists(path) or state.get("url") != url:
+        state = {}
+
+    headers = {"Accept-Encoding": "gzip"}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with response, open(tmp_path, "wb") as f:
+        body = response
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.GzipFile(fileobj=response)
+        shutil.copyfileobj(body, f, 1024 * 1024)
+    # swapped in whole, so a solve never reads half of it
+    os.replace(tmp_path, path)
+
+    state = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    with open(state_path, "w") as f:
+        json.dump(state, f)
+    return True
+
+
+def sync(
+    directory: str,
+    channels: typing.Sequence[str],
+    subdirs: typing.Optional[typing.Sequence[str]] = None,
+    upstreams: typing.Mapping[str, typing.Sequence[str]] = UPSTREAMS,
+) -> typing.List[typing.Tuple[str, bool]]:
+    """ Syncs each channel's subdirs, returns (url, whether it changed) for each """
+    from conda.base.context import context
+
+    subdirs = subdirs or (context.subdir, "noarch")
+    synced = []
+    for channel in channels:
+        for upstream in upstreams.get(channel, (f"{UPSTREAM_ALIAS}/{channel}",)):
+            for subdir in subdirs:
+                url = f"{upstream}/{subdir}/repodata.json"
+                synced.append(
+                    (url, fetch(url, mirror_path(directory, upstream, subdir)))
+                )
+    return synced
+
+
+def main(argv: typing.Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m conda_parser.mirror",
+        description="Syncs, or incrementally resyncs, a local channel mirror",
+    )
+    parser.add_argument("channels", nargs="*", default=settings.PRELOAD_CHANNELS)
+    parser.add_argument("--dir", default=settings.MIRROR_DIR, required=False)
+    parser.add_argument("--subdir", action="append", dest="subdirs")
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("--dir or CONDA_PARSER_MIRROR_DIR is required")
+
+    for url, changed in sync(args.dir, args.channels, args.subdirs):
+        print(f"{'updated' if changed else 'unchanged'} {url}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
+import concurrent.futures
+import hashlib
 import os
 import re
 import typing
 import yaml
 
-from conda.api import Solver
-from conda.exceptions import ResolvePackageNotFound
-from conda.models.match_spec import MatchSpec
-
-from yaml import CLoader
+from . import metrics, profiling, settings
+from .cache import LRUCache, SQLiteCache, TieredCache, digest
+from .exceptions import PackageNotFound, SolveFailed
+from .loader import load_environment
+from .requirements import parse_requirement
+from .store import LockfileStore
 
 SUPPORTED_CHANNELS = {"defaults", "nodefaults", "anaconda", "conda-forge"}
 SUPPORTED_EXTENSIONS = {
@@ -21,6 +24,40 @@ FILTER_KEYS = {
     "prefix",
 }  # What keys we want back from the environment file
 
+# (name, requirement) of each spec string, the same ones turn up in most files
+SPEC_CACHE = LRUCache(settings.SPEC_CACHE_SIZE)
+
+# The parsed requirement of each pip requirement string, or False if it isn't one
+PIP_CACHE = LRUCache(settings.PIP_CACHE_SIZE)
+
+# Solved lockfiles and bad_specs, keyed on everything that changes a solve
+SOLVE_CACHE = TieredCache(
+    LRUCache(settings.SOLVE_CACHE_SIZE),
+    SQLiteCache(
+        settings.SOLVE_CACHE_PATH, settings.SOLVE_CACHE_DISK_SIZE, table="solves"
+    )
+    if settings.SOLVE_CACHE_PATH
+    else None,
+)
+
+# Whole parse_environment results that didn't need a solve, keyed on the body
+PARSE_CACHE = LRUCache(settings.PARSE_CACHE_SIZE)
+
+# Solved lockfiles, keyed on their lockfile_digest, so a later parse can start
+# from one by naming it, or a client can fetch one from /lockfile/<digest>.
+# Solves in SOLVE_CACHE refer to their lockfile here by digest.
+LOCKFILE_CACHE = TieredCache(
+    LRUCache(settings.LOCKFILE_CACHE_SIZE),
+    SQLiteCache(
+        settings.SOLVE_CACHE_PATH,
+        settings.SOLVE_CACHE_DISK_SIZE,
+        table="lockfile_sets",
+    )
+    if settings.SOLVE_CACHE_PATH
+    else None,
+)
+LOCKFILES = LockfileStore(LOCKFILE_CACHE, LRUCache(settings.LOCKFILE_SHARED_SIZE))
+
 
 def _get_extension(filename: str) -> str:
     _, extension = os.path.splitext(filename)
@@ -35,20 +72,58 @@ def is_lock(filename: str) -> bool:
     return _get_extension(filename) == ".lock"
 
 
+def needs_solve(
+    filename: str,
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    previous: typing.Optional[list] = None,
+) -> bool:
+    """ Whether parsing the file includes solving it for a lockfile """
+    return bool(
+        force_solve or platforms or previous or (filename and is_lock(filename))
+    )
+
+
+def invalid_file(filename, environment_file) -> typing.Optional[str]:
+    """ Why a filename and file, eg: from json, can't be parsed, or None """
+    if filename is not None and not isinstance(filename, str):
+        return "`filename` must be a string"
+    if environment_file is not None and not isinstance(environment_file, (str, bytes)):
+        return "`file` must be a string"
+    return None
+
+
+def unknown_platforms(platforms: typing.Sequence[str]) -> list:
+    """ The platforms that aren't conda subdirs that can be solved for """
+    from conda.base.constants import KNOWN_SUBDIRS
+
+    return [p for p in platforms if p not in KNOWN_SUBDIRS or p == "noarch"]
+
+
 def read_environment(environment_file: str) -> dict:
     """
-    Loads the file into yaml and returns the keys that we care about.
-        example: ignores `prefix:` settings in environment.yml
+    Loads the keys that we care about from the file, nothing else in it is
+    built, see loader.load_environment for the limits on what's accepted.
     """
-    environment = yaml.load(environment_file, Loader=CLoader)
-    return {k: v for k, v in environment.items() if k in FILTER_KEYS}
+    return load_environment(environment_file, FILTER_KEYS)
 
 
 def clean_out_pip(specs: list) -> list:
-    """ Not supporting pip for now """
+    """ The conda specs, without the `pip:` section """
     return [spec for spec in specs if isinstance(spec, str)]
 
 
+def pip_requirements(specs: list) -> list:
+    """ The requirement strings in the `pip:` section """
+    return [
+        requirement
+        for spec in specs
+        if isinstance(spec, dict) and isinstance(spec.get("pip"), list)
+        for requirement in spec["pip"]
+        if isinstance(requirement, str)
+    ]
+
+
 def clean_channels(channels: list) -> list:
     """
     Grab channels from the environment file, but remove any that
@@ -67,104 +142,660 @@ def match_specs(specs: list) -> list:
     this removes the build parameter, and always returns a dict of name/requirement
     """
     _specs = []
+    misses = 0
     for dep in specs:
-        spec = MatchSpec(dep)
-        _specs.append({"name": str(spec.name), "requirement": str(spec.version or "")})
+        name_requirement = SPEC_CACHE.get(dep)
+        if name_requirement is None:
+            name_requirement = parse_spec(dep)
+            SPEC_CACHE.set(dep, name_requirement)
+            misses += 1
+        name, requirement = name_requirement
+        _specs.append({"name": name, "requirement": requirement})
+
+    metrics.cache_lookup("spec", True, len(specs) - misses)
+    metrics.cache_lookup("spec", False, misses)
     return _specs
 
 
+def match_pip(requirements: list) -> list:
+    """
+    The pip requirements as {"name": name, "requirement": requirement} dicts,
+    see requirements.parse_requirement, lines that aren't requirements, eg:
+    --index-url, are left out
+    """
+    _requirements = []
+    misses = 0
+    for line in requirements:
+        requirement = PIP_CACHE.get(line)
+        if requirement is None:
+            requirement = parse_requirement(line) or False
+            PIP_CACHE.set(line, requirement)
+            misses += 1
+        if requirement:
+            _requirements.append(dict(requirement))
+
+    metrics.cache_lookup("pip", True, len(requirements) - misses)
+    metrics.cache_lookup("pip", False, misses)
+    return _requirements
+
+
+def parse_spec(dep: str) -> typing.Tuple[str, str]:
+    """ The (name, requirement) of a spec, the common formats skip MatchSpec """
+    name_requirement = fast_parse_spec(dep)
+    if name_requirement is None:
+        from conda.models.match_spec import MatchSpec
+
+        spec = MatchSpec(dep)
+        name_requirement = (str(spec.name), str(spec.version or ""))
+    return name_requirement
+
+
+# the name a record's depends spec is for, eg: python of "python >=3.7,<3.8"
+DEPEND_NAME = re.compile(r"[^\s=<>!~\[]+")
+
+_NAME = r"(?P<name>[a-z0-9_][a-z0-9_.\-]*)"
+_VERSION = r"\d+(?:\.[a-z0-9_]+)*"  # no globs, ranges or ors
+_BUILD = r"[a-z0-9_.]+"
+SIMPLE_SPECS = [
+    # numpy
+    (re.compile(f"{_NAME}"), ""),
+    # numpy 1.8.1, numpy==1.8.1, numpy ==1.8.1
+    (re.compile(f"{_NAME}(?: |==| ==)(?P<version>{_VERSION})"), ""),
+    # numpy 1.8.1 py27_0, numpy=1.8.1=py27_0
+    (
+        re.compile(
+            f"{_NAME}(?: (?P<version>{_VERSION}) |=(?P<version_>{_VERSION})=){_BUILD}"
+        ),
+        "",
+    ),
+    # numpy 1.8.*, numpy 1.8*
+    (re.compile(f"{_NAME} (?P<version>{_VERSION})\\.?\\*"), ".*"),
+    # numpy=1.8 means 1.8.*
+    (re.compile(f"{_NAME}=(?P<version>{_VERSION})"), ".*"),
+    # numpy >=1.8, numpy >=1.8,<2
+    (re.compile(f"{_NAME} ?(?P<version>[<>]=?{_VERSION}(?:,[<>]=?{_VERSION})*)"), ""),
+]
+
+
+def fast_parse_spec(dep: str) -> typing.Optional[typing.Tuple[str, str]]:
+    """
+    Parses the common spec formats the same way MatchSpec does, without the
+    cost of building one, returns None for anything else.
+    """
+    dep = dep.strip()
+    for pattern, suffix in SIMPLE_SPECS:
+        match = pattern.fullmatch(dep)
+        if match:
+            groups = match.groupdict()
+            version = groups.get("version") or groups.get("version_") or ""
+            return groups["name"], version + suffix if version else ""
+    return None
+
+
 def parse_environment(
-    filename: str, environment_file: str, force_solve: bool = False
+    filename: str,
+    environment_file: str,
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    previous: typing.Optional[list] = None,
+    graph: bool = False,
 ) -> dict:
     """
         Loads a file, checks some common error conditions, tries its best
     to see if it is an actual Conda environment.yml file, and if it is,
     it will return a dictionary of a list of the manifest, lockfile, and channels.
+    With `platforms` it's solved for each of those subdirs instead of this
+    one, and "lockfiles" has a lockfile for each of them. With a `previous`
+    lockfile, it's solved starting from that, see solve_environment. With
+    `graph`, a solve's "graph" (or "graphs") is its dependency_graph.
 
     returns
         - dict of "error": "message"
         or
-        - dict of "lockfile", "manifest", "channels"
+        - dict of "lockfile" (or "lockfiles"), "manifest", "channels"
+    """
+    if hasattr(environment_file, "read"):
+        environment_file = environment_file.read()
+
+    invalid = invalid_file(filename, environment_file)
+    if invalid:
+        return {"error": invalid}
+
+    # results without a lockfile only depend on the file, so are kept in PARSE_CACHE
+    cacheable = environment_file and not needs_solve(
+        filename, force_solve, platforms, previous
+    )
+    if cacheable:
+        key = environment_digest(filename, environment_file, force_solve)
+        cached = PARSE_CACHE.get(key)
+        metrics.cache_lookup("parse", cached is not None)
+        if cached is not None:
+            return dict(cached)
+
+    result = dict(
+        iter_parse_environment(
+            filename, environment_file, force_solve, platforms, previous, graph
+        )
+    )
+    if cacheable and "error" not in result:
+        # errors are cheap, and can name the file, so only results are kept
+        PARSE_CACHE.set(key, result)
+    return dict(result)
+
+
+def environment_digest(
+    filename: str, environment_file: typing.Union[str, bytes], force_solve: bool
+) -> str:
+    """
+    A hash of everything a parse_environment result depends on, other than
+    repodata, used as the PARSE_CACHE key and /parse's ETag
+    """
+    body = environment_file or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    sha = hashlib.sha256()
+    sha.update(_get_extension(filename or "").encode("utf-8") + b"\0")
+    sha.update(b"1\0" if force_solve else b"0\0")
+    sha.update(body)
+    return sha.hexdigest()
+
+
+def iter_parse_environment(
+    filename: str,
+    environment_file: str,
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    previous: typing.Optional[list] = None,
+    graph: bool = False,
+) -> typing.Iterator[typing.Tuple[str, typing.Any]]:
+    """
+    parse_environment, a section at a time, so the manifest can be sent
+    while the environment is still being solved.
+
+    yields
+        - ("error", "message")
+        or
+        - ("manifest", list), ("pip", list), ("lockfile", list or None), ("channels", list), ("bad_specs", list)
+        with platforms, ("lockfiles", dict of platform -> list) instead of
+        "lockfile", and ("lockfile_digests", dict of platform -> str)
+        a solved lockfile is followed by ("lockfile_digest", str), and with a
+        previous lockfile ("lockfile_diff", dict), see lockfile_diff, and with
+        graph ("graph", dict), or ("graphs", dict of platform -> dict)
     """
+    invalid = invalid_file(filename, environment_file)
+    if invalid:
+        yield "error", invalid
+        return
+
     # we need the `file` field
     if not environment_file:
-        return {"error": "No `file` provided."}
+        yield "error", "No `file` provided."
+        return
 
     # file must be in .yaml or .yml format
     if not filename or not supported_filename(filename):
-        return {"error": "Please provide a `.yml` or `.yaml` environment file"}
+        yield "error", "Please provide a `.yml` or `.yaml` environment file"
+        return
+
+    unknown = unknown_platforms(platforms) if platforms else []
+    if unknown:
+        yield "error", f"Unknown platform(s): {', '.join(unknown)}"
+        return
+
+    if platforms and previous:
+        yield "error", "A previous lockfile can't be used with `platforms`"
+        return
 
     # Parse the file
     try:
-        environment = read_environment(environment_file)
+        with metrics.stage("read_environment"):
+            environment = read_environment(environment_file)
     except yaml.YAMLError as exc:
-        return {"error": f"YAML parsing error in environment file: {exc}"}
+        yield "error", f"YAML parsing error in environment file: {exc}"
+        return
 
     if not environment.get("dependencies"):
-        return {"error": f"No `dependencies:` in your {filename}"}
-
-    # Ignore pip, and pin to specific format
-    manifest = match_specs(clean_out_pip(environment["dependencies"]))
+        yield "error", f"No `dependencies:` in your {filename}"
+        return
+
+    # pin to specific format, pip's requirements are their own section
+    with metrics.stage("match_specs"):
+        manifest = match_specs(clean_out_pip(environment["dependencies"]))
+    with metrics.stage("match_pip"):
+        pip = match_pip(pip_requirements(environment["dependencies"]))
     environment["dependencies"] = manifest
 
     environment["channels"] = clean_channels(environment.get("channels", ["defaults"]))
 
-    if force_solve or is_lock(filename):
-        lockfile, bad_specs = solve_environment(environment)
+    yield "manifest", sorted(manifest, key=lambda i: i.get("name", ""))
+    yield "pip", sorted(pip, key=lambda i: i["name"].lower())
+
+    if platforms:
+        solved = solve_platforms(environment, platforms)
+        yield "lockfiles", {
+            platform: sorted(s["lockfile"], key=lambda i: i.get("name", ""))
+            for platform, s in solved.items()
+        }
+        yield "lockfile_digests", {
+            platform: s["lockfile_digest"] for platform, s in solved.items()
+        }
+        if graph:
+            with metrics.stage("dependency_graph"):
+                yield "graphs", {
+                    platform: dependency_graph(manifest, s["lockfile"], s["depends"])
+                    for platform, s in solved.items()
+                }
+        # specs left out of any of the platforms' solves
+        bad_specs = {spec for s in solved.values() for spec in s["bad_specs"]}
+    elif needs_solve(filename, force_solve, previous=previous):
+        with metrics.stage("solve_environment"):
+            solved = cached_solve(environment, previous=previous)
         # Sort the lockfile
-        lockfile = sorted(lockfile, key=lambda i: i.get("name", ""))
+        lockfile = sorted(solved["lockfile"], key=lambda i: i.get("name", ""))
+        bad_specs = solved["bad_specs"]
+        yield "lockfile", lockfile
+        yield "lockfile_digest", solved["lockfile_digest"]
+        if previous:
+            yield "lockfile_diff", lockfile_diff(previous, lockfile)
+        if graph:
+            with metrics.stage("dependency_graph"):
+                yield "graph", dependency_graph(manifest, lockfile, solved["depends"])
     else:
-        lockfile = None
+        yield "lockfile", None
         bad_specs = []
 
-    output = {
-        "manifest": sorted(manifest, key=lambda i: i.get("name", "")),
-        "lockfile": lockfile,
-        "channels": environment["channels"],
-        "bad_specs": sorted(bad_specs),
-    }
+    yield "channels", environment["channels"]
+    yield "bad_specs", sorted(bad_specs)
+
+
+def parse_environments(
+    files: list,
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    graph: bool = False,
+) -> list:
+    """
+    Runs parse_environment over a list of (filename, environment_file) pairs.
+    Duplicate files are only parsed once, and as every solve goes through the
+    same SOLVE_CACHE and conda's repodata, later items reuse earlier work.
 
-    return output
+    returns a list of parse_environment results, in the same order as `files`,
+    one missing package doesn't fail the batch, it's returned as that item's "error"
+    """
+    results = [{} for _ in files]
+    sections = iter_parse_environments(files, force_solve, platforms, graph)
+    for index, section, value in sections:
+        results[index][section] = value
+
+    return [
+        {"error": result["error"]} if "error" in result else result
+        for result in results
+    ]
 
 
-def solve_environment(environment: dict) -> typing.Tuple[list, list]:
+def iter_parse_environments(
+    files: list,
+    force_solve: bool = False,
+    platforms: typing.Optional[typing.Sequence[str]] = None,
+    graph: bool = False,
+) -> typing.Iterator[typing.Tuple[int, str, typing.Any]]:
+    """
+    parse_environments, a section at a time, yields (index, section, value)
+    in the same order as `files`. A missing package, or a failed solve, is
+    yielded as an "error" section, which can come after that file's manifest.
+    """
+    seen = {}
+    for index, (filename, environment_file) in enumerate(files):
+        invalid = invalid_file(filename, environment_file)
+        if invalid:
+            yield index, "error", invalid
+            continue
+
+        key = (filename, environment_file)
+        if key in seen:
+            for section, value in seen[key]:
+                yield index, section, value
+            continue
+
+        sections = seen[key] = []
+        try:
+            for section, value in iter_parse_environment(
+                filename, environment_file, force_solve, platforms, graph=graph
+            ):
+                sections.append((section, value))
+                yield index, section, value
+        except (PackageNotFound, SolveFailed) as e:
+            sections.append(("error", error_message(e)))
+            yield index, "error", error_message(e)
+
+
+def error_message(e: Exception) -> str:
+    """ The "error" section for a missing package or a failed solve """
+    if isinstance(e, PackageNotFound):
+        return f"Package(s) not found: {e}"
+    return f"Solving failed: {e}"
+
+
+def solve_environment(
+    environment: dict,
+    subdir: typing.Optional[str] = None,
+    previous: typing.Optional[list] = None,
+) -> typing.Tuple[list, list]:
     """
     Using the Conda API, Solve an environment, get back all
-    of the dependencies.
+    of the dependencies, for `subdir` if it's set rather than this platform.
+
+    With a `previous` lockfile, when it still satisfies every spec it's
+    reused without a solve, as in reuse_lockfile, otherwise the solve keeps
+    the packages the specs didn't change at their locked versions if it can.
 
     returns a list of {"name": name, "requirement": requirement} values.
     """
+    solved = cached_solve(environment, subdir, previous)
+    return list(solved["lockfile"]), list(solved["bad_specs"])
+
+
+def cached_solve(
+    environment: dict,
+    subdir: typing.Optional[str] = None,
+    previous: typing.Optional[list] = None,
+) -> dict:
+    """
+    solve_environment's solve, from SOLVE_CACHE when it's there, as a dict of
+    its "lockfile", "lockfile_digest", "bad_specs", and "depends", each
+    package's depends specs. SOLVE_CACHE only keeps the digest of the
+    lockfile, which is kept in LOCKFILES, and shares the depends with other
+    solves'.
+    """
     prefix = environment.get("prefix", ".")
     channels = environment["channels"]
-    specs = [
+    specs = environment_specs(environment)
+    locked = {entry["name"]: entry["requirement"] for entry in previous or []}
+
+    profiling.annotate(specs=specs, channels=channels, prefix=prefix)
+
+    from conda.base.context import context
+
+    # channel order is priority order, so only the specs get sorted
+    subdir = subdir or context.subdir
+    key = digest(
+        sorted(specs),
+        channels,
+        prefix,
+        subdir,
+        repodata_signature(channels, subdir),
+        sorted(locked.items()),
+    )
+    cached = SOLVE_CACHE.get(key)
+    # solves cached before lockfiles were stored by digest are solved again,
+    # as are ones whose lockfile has been evicted since
+    lockfile = None
+    if cached is not None and "lockfile_digest" in cached:
+        lockfile = LOCKFILES.get(cached["lockfile_digest"])
+    metrics.cache_lookup("solve", lockfile is not None)
+    if lockfile is not None:
+        return dict(cached, lockfile=lockfile)
+
+    solved = _solve(prefix, channels, specs, subdir, locked)
+    solved["lockfile_digest"] = LOCKFILES.put(solved["lockfile"])
+    # in the order LOCKFILES gives it back in, so a hit is the same as a miss
+    solved["lockfile"].sort(key=lambda entry: (entry["name"], entry["requirement"]))
+    solved["depends"] = {
+        name: LOCKFILES.share(tuple(depends))
+        for name, depends in solved["depends"].items()
+    }
+    SOLVE_CACHE.set(
+        key,
+        {
+            "lockfile_digest": solved["lockfile_digest"],
+            "bad_specs": solved["bad_specs"],
+            "depends": solved["depends"],
+        },
+    )
+    return solved
+
+
+def environment_specs(environment: dict) -> list:
+    return [
         f"{spec['name']} {spec.get('requirement', '')}".rstrip()
         for spec in environment["dependencies"]
     ]
 
-    bad_specs = []
-    try:
-        dependencies = Solver(prefix, channels, specs_to_add=specs).solve_final_state()
-    except ResolvePackageNotFound as e:
-        ok_specs, bad_specs = rigidly_parse_error_message(e.message, specs)
-        dependencies = Solver(
-            prefix, channels, specs_to_add=ok_specs
-        ).solve_final_state()
-
-    return (
-        [{"name": dep["name"], "requirement": dep["version"]} for dep in dependencies],
-        bad_specs,
+
+def solve_platforms(
+    environment: dict, platforms: typing.Sequence[str]
+) -> typing.Dict[str, dict]:
+    """
+    solve_environment for each platform, all at once. The specs are only
+    parsed once, and the platforms' bad specs are found with the same noarch
+    index. Other platforms than this one are solved by their own processes,
+    see get_platform_executor, so the threads here mostly wait on them.
+
+    returns platform -> cached_solve's dict, in the order of `platforms`
+    """
+    platforms = list(dict.fromkeys(platforms))
+    # the solves run on other threads, so annotate this one's profile here
+    profiling.annotate(
+        specs=environment_specs(environment),
+        channels=environment["channels"],
+        prefix=environment.get("prefix", "."),
+        platforms=platforms,
     )
 
+    def solve(platform: str) -> dict:
+        with metrics.stage("solve_environment"):
+            return cached_solve(environment, platform)
+
+    with concurrent.futures.ThreadPoolExecutor(len(platforms)) as pool:
+        return dict(zip(platforms, pool.map(solve, platforms)))
+
+
+def _solve(prefix: str, channels: list, specs: list, subdir: str, locked: dict) -> dict:
+    with metrics.stage("find_bad_specs"):
+        bad_specs = find_bad_specs(channels, specs, subdir)
+    metrics.inc("conda_parser_bad_specs_total", len(bad_specs))
+    ok_specs = [spec for spec in specs if spec not in bad_specs]
+
+    pins = []
+    if locked:
+        with metrics.stage("reuse_lockfile"):
+            reused = reuse_lockfile(channels, ok_specs, locked, subdir)
+        result = "reused" if reused is not None else "pinned"
+        metrics.inc("conda_parser_incremental_solves_total", result=result)
+        if reused is not None:
+            return {
+                "lockfile": [
+                    {"name": name, "requirement": locked[name]} for name in reused
+                ],
+                "bad_specs": bad_specs,
+                "depends": {
+                    name: list(record.depends) for name, record in reused.items()
+                },
+            }
+        pins = locked_pins(ok_specs, locked)
+
+    from .executor import get_subdir_executor
 
-def rigidly_parse_error_message(message: str, specs: list) -> typing.Tuple[list, list]:
+    try:
+        with metrics.stage("solve_final_state"):
+            dependencies = (
+                get_subdir_executor(subdir).solve(
+                    prefix, channels, ok_specs, subdir, pins
+                )
+                if ok_specs
+                else []
+            )
+    except PackageNotFound:
+        # a dependency of a spec is missing, find_bad_specs only checks the specs
+        metrics.inc("conda_parser_not_found_total", stage="solve_final_state")
+        raise
+
+    return {
+        "lockfile": [
+            {"name": dep["name"], "requirement": dep["version"]} for dep in dependencies
+        ],
+        "bad_specs": bad_specs,
+        "depends": {dep["name"]: list(dep.get("depends", [])) for dep in dependencies},
+    }
+
+
+def find_bad_specs(
+    channels: list, specs: list, subdir: typing.Optional[str] = None
+) -> list:
     """
-    The error message, as generated by conda.exceptions.ResolvePackageNotFound, adds
-    some spaces, a dash and a space (yaml list), rather than parse the yaml, just strip off
-    those bits and make a difference list
+    Specs that none of the channels have a package for. conda would fail the
+    whole solve on them, so they're left out of it and returned as bad_specs.
     """
-    message = message.split("\n")  # split by newlines
-    bads = set(bad.lstrip("  - ") for bad in message if bad)
+    indexes = channel_indexes(channels, subdir)
+    return [spec for spec in specs if not any(i.query(spec) for i in indexes)]
+
+
+def channel_indexes(channels: list, subdir: typing.Optional[str] = None) -> list:
+    """ The indexes of the channels' packages for subdir, in priority order """
+    from conda.base.context import context
 
-    good = set(specs) - bads
+    from .index import get_index
 
-    return list(good), list(bads)
+    channels = [channel for channel in channels if channel != "nodefaults"]
+    if not subdir or subdir == context.subdir:
+        return [get_index(channel) for channel in channels]
+    # other platforms share one index of each channel's noarch packages
+    return [
+        get_index(channel, subdirs)
+        for channel in channels
+        for subdirs in ((subdir,), ("noarch",))
+    ]
+
+
+def reuse_lockfile(
+    channels: list, specs: list, locked: dict, subdir: typing.Optional[str] = None
+) -> typing.Optional[dict]:
+    """
+    The records of the part of a previous lockfile the specs need, by name,
+    when it still satisfies them: every spec, and every dependency of the
+    packages they pull in, is matched by the locked version. Otherwise None,
+    and it needs a solve.
+
+    Locked packages are looked up by name and version, so their dependencies
+    are those of the newest build of that version.
+    """
+    from conda.models.match_spec import MatchSpec
+
+    indexes = channel_indexes(channels, subdir)
+    needed = {}
+    wanted = [MatchSpec(spec) for spec in specs]
+    while wanted:
+        spec = wanted.pop()
+        if spec.name.startswith("__"):
+            continue  # virtual packages, eg: __glibc, aren't locked
+        version = locked.get(spec.name)
+        if version is None:
+            return None
+
+        record = needed.get(spec.name)
+        if record is None:
+            exact = f"{spec.name} =={version}"
+            found = (index.query(exact) for index in indexes)
+            record = next((r for r in found if r is not None), None)
+            if record is None:
+                return None
+            needed[spec.name] = record
+            wanted += [MatchSpec(depend) for depend in record.depends]
+        if not spec.match(record):
+            return None
+
+    return needed
+
+
+def locked_pins(specs: list, locked: dict) -> list:
+    """
+    Pins for the locked packages the specs haven't changed, ones whose locked
+    version no longer matches their spec are left free to move
+    """
+    from conda.models.match_spec import MatchSpec
+
+    changed = set()
+    for spec in specs:
+        spec = MatchSpec(spec)
+        version = locked.get(spec.name)
+        if version is None or (spec.version and not spec.version.match(version)):
+            changed.add(spec.name)
+    return [
+        f"{name} =={version}"
+        for name, version in sorted(locked.items())
+        if name not in changed
+    ]
+
+
+def lockfile_digest(lockfile: list) -> str:
+    """ A hash of a lockfile's packages, whatever order they're in """
+    return digest(sorted((entry["name"], entry["requirement"]) for entry in lockfile))
+
+
+def lockfile_diff(previous: list, lockfile: list) -> dict:
+    """
+    What changed between two lockfiles, eg:
+        {
+            "added": [{"name": "six", "requirement": "1.12.0"}],
+            "removed": [],
+            "changed": [{"name": "numpy", "previous": "1.16.4", "requirement": "1.17.0"}],
+        }
+    """
+    before = {entry["name"]: entry["requirement"] for entry in previous}
+    after = {entry["name"]: entry["requirement"] for entry in lockfile}
+    return {
+        "added": [
+            {"name": name, "requirement": after[name]}
+            for name in sorted(after.keys() - before.keys())
+        ],
+        "removed": [
+            {"name": name, "requirement": before[name]}
+            for name in sorted(before.keys() - after.keys())
+        ],
+        "changed": [
+            {"name": name, "previous": before[name], "requirement": after[name]}
+            for name in sorted(after.keys() & before.keys())
+            if before[name] != after[name]
+        ],
+    }
+
+
+def dependency_graph(manifest: list, lockfile: list, depends: dict) -> dict:
+    """
+    Which of the lockfile's packages need which, from their records' depends,
+    eg: for a manifest of numpy
+        {
+            "edges": [{"from": "numpy", "to": "python", "spec": "python >=3.7"}],
+            "packages": {
+                "numpy": {"direct": True, "required_by": []},
+                "python": {"direct": False, "required_by": ["numpy"]},
+            },
+        }
+    "direct" packages are in the manifest, the rest are only dependencies.
+    Depends on packages that aren't in the lockfile, eg: virtual packages
+    like __glibc, aren't edges.
+    """
+    direct = {spec["name"] for spec in manifest}
+    packages = {
+        name: {"direct": name in direct, "required_by": []}
+        for name in sorted(entry["name"] for entry in lockfile)
+    }
+    edges = []
+    for name in packages:
+        for spec in depends.get(name, ()):
+            match = DEPEND_NAME.match(spec)
+            needed = match.group() if match else None
+            if needed in packages and needed != name:
+                edges.append({"from": name, "to": needed, "spec": spec})
+                packages[needed]["required_by"].append(name)
+    return {"edges": edges, "packages": packages}
+
+
+def repodata_signature(channels: list, subdir: typing.Optional[str] = None) -> str:
+    """
+    Which repodata the channels have for subdir. Every worker that's loaded
+    the same repodata has the same signature, so they share solves cached in
+    SQLite, until the repodata changes.
+    """
+    indexes = channel_indexes(channels, subdir)
+    return digest([index.repodata_signature() for index in indexes])
@@ -0,0 +1,199 @@
+"""
+Opt-in profiles of slow requests, enabled by setting PROFILE_DIR.
+
+Requests that run longer than PROFILE_THRESHOLD seconds have their thread's
+stack sampled every PROFILE_INTERVAL seconds by a watchdog thread, which
+sleeps until a request could be over the threshold, so requests that finish
+in time cost a dictionary insert and delete. Requests with the PROFILE_HEADER
+header set to PROFILE_TOKEN are run under cProfile instead, without a token
+the header is ignored. Streamed responses are profiled until they're closed,
+so the solve they stream is in the profile.
+
+Each profile is written to PROFILE_DIR as <name>.json, with the request, its
+duration and the specs and channels it solved, next to either <name>.folded,
+sampled stacks in the "folded" format flamegraph.pl and speedscope read, or
+<name>.prof, cProfile stats for pstats or snakeviz. Only the newest
+PROFILE_KEEP profiles are kept.
+"""
+import cProfile
+import collections
+import glob
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import typing
+import uuid
+
+from . import settings
+
+
+class _Active:
+    """ A request being watched """
+
+    def __init__(self, thread_id: int, profile: typing.Optional[cProfile.Profile]):
+        self.thread_id = thread_id
+        self.started = time.monotonic()
+        self.profile = profile
+        self.samples = collections.Counter()
+        self.info = {}
+
+
+class Profiler:
+    def __init__(
+        self,
+        directory: str,
+        threshold: float,
+        interval: float = 0.01,
+        keep: int = 100,
+        token: typing.Optional[str] = None,
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+        self.keep = keep
+        self.token = token
+        self._active = {}  # thread id -> _Active
+        self._condition = threading.Condition()
+        self._watchdog_pid = None
+
+    def start(self, header: typing.Optional[str] = None) -> None:
+        """ Watches the current thread's request, cProfiling it if asked to """
+        profile = None
+        if header and self.token and hmac.compare_digest(header, self.token):
+            profile = cProfile.Profile()
+
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None  # another thread is being cProfiled, sample this one
+
+        thread_id = threading.get_ident()
+        with self._condition:
+            self._ensure_watchdog()
+            self._active[thread_id] = _Active(thread_id, profile)
+            if len(self._active) == 1:
+                self._condition.notify()  # the watchdog sleeps when there's none
+
+    def annotate(self, **info: typing.Any) -> None:
+        """ Adds to what's stored with the current thread's profile, eg: specs """
+        active = self._active.get(threading.get_ident())
+        if active is not None:
+            active.info.update(info)
+
+    def finish(self, **request: typing.Any) -> typing.Optional[str]:
+        """ Stops watching the current thread, returns the profile's path if any """
+        with self._condition:
+            active = self._active.pop(threading.get_ident(), None)
+        if active is None:
+            return None
+        if active.profile is not None:
+            active.profile.disable()
+        elif not active.samples:
+            return None
+
+        duration = time.monotonic() - active.started
+        return self._write(active, duration, request)
+
+    def _write(self, active: _Active, duration: float, request: dict) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = "{}-{}-{}".format(
+            time.strftime("%Y%m%dT%H%M%S"), os.getpid(), uuid.uuid4().hex[:8]
+        )
+        path = os.path.join(self.directory, name)
+
+        if active.profile is not None:
+            trigger = "header"
+            active.profile.dump_stats(path + ".prof")
+        else:
+            trigger = "threshold"
+            with open(path + ".folded", "w") as f:
+                for stack, count in active.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+
+        metadata = dict(
+            request,
+            trigger=trigger,
+            duration=duration,
+            threshold=self.threshold,
+            interval=self.interval,
+            samples=sum(active.samples.values()),
+            **active.info,
+        )
+        with open(path + ".json", "w") as f:
+            json.dump(metadata, f, indent=2, default=str)
+
+        self._prune()
+        return path + ".json"
+
+    def _prune(self) -> None:
+        profiles = sorted(
+            glob.glob(os.path.join(self.directory, "*.json")), key=os.path.getmtime
+        )
+        for old in profiles[: max(0, len(profiles) - self.keep)]:
+            for path in glob.glob(old[: -len(".json")] + ".*"):
+                os.remove(path)
+
+    def _ensure_watchdog(self) -> None:
+        # threads don't survive a fork, so each worker starts its own
+        if self._watchdog_pid != os.getpid():
+            self._watchdog_pid = os.getpid()
+            threading.Thread(
+                target=self._watch, name="profiling-watchdog", daemon=True
+            ).start()
+
+    def _watch(self) -> None:
+        # holds the lock but while waiting, so finished requests aren't sampled
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                watched = [a for a in self._active.values() if a.profile is None]
+                due = [a for a in watched if now - a.started >= self.threshold]
+                if due:
+                    frames = sys._current_frames()
+                    for active in due:
+                        frame = frames.get(active.thread_id)
+                        if frame is not None:
+                            active.samples[_stack(frame)] += 1
+                    timeout = self.interval
+                elif watched:
+                    soonest = min(a.started for a in watched)
+                    timeout = soonest + self.threshold - now
+                else:
+                    timeout = None  # until a request starts
+                self._condition.wait(timeout)
+
+
+def _stack(frame, limit: int = 200) -> str:
+    """
+    A frame's stack, outermost first, as function (file:line);... where line
+    is where the function starts, so samples anywhere in it add up
+    """
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+PROFILER = (
+    Profiler(
+        settings.PROFILE_DIR,
+        settings.PROFILE_THRESHOLD,
+        settings.PROFILE_INTERVAL / 1000,
+        settings.PROFILE_KEEP,
+        settings.PROFILE_TOKEN,
+    )
+    if settings.PROFILE_DIR
+    else None
+)
+
+
+def annotate(**info: typing.Any) -> None:
+    if PROFILER is not None:
+        PROFILER.annotate(**info)
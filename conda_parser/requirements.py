@@ -0,0 +1,83 @@
+"""
+Parses the requirements in an environment file's `pip:` section, the PEP 508
+strings pip takes, and the editable and VCS urls with an #egg= name, without
+needing pip itself.
+"""
+import re
+import typing
+
+_NAME = r"[A-Za-z0-9](?:[A-Za-z0-9._\-]*[A-Za-z0-9])?"
+_VERSION_ONE = r"(?:~=|===|==|!=|<=|>=|<|>)\s*[A-Za-z0-9_.*+!\-]+"
+_VERSIONS = f"{_VERSION_ONE}(?:\\s*,\\s*{_VERSION_ONE})*"
+
+REQUIREMENT = re.compile(
+    f"(?P<name>{_NAME})\\s*"
+    f"(?:\\[(?P<extras>\\s*(?:{_NAME}(?:\\s*,\\s*{_NAME})*)?\\s*)\\])?\\s*"
+    f"(?:\\(\\s*(?P<paren_versions>{_VERSIONS})\\s*\\)"
+    f"|(?P<versions>{_VERSIONS})"
+    f"|@\\s*(?P<url>\\S+))?\\s*"
+    f"(?:;\\s*(?P<marker>.+?))?\\s*"
+)
+EGG = re.compile(f"#(?:.*&)?egg=(?P<name>{_NAME})")
+URL = re.compile(r"(?:[a-z][a-z0-9+.\-]*://|git@)", re.IGNORECASE)
+EDITABLE = re.compile(r"(?:-e|--editable)(?:\s+|=)(?P<url>\S+)")
+
+
+def parse_requirement(line: str) -> typing.Optional[dict]:
+    """
+    A pip requirement line as {"name", "requirement"}, with "extras",
+    "marker" or "url" when it has them, eg:
+        "requests[security]>=2.8.1,<3 ; python_version<'3.8'"
+        {
+            "name": "requests",
+            "requirement": ">=2.8.1,<3",
+            "extras": ["security"],
+            "marker": "python_version<'3.8'",
+        }
+    Returns None for lines that aren't a requirement, eg: options like
+    --index-url, local paths, and urls without an #egg= name.
+    """
+    line = _strip_comment(line)
+    if not line:
+        return None
+
+    editable = EDITABLE.fullmatch(line)
+    if editable:
+        return _url_requirement(editable.group("url"))
+    if line.startswith("-"):
+        return None  # other options, eg: -r requirements.txt, --index-url
+    if URL.match(line):
+        return _url_requirement(line)
+
+    # options pip allows after a requirement, eg: --hash=sha256:...
+    line = re.split(r"\s+--?[a-z]", line, maxsplit=1)[0]
+    match = REQUIREMENT.fullmatch(line)
+    if match is None:
+        return None
+
+    versions = match.group("versions") or match.group("paren_versions") or ""
+    requirement = {
+        "name": match.group("name"),
+        "requirement": re.sub(r"\s+", "", versions),
+    }
+    extras = [e.strip() for e in (match.group("extras") or "").split(",")]
+    if any(extras):
+        requirement["extras"] = extras
+    if match.group("marker"):
+        requirement["marker"] = match.group("marker")
+    if match.group("url"):
+        requirement["url"] = match.group("url")
+    return requirement
+
+
+def _url_requirement(url: str) -> typing.Optional[dict]:
+    egg = EGG.search(url)
+    if egg is None:
+        return None
+    return {"name": egg.group("name"), "requirement": "", "url": url}
+
+
+def _strip_comment(line: str) -> str:
+    # a # starts a comment at the start of the line or after whitespace,
+    # a url's #egg= fragment doesn't
+    return re.split(r"(?:^|\s)#", line, maxsplit=1)[0].strip()
@@ -0,0 +1,134 @@
+"""
+Runtime settings. Everything is read from environment variables so it can be
+set from the Dockerfile, docker-compose.yml or gunicorn_start.sh.
+"""
+
+import os
+
+
+def _int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _list(name: str, default: str) -> tuple:
+    value = os.environ.get(name, default)
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+# How many solves to keep in each worker's in-memory cache
+SOLVE_CACHE_SIZE = _int("CONDA_PARSER_SOLVE_CACHE_SIZE", 1024)
+
+# Optional SQLite file shared by all workers, eg: /tmp/conda_parser_solves.db
+SOLVE_CACHE_PATH = os.environ.get("CONDA_PARSER_SOLVE_CACHE_PATH")
+
+# How many solves to keep on disk before evicting the oldest
+SOLVE_CACHE_DISK_SIZE = _int("CONDA_PARSER_SOLVE_CACHE_DISK_SIZE", 100000)
+
+# /package lookups kept per worker, and how many seconds they are good for
+PACKAGE_CACHE_SIZE = _int("CONDA_PARSER_PACKAGE_CACHE_SIZE", 4096)
+PACKAGE_CACHE_TTL = _int("CONDA_PARSER_PACKAGE_CACHE_TTL", 3600)
+
+# Most files accepted by one /parse/batch request
+BATCH_MAX_FILES = _int("CONDA_PARSER_BATCH_MAX_FILES", 1000)
+
+# Processes running /parse?async=1 jobs, how many jobs can wait for one,
+# and how many seconds a job gets before it's marked as failed
+JOB_WORKERS = _int("CONDA_PARSER_JOB_WORKERS", 2)
+JOB_QUEUE_DEPTH = _int("CONDA_PARSER_JOB_QUEUE_DEPTH", 100)
+JOB_TIMEOUT = _int("CONDA_PARSER_JOB_TIMEOUT", 3600)
+
+# Finished jobs kept per worker, they're also kept in the SQLite file if set
+JOB_STORE_SIZE = _int("CONDA_PARSER_JOB_STORE_SIZE", 10000)
+
+# Where conda solves run, "inprocess" in the web worker's thread, or "process"
+# on a pool of SOLVER_WORKERS processes per web worker, with repodata for
+# SOLVER_WARM_CHANNELS loaded at start. A solve in a process taking more than
+# SOLVER_TIMEOUT seconds, or SOLVER_MEMORY_LIMIT megabytes (0 for no limit),
+# has its process killed and replaced.
+SOLVER_EXECUTOR = os.environ.get("CONDA_PARSER_SOLVER_EXECUTOR", "inprocess")
+SOLVER_WORKERS = _int("CONDA_PARSER_SOLVER_WORKERS", os.cpu_count() or 1)
+SOLVER_TIMEOUT = _int("CONDA_PARSER_SOLVER_TIMEOUT", 3600)
+SOLVER_MEMORY_LIMIT = _int("CONDA_PARSER_SOLVER_MEMORY_LIMIT", 0)
+SOLVER_WARM_CHANNELS = _list("CONDA_PARSER_SOLVER_WARM_CHANNELS", "defaults")
+
+# Solves for other platforms than the service's own run on
+# SOLVER_PLATFORM_WORKERS processes per platform, per web worker, set up as
+# that platform with these versions of its virtual packages, eg: __osx
+SOLVER_PLATFORM_WORKERS = _int("CONDA_PARSER_SOLVER_PLATFORM_WORKERS", 1)
+SOLVER_VIRTUAL_PACKAGES = {
+    "osx": {"osx": os.environ.get("CONDA_PARSER_SOLVER_OSX_VERSION", "13.0")},
+    "win": {"win": os.environ.get("CONDA_PARSER_SOLVER_WIN_VERSION", "10.0")},
+    "linux": {
+        "linux": os.environ.get("CONDA_PARSER_SOLVER_LINUX_VERSION", "5.4"),
+        "glibc": os.environ.get("CONDA_PARSER_SOLVER_GLIBC_VERSION", "2.28"),
+    },
+}
+
+# Under the ASGI front end (conda_parser.asgi), requests that can solve are
+# limited to ASGI_SOLVE_CONCURRENCY at once with ASGI_SOLVE_QUEUE waiting, more
+# get a 429 to retry after ASGI_RETRY_AFTER seconds, and other requests are
+# limited to ASGI_CONCURRENCY at once
+ASGI_CONCURRENCY = _int("CONDA_PARSER_ASGI_CONCURRENCY", 32)
+ASGI_SOLVE_CONCURRENCY = _int("CONDA_PARSER_ASGI_SOLVE_CONCURRENCY", SOLVER_WORKERS)
+ASGI_SOLVE_QUEUE = _int("CONDA_PARSER_ASGI_SOLVE_QUEUE", 32)
+ASGI_RETRY_AFTER = _int("CONDA_PARSER_ASGI_RETRY_AFTER", 30)
+
+# Channels whose repodata is loaded by the gunicorn master before forking,
+# and how often workers refresh it in the background (0 to never refresh)
+PRELOAD_CHANNELS = _list(
+    "CONDA_PARSER_PRELOAD_CHANNELS", "defaults,anaconda,conda-forge"
+)
+REPODATA_REFRESH = _int("CONDA_PARSER_REPODATA_REFRESH", 3600)
+
+# Seconds between workers' tries at loading repodata the master couldn't
+REPODATA_RETRY = _int("CONDA_PARSER_REPODATA_RETRY", 60)
+
+# Directory of compact indexes built by `python -m conda_parser.compact`,
+# channels with one are looked up in it instead of loading their repodata
+COMPACT_INDEX_DIR = os.environ.get("CONDA_PARSER_COMPACT_INDEX_DIR")
+
+# Parsed spec strings kept per worker, and parsed pip requirement strings
+SPEC_CACHE_SIZE = _int("CONDA_PARSER_SPEC_CACHE_SIZE", 100000)
+PIP_CACHE_SIZE = _int("CONDA_PARSER_PIP_CACHE_SIZE", 100000)
+
+# Manifest-only /parse results kept per worker, keyed on a hash of the file
+PARSE_CACHE_SIZE = _int("CONDA_PARSER_PARSE_CACHE_SIZE", 10000)
+
+# Solved lockfiles kept per worker, so a /parse can name one as its previous
+# lockfile, they're also kept in the SQLite file if SOLVE_CACHE_PATH is set,
+# and how many distinct lockfile entries and depends they share between them
+LOCKFILE_CACHE_SIZE = _int("CONDA_PARSER_LOCKFILE_CACHE_SIZE", 10000)
+LOCKFILE_SHARED_SIZE = _int("CONDA_PARSER_LOCKFILE_SHARED_SIZE", 100000)
+
+# Largest request body accepted, in bytes, bigger ones are answered 413
+MAX_CONTENT_LENGTH = _int("CONDA_PARSER_MAX_CONTENT_LENGTH", 64 * 1024 * 1024)
+
+# Limits on environment files: their size in bytes, how many values the kept
+# keys can have once aliases are expanded, and how deeply they can nest
+MAX_FILE_SIZE = _int("CONDA_PARSER_MAX_FILE_SIZE", 1024 * 1024)
+MAX_YAML_NODES = _int("CONDA_PARSER_MAX_YAML_NODES", 100000)
+MAX_YAML_DEPTH = _int("CONDA_PARSER_MAX_YAML_DEPTH", 32)
+
+# Directory each gunicorn worker writes its metrics to, at most every
+# METRICS_FLUSH seconds, so /metrics adds up every worker's (unset for just
+# the worker answering the scrape)
+METRICS_DIR = os.environ.get("CONDA_PARSER_METRICS_DIR")
+METRICS_FLUSH = _int("CONDA_PARSER_METRICS_FLUSH", 1)
+
+# Directory to write profiles of slow requests to (unset to never profile).
+# Requests slower than PROFILE_THRESHOLD seconds are sampled every
+# PROFILE_INTERVAL milliseconds, and those with the PROFILE_HEADER header set
+# to PROFILE_TOKEN are run under cProfile (never without a token). The newest
+# PROFILE_KEEP profiles are kept.
+PROFILE_DIR = os.environ.get("CONDA_PARSER_PROFILE_DIR")
+PROFILE_THRESHOLD = _int("CONDA_PARSER_PROFILE_THRESHOLD", 30)
+PROFILE_INTERVAL = _int("CONDA_PARSER_PROFILE_INTERVAL", 10)
+PROFILE_KEEP = _int("CONDA_PARSER_PROFILE_KEEP", 100)
+PROFILE_HEADER = os.environ.get("CONDA_PARSER_PROFILE_HEADER", "X-Conda-Parser-Profile")
+PROFILE_TOKEN = os.environ.get("CONDA_PARSER_PROFILE_TOKEN")
+
+# A local mirror of the channels' repodata, synced by
+# `python -m conda_parser.mirror`, channel names resolve to it so solves
+# don't use the network (unset to use the network channels)
+MIRROR_DIR = os.environ.get("CONDA_PARSER_MIRROR_DIR")
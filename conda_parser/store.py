@@ -0,0 +1,61 @@
+"""
+Content addressed storage for solved lockfiles. Lockfiles overlap a lot, the
+same python, openssl, ncurses and readline turn up in nearly every one, so
+each (name, requirement) entry is kept once in memory and shared by every
+lockfile that has it, and each lockfile is kept once, as a sorted set of
+entries under its lockfile_digest, however many solves return it.
+"""
+import typing
+
+from .cache import LRUCache, TieredCache, digest
+
+
+class LockfileStore:
+    """
+    Lockfiles by their lockfile_digest, in `cache`, with their entries, and
+    any other tuples passed to `share`, deduplicated through `shared`
+    """
+
+    def __init__(self, cache: TieredCache, shared: LRUCache):
+        self.cache = cache
+        self.shared = shared
+
+    def share(self, value: tuple) -> tuple:
+        """ The one copy of an equal tuple kept so far, or this one """
+        kept = self.shared.get(value)
+        if kept is None:
+            self.shared.set(value, value)
+            return value
+        return kept
+
+    def put(self, lockfile: typing.Iterable[dict]) -> str:
+        """ Keeps the lockfile, if it isn't kept already, returns its digest """
+        entries = sorted(
+            self.share((entry["name"], entry["requirement"])) for entry in lockfile
+        )
+        key = digest(entries)
+        if key not in self.cache.memory:
+            self.cache.set(key, entries)
+        return key
+
+    def get(self, key: str) -> typing.Optional[list]:
+        """ The lockfile with this digest, as {"name", "requirement"} entries """
+        entries = self.cache.memory.get(key)
+        if entries is None and self.cache.disk is not None:
+            # entries read back from disk are lists, share them again
+            entries = self.cache.disk.get(key)
+            if entries is not None:
+                entries = [self.share(tuple(entry)) for entry in entries]
+                self.cache.memory.set(key, entries)
+        if entries is None:
+            return None
+        return [
+            {"name": name, "requirement": requirement} for name, requirement in entries
+        ]
+
+    def clear(self) -> None:
+        self.cache.clear()
+        self.shared.clear()
+
+    def stats(self) -> dict:
+        return dict(self.cache.stats(), shared=self.shared.stats())
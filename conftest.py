@@ -1,10 +1,84 @@
 # conftest.py - This is used to configure pytest to have a fixture for the Flask App
 import pytest
 
-from conda_parser import create_app
+from benchmarks.channel import write_channel
+from conda_parser import create_app, mirror
+from conda_parser.executor import shutdown_platform_executors
+from conda_parser.index import clear_indexes
+from conda_parser.info import PACKAGE_CACHE
+from conda_parser.metrics import METRICS_STORE
+from conda_parser.parse import (
+    LOCKFILES,
+    PARSE_CACHE,
+    PIP_CACHE,
+    SOLVE_CACHE,
+    SPEC_CACHE,
+)
+from conda.base.context import context, reset_context
 from conda.models.records import PackageRecord
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """ Every test gets to solve from scratch """
+    SOLVE_CACHE.clear()
+    SPEC_CACHE.clear()
+    PIP_CACHE.clear()
+    PARSE_CACHE.clear()
+    LOCKFILES.clear()
+    PACKAGE_CACHE.clear()
+    METRICS_STORE.clear()
+    clear_indexes()
+
+
+def fake_record(name, version):
+    return PackageRecord(
+        name=name,
+        version=version,
+        build="0",
+        build_number=0,
+        channel="https://repo.anaconda.com/pkgs/main/linux-64",
+        subdir="linux-64",
+        fn=f"{name}-{version}-0.tar.bz2",
+    )
+
+
+@pytest.fixture(autouse=True)
+def fake_channels(mocker, fake_numpy_deps, fake_sqlite_deps):
+    """ Tests never download repodata, every channel has the numpy and sqlite deps """
+    records = [
+        fake_record(dep["name"], dep["version"])
+        for dep in fake_numpy_deps() + fake_sqlite_deps()
+    ]
+    return mocker.patch(
+        "conda_parser.index.ChannelIndex._load_records", return_value=records
+    )
+
+
+@pytest.fixture
+def local_mirror(mocker, tmp_path, monkeypatch):
+    """
+    A generated channel mirror, which conda solves against for real, with
+    different packages for this platform, osx-64 and win-64
+    """
+    mocker.stopall()  # no fake_channels, the index reads the mirror
+    subdirs = dict.fromkeys((context.subdir, "osx-64", "win-64"))
+    for seed, subdir in enumerate(subdirs):
+        for channel in ("pkgs/main", "conda-forge"):
+            write_channel(str(tmp_path), channel, subdir, packages=20, seed=seed)
+    for name in ("CONDA_CHANNEL_ALIAS", "CONDA_DEFAULT_CHANNELS", "CONDA_OFFLINE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("CONDA_PKGS_DIRS", str(tmp_path / "package-cache"))
+    monkeypatch.setattr(mirror, "_root", None)
+
+    mirror.configure(str(tmp_path))
+    yield tmp_path
+    # their processes were started pointed at this mirror
+    shutdown_platform_executors()
+    monkeypatch.undo()
+    reset_context()
+
+
 @pytest.fixture
 def app():
     app = create_app()
@@ -121,6 +195,15 @@ def solved_urllib3():
     return lambda: fake
 
 
+@pytest.fixture
+def urllib3_index(mocker, solved_urllib3):
+    """ Channel indexes load the urllib3 records rather than real repodata """
+    return mocker.patch(
+        "conda_parser.index.ChannelIndex._load_records",
+        side_effect=lambda refresh=False: solved_urllib3(),
+    )
+
+
 @pytest.fixture
 def expected_result_urllib3():
     return {
@@ -0,0 +1,29 @@
+# gunicorn.conf.py - loads the app, the modules it imports lazily, and
+# repodata, once in the master so the forked workers share them, then
+# refreshes repodata in each worker. Metrics files from the last run are
+# removed, so counters start again from zero
+import os
+
+import conda_parser
+from conda_parser import index, metrics
+
+preload_app = True
+preload_repodata = os.environ.get("CONDA_PARSER_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    metrics.clear_directory()
+    if os.environ.get("CONDA_PARSER_PRELOAD_IMPORTS", "1") == "1":
+        conda_parser.preload_imports()
+    if preload_repodata:
+        try:
+            index.preload()
+        except Exception:
+            # the workers keep trying, /ready is a 503 until they manage it
+            server.log.exception("Preloading repodata failed")
+    metrics.flush()
+
+
+def post_fork(server, worker):
+    metrics.after_fork()
+    index.start_refresher(retry=preload_repodata)
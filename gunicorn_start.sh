@@ -3,7 +3,14 @@
 # Default port 5000 if unset env variable.
 if [ -z ${PORT+x} ]; then PORT=5000; else echo "PORT is set to '$PORT'"; fi
 
-gunicorn --bind 0.0.0.0:$PORT \
+# Every worker writes its metrics here, so /metrics can add them all up
+export CONDA_PARSER_METRICS_DIR=${CONDA_PARSER_METRICS_DIR:-/tmp/conda_parser_metrics}
+
+# Jobs, lockfiles and solves are shared here, so any worker can answer a poll
+export CONDA_PARSER_SOLVE_CACHE_PATH=${CONDA_PARSER_SOLVE_CACHE_PATH:-/tmp/conda_parser_cache.db}
+
+gunicorn --config gunicorn.conf.py \
+  --bind 0.0.0.0:$PORT \
   --bind unix:/app/conda_parser.sock \
   --error-logfile - \
   --timeout=3600\
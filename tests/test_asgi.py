@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+import urllib.parse
+
+from conda_parser.frontend import ASGIApp, is_solve, read_body, wsgi_environ
+
+FORM = "application/x-www-form-urlencoded"
+
+
+async def call(app, method, path, query="", body=b"", content_type=FORM):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(b"content-type", content_type.encode())],
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    headers = {k.decode(): v.decode() for k, v in sent[0]["headers"]}
+    return sent[0]["status"], headers, b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def _form(filename, file):
+    return urllib.parse.urlencode({"filename": filename, "file": file}).encode()
+
+
+def test_asgi_parse(app):
+    with open("tests/fixtures/just_numpy.yml") as f:
+        body = _form("environment.yml", f.read())
+
+    status, headers, data = asyncio.run(call(ASGIApp(app), "POST", "/parse", "", body))
+
+    assert status == 200
+    assert headers["content-type"] == "application/json"
+    assert json.loads(data)["manifest"] == [{"name": "numpy", "requirement": "1.16.4"}]
+
+
+def test_asgi_sheds_solves():
+    started, release = threading.Event(), threading.Event()
+
+    def wsgi_app(environ, start_response):
+        if "force_solve" in environ["QUERY_STRING"]:
+            started.set()
+            release.wait(10)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"OK"]
+
+    app = ASGIApp(wsgi_app, concurrency=2, solve_concurrency=1, solve_queue=0)
+    body = _form("environment.yml", "dependencies: [numpy]")
+
+    async def run():
+        solving = asyncio.ensure_future(
+            call(app, "POST", "/parse", "force_solve=1", body)
+        )
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 10)
+
+        status, headers, data = await call(app, "POST", "/parse", "force_solve=1", body)
+        assert status == 429
+        assert headers["retry-after"] == "30"
+        assert json.loads(data)["error"] == 429
+
+        # requests that don't solve aren't held up
+        assert (await call(app, "POST", "/parse", "", body))[0] == 200
+        assert (await call(app, "GET", "/"))[0] == 200
+
+        release.set()
+        assert (await solving)[0] == 200
+
+    asyncio.run(run())
+
+
+def test_is_solve():
+    def environ(path, query="", filename="environment.yml"):
+        body = _form(filename, "dependencies: [numpy]")
+        scope = {
+            "method": "POST",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": [(b"content-type", FORM.encode())],
+        }
+        return wsgi_environ(scope, body)
+
+    assert not is_solve(environ("/parse"))
+    assert is_solve(environ("/parse", "force_solve=1"))
+    assert is_solve(environ("/parse", "platforms=osx-64"))
+    assert is_solve(environ("/parse", filename="environment.yml.lock"))
+    assert not is_solve(environ("/parse", "force_solve=1&async=1"))
+    assert not is_solve(environ("/package", "name=numpy"))
+    assert is_solve(environ("/package", "name=numpy&solve=1"))
+    assert not is_solve(environ("/stats", "force_solve=1"))
+
+    # the form is still there for the Flask app
+    solve = environ("/parse", "force_solve=1")
+    is_solve(solve)
+    assert solve["wsgi.input"].read() == _form(
+        "environment.yml", "dependencies: [numpy]"
+    )
+
+
+def test_asgi_too_large():
+    called = []
+
+    def wsgi_app(environ, start_response):
+        called.append(environ)
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"OK"]
+
+    app = ASGIApp(wsgi_app, max_content_length=10)
+    status, headers, data = asyncio.run(call(app, "POST", "/parse", "", b"x" * 11))
+
+    assert status == 413
+    assert json.loads(data)["error"] == 413
+    assert not called
+    assert asyncio.run(call(app, "POST", "/parse", "", b"x" * 10))[0] == 200
+
+
+def test_read_body_stops_reading():
+    received = []
+
+    async def receive():
+        received.append(1)
+        return {"type": "http.request", "body": b"x" * 4, "more_body": True}
+
+    scope = {"headers": []}
+    assert asyncio.run(read_body(scope, receive, 10)) is None
+    assert len(received) == 3
+
+    # or doesn't start, when the content-length says it's too large
+    scope = {"headers": [(b"content-length", b"11")]}
+    assert asyncio.run(read_body(scope, receive, 10)) is None
+    assert len(received) == 3
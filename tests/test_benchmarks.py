@@ -0,0 +1,39 @@
+from benchmarks.channel import environment_file, package_names, repodata
+from benchmarks.harness import compare, measure, summarize
+
+
+def test_summarize():
+    result = summarize([0.004, 0.001, 0.003, 0.002], 1024)
+
+    assert result["iterations"] == 4
+    assert result["throughput"] == 400.0
+    assert result["p50_ms"] == 2.0
+    assert result["p99_ms"] == result["max_ms"] == 4.0
+    assert result["peak_memory"] == 1024
+
+
+def test_measure():
+    calls = []
+    result = measure(lambda: calls.append([0] * 1000), iterations=5, warmup=2)
+
+    assert len(calls) == 8  # warmup, timed, and the tracemalloc run
+    assert result["iterations"] == 5
+    assert result["peak_memory"] > 0
+
+
+def test_compare():
+    baseline = {"parse": summarize([0.010], 1000), "gone": summarize([1.0], 1)}
+    results = {"parse": summarize([0.011], 2000), "new": summarize([0.001], 1)}
+
+    assert compare(baseline, results, 0.25) == [("parse", "peak_memory", 1000, 2000)]
+
+
+def test_channel_is_reproducible():
+    assert repodata("linux-64") == repodata("linux-64")
+    assert len(repodata("linux-64", packages=10, versions=2)["packages"]) == 20
+
+
+def test_environment_file():
+    body = environment_file(package_names(3), channels=["conda-forge"])
+    assert "  - bench-0001 >=1.0\n" in body
+    assert "  - conda-forge\n" in body
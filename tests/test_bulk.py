@@ -0,0 +1,110 @@
+import io
+import json
+import tarfile
+
+from conda_parser import bulk
+from conda_parser.exceptions import SolveFailed
+from conda_parser.parse import parse_environment
+
+
+def _files(count):
+    return [
+        (f"env-{i}.yml", f"dependencies:\n  - numpy >={i}\n  - python\n")
+        for i in range(count)
+    ]
+
+
+def test_iter_directory(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "environment.yaml").write_text("dependencies: [numpy]")
+    (tmp_path / "environment.yml").write_text("dependencies: [python]")
+    (tmp_path / "README.md").write_text("not an environment")
+
+    assert list(bulk.iter_directory(str(tmp_path))) == [
+        ("environment.yml", b"dependencies: [python]"),
+        ("sub/environment.yaml", b"dependencies: [numpy]"),
+    ]
+
+
+def test_iter_tarball(tmp_path):
+    path = str(tmp_path / "environments.tar.gz")
+    with tarfile.open(path, "w:gz") as archive:
+        for name, body in (("a/environment.yml", b"x"), ("a/setup.py", b"y")):
+            member = tarfile.TarInfo(name)
+            member.size = len(body)
+            archive.addfile(member, io.BytesIO(body))
+
+    assert list(bulk.iter_tarball(path)) == [("a/environment.yml", b"x")]
+
+
+def test_parse_files():
+    files = _files(10)
+    expected = [(name, parse_environment(name, body)) for name, body in files]
+
+    assert list(bulk.parse_files(files, workers=2, chunk_size=3)) == expected
+    assert list(bulk.parse_files(files, workers=0)) == expected
+
+    unordered = bulk.parse_files(files, workers=2, chunk_size=1, ordered=False)
+    assert sorted(unordered) == sorted(expected)
+
+
+def test_parse_chunk_errors(mocker):
+    """ a file that fails is that file's error, the rest are still parsed """
+    parse = mocker.patch("conda_parser.bulk.parse_environment")
+    parse.side_effect = [
+        SolveFailed("Solve timed out after 1 seconds"),
+        ValueError("unexpected"),
+        {"manifest": []},
+    ]
+
+    assert bulk.parse_chunk(_files(3)) == [
+        ("env-0.yml", {"error": "Solving failed: Solve timed out after 1 seconds"}),
+        ("env-1.yml", {"error": "ValueError: unexpected"}),
+        ("env-2.yml", {"manifest": []}),
+    ]
+
+
+def test_main_ndjson_invalid_lines(monkeypatch, capsys):
+    """ a line that can't be read is an error, the lines around it are parsed """
+    good = [json.dumps({"filename": n, "file": b}) for n, b in _files(2)]
+    lines = [good[0], "{not json", '["x"]', good[1]]
+    monkeypatch.setattr("sys.stdin", io.StringIO("\n".join(lines) + "\n"))
+
+    bulk.main(["-", "--workers", "0"])
+    captured = capsys.readouterr()
+    results = [json.loads(line) for line in captured.out.splitlines()]
+
+    assert [r["filename"] for r in results] == [
+        "env-0.yml",
+        "<line 2>",
+        "<line 3>",
+        "env-1.yml",
+    ]
+    assert results[1]["result"] == {
+        "error": 'Line 2 isn\'t a {"filename", "file"} object'
+    }
+    assert "manifest" in results[3]["result"]
+    assert "parsed 4 files (2 errors)" in captured.err
+
+
+def test_main_ndjson(monkeypatch, capsys):
+    lines = [json.dumps({"filename": n, "file": b}) for n, b in _files(3)]
+    lines.append(json.dumps({"filename": "README.md", "file": "text"}))
+    monkeypatch.setattr("sys.stdin", io.StringIO("\n".join(lines) + "\n"))
+
+    bulk.main(["-", "--workers", "0"])
+    captured = capsys.readouterr()
+    results = [json.loads(line) for line in captured.out.splitlines()]
+
+    assert [r["filename"] for r in results] == [
+        "env-0.yml",
+        "env-1.yml",
+        "env-2.yml",
+        "README.md",
+    ]
+    assert results[1]["result"]["manifest"][0] == {
+        "name": "numpy",
+        "requirement": ">=1",
+    }
+    assert "error" in results[3]["result"]
+    assert "parsed 4 files (1 errors)" in captured.err
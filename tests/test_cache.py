@@ -0,0 +1,106 @@
+import threading
+import time
+
+from conda_parser.cache import LRUCache, SingleFlight, SQLiteCache, TieredCache, digest
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a is now the most recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 2,
+        "misses": 1,
+        "evictions": 1,
+        "expirations": 0,
+    }
+
+
+def test_lru_cache_contains():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert "a" in cache
+    assert "c" not in cache
+    cache.set("c", 3)
+
+    # `in` didn't make a the most recently used, or count as a hit or miss
+    assert "a" not in cache
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+
+
+def test_lru_cache_ttl(mocker):
+    clock = mocker.patch("time.monotonic", return_value=100.0)
+    cache = LRUCache(ttl=10)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    clock.return_value = 110.0
+    assert "a" not in cache
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_sqlite_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), maxsize=2)
+    cache.set("a", {"lockfile": [{"name": "numpy", "requirement": "1.16.4"}]})
+    cache.set("b", {"lockfile": []})
+    cache.set("c", {"lockfile": []})
+
+    assert cache.get("a") is None
+    assert cache.get("c") == {"lockfile": []}
+    assert cache.stats()["evictions"] == 1
+
+    # another worker opening the same file sees the same entries
+    assert SQLiteCache(str(tmp_path / "cache.db")).get("b") == {"lockfile": []}
+
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.db"))
+    disk.set("a", [1, 2])
+    cache = TieredCache(LRUCache(), disk)
+
+    assert cache.get("a") == [1, 2]
+    assert cache.memory.get("a") == [1, 2]
+
+
+def test_digest_is_stable():
+    assert digest(["numpy"], {"b": 1, "a": 2}) == digest(["numpy"], {"a": 2, "b": 1})
+    assert digest(["numpy"]) != digest(["scipy"])
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def slow_lookup(name):
+        calls.append(name)
+        started.set()
+        time.sleep(0.1)
+        return {"name": name}
+
+    results = []
+
+    def worker():
+        results.append(flight.do("numpy", slow_lookup, "numpy"))
+
+    threads = [threading.Thread(target=worker)]
+    threads[0].start()
+    started.wait()
+    threads += [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["numpy"]
+    assert results == [{"name": "numpy"}] * 4
+    assert flight.coalesced == 3
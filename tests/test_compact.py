@@ -0,0 +1,46 @@
+from conda_parser.compact import CompactChannelIndex, CompactIndex, write_index
+from conda_parser.index import get_index
+
+from conftest import fake_record
+
+
+def _numpy_records():
+    return [
+        dict(fake_record("numpy", version).dump(), depends=["python >=3.6"])
+        for version in ["1.9.3", "1.16.4", "1.10.0"]
+    ] + [fake_record("python", "3.7.4")]
+
+
+def test_compact_index_round_trip(tmp_path):
+    path = str(tmp_path / "linux-64.idx")
+    write_index(path, _numpy_records(), signature="abc")
+    index = CompactIndex(path)
+
+    assert index.signature == "abc"
+    record = index.record("numpy", index._rows("numpy")[0])
+    assert record["version"] == "1.16.4"
+    assert record["depends"] == ["python >=3.6"]
+    assert record["fn"] == "numpy-1.16.4-0.tar.bz2"
+    assert list(index._rows("scipy")) == []
+
+
+def test_compact_channel_index_query(tmp_path, mocker):
+    write_index(str(tmp_path / "linux-64.idx"), _numpy_records())
+    mocker.patch.object(
+        CompactChannelIndex, "paths", return_value=[str(tmp_path / "linux-64.idx")]
+    )
+    index = CompactChannelIndex("defaults", directory=str(tmp_path))
+
+    assert index.query("numpy").version == "1.16.4"
+    assert index.query("numpy <1.10").version == "1.9.3"
+    assert index.query("numpy 1.10.0 0").version == "1.10.0"
+    assert index.query("numpy 1.10.0 py27_0") is None
+    assert index.query("python").version == "3.7.4"
+    assert index.query("scipy") is None
+
+
+def test_get_index_uses_compact_indexes(tmp_path, mocker):
+    mocker.patch("conda_parser.settings.COMPACT_INDEX_DIR", str(tmp_path))
+    mocker.patch.object(CompactChannelIndex, "exists", return_value=True)
+
+    assert isinstance(get_index("conda-forge"), CompactChannelIndex)
@@ -1,14 +1,29 @@
+import json
+
+import pytest
+
+from conda_parser import executor, index
 from conda_parser.parse import (
     FILTER_KEYS,
+    PARSE_CACHE,
+    SOLVE_CACHE,
     supported_filename,
     parse_environment,
     clean_out_pip,
     read_environment,
     solve_environment,
     clean_channels,
+    dependency_graph,
+    fast_parse_spec,
+    find_bad_specs,
+    locked_pins,
+    lockfile_diff,
+    match_pip,
     match_specs,
 )
 
+from conda.models.match_spec import MatchSpec
+
 
 def test_supported_filename_good():
     """ Testing that yml and yaml are good filetypes """
@@ -73,6 +88,23 @@ def test_parse_environment_errors_no_dependencies():
     assert parsed["error"] == "No `dependencies:` in your no_dependencies.yml"
 
 
+def test_parse_environment_cached(mocker):
+    with open("tests/fixtures/just_numpy.yml", "rb") as f:
+        body = f.read()
+    read = mocker.patch(
+        "conda_parser.parse.read_environment", side_effect=read_environment
+    )
+
+    first = parse_environment("just_numpy.yml", body)
+    assert parse_environment("environment.yml", body) == first
+    assert parse_environment("environment.yml", body.decode("utf-8")) == first
+    assert read.call_count == 1
+    assert PARSE_CACHE.stats()["hits"] == 2
+
+    parse_environment("just_numpy.yml", body + b"\n")
+    assert read.call_count == 2
+
+
 def test_solve_environment(mocker, fake_sqlite_deps):
     """ testing parsing POST """
     mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_sqlite_deps)
@@ -82,6 +114,177 @@ def test_solve_environment(mocker, fake_sqlite_deps):
     assert {"name": "ncurses", "requirement": "6.1"} in sqlite_dependencies
 
 
+def test_solve_environment_cached(mocker, fake_sqlite_deps):
+    """ testing a repeat solve comes out of the cache """
+    solve = mocker.patch(
+        "conda.api.Solver.solve_final_state", side_effect=fake_sqlite_deps
+    )
+    environment = {"channels": ["conda-forge"], "dependencies": [{"name": "sqlite"}]}
+
+    first = solve_environment(environment)
+    second = solve_environment(environment)
+
+    assert first == second
+    assert solve.call_count == 1
+    assert SOLVE_CACHE.stats()["memory"]["hits"] == 1
+
+
+def test_solve_environment_cached_across_loads(mocker, fake_channels, fake_sqlite_deps):
+    """ loading the same repodata again, eg: in another worker, keeps the key """
+    solve = mocker.patch(
+        "conda.api.Solver.solve_final_state", side_effect=fake_sqlite_deps
+    )
+    environment = {"channels": ["conda-forge"], "dependencies": [{"name": "sqlite"}]}
+
+    index.preload(["conda-forge"])
+    solve_environment(environment)
+    mocker.patch("time.time", return_value=2000000000.0)
+    index.preload(["conda-forge"], refresh=True)
+    solve_environment(environment)
+    assert solve.call_count == 1
+
+    # new repodata is solved again
+    fake_channels.return_value = fake_channels.return_value[1:]
+    index.preload(["conda-forge"], refresh=True)
+    solve_environment(environment)
+    assert solve.call_count == 2
+
+
+def test_solve_environment_bad_specs(mocker, fake_sqlite_deps):
+    """ testing specs with no packages are left out of the solve """
+    solve = mocker.patch("conda_parser.executor.Solver", autospec=True)
+    solve.return_value.solve_final_state.side_effect = fake_sqlite_deps
+
+    sqlite_dependencies, bad_specs = solve_environment(
+        {
+            "channels": ["conda-forge"],
+            "dependencies": [{"name": "sqlite"}, {"name": "whoami"}],
+        }
+    )
+
+    assert bad_specs == ["whoami"]
+    assert solve.call_args[1]["specs_to_add"] == ["sqlite"]
+
+
+def test_solve_environment_subdir(mocker, fake_sqlite_deps):
+    # solved in this process, so the mocked Solver is used
+    mocker.patch(
+        "conda_parser.executor.get_platform_executor",
+        return_value=executor.InProcessSolverExecutor(),
+    )
+    solve = mocker.patch("conda_parser.executor.Solver", autospec=True)
+    solve.return_value.solve_final_state.side_effect = fake_sqlite_deps
+    environment = {"channels": ["conda-forge"], "dependencies": [{"name": "sqlite"}]}
+
+    osx, _ = solve_environment(environment, "osx-64")
+    win, _ = solve_environment(environment, "win-64")
+
+    assert osx == win
+    assert solve.call_count == 2  # not the other platform's cached solve
+    assert solve.call_args[1]["subdirs"] == ("win-64", "noarch")
+
+
+BENCH_ENVIRONMENT = """
+channels:
+  - conda-forge
+dependencies:
+  - bench-0010 >=1.0
+  - bench-0015
+  - not-mirrored
+"""
+
+
+def test_parse_environment_platforms(local_mirror):
+    result = parse_environment(
+        "environment.yml", BENCH_ENVIRONMENT, platforms=["osx-64", "win-64", "osx-64"]
+    )
+
+    assert "lockfile" not in result
+    assert list(result["lockfiles"]) == ["osx-64", "win-64"]
+    for lockfile in result["lockfiles"].values():
+        assert {"name": "bench-0010", "requirement": "4.0"} in lockfile
+    # the platforms' packages have different dependencies
+    assert result["lockfiles"]["osx-64"] != result["lockfiles"]["win-64"]
+    assert result["bad_specs"] == ["not-mirrored"]
+
+    # every platform's bad specs were found with the same noarch index
+    assert ("conda-forge", ("noarch",)) in index._indexes
+
+
+def test_parse_environment_platforms_virtual_packages(local_mirror):
+    """ other platforms are solved with their virtual packages, not this one's """
+    for subdir, virtual in (("osx-64", "__osx >=10.9"), ("win-64", "__win")):
+        path = local_mirror / "conda-forge" / subdir / "repodata.json"
+        repodata = json.loads(path.read_text())
+        repodata["packages"]["needs-system-1.0-0.tar.bz2"] = dict(
+            repodata["packages"]["bench-0000-1.0-0.tar.bz2"],
+            name="needs-system",
+            depends=[virtual],
+        )
+        path.write_text(json.dumps(repodata))
+
+    result = parse_environment(
+        "environment.yml",
+        "channels: [conda-forge]\ndependencies: [needs-system]",
+        platforms=["osx-64", "win-64"],
+    )
+
+    for lockfile in result["lockfiles"].values():
+        assert lockfile == [{"name": "needs-system", "requirement": "1.0"}]
+
+
+def test_platform_environ(monkeypatch):
+    monkeypatch.setenv("CONDA_OVERRIDE_GLIBC", "2.17")
+
+    assert executor.platform_environ("osx-arm64") == {
+        "CONDA_SUBDIR": "osx-arm64",
+        "CONDA_OVERRIDE_OSX": "13.0",
+    }
+    assert executor.platform_environ("linux-aarch64")["CONDA_OVERRIDE_GLIBC"] == "2.17"
+
+
+def test_parse_environment_unknown_platform():
+    result = parse_environment(
+        "environment.yml", BENCH_ENVIRONMENT, platforms=["osx-64", "noarch", "amiga"]
+    )
+    assert result == {"error": "Unknown platform(s): noarch, amiga"}
+
+
+def test_find_bad_specs():
+    specs = ["numpy", "numpy 1.16.4", "numpy >=2", "whoami", "sqlite 3.29.0"]
+    assert find_bad_specs(["defaults", "nodefaults"], specs) == ["numpy >=2", "whoami"]
+
+
+def test_parse_environment_pip():
+    with open("tests/fixtures/with_pip.yml", "rb") as f:
+        result = parse_environment("with_pip.yml", f.read())
+
+    assert result["manifest"] == [{"name": "zlib", "requirement": "1.2.11"}]
+    assert result["pip"] == [
+        {
+            "name": "example",
+            "requirement": "",
+            "url": "git+https://github.com/librariesio/example.git@v1.0#egg=example",
+        },
+        {
+            "name": "requests",
+            "requirement": ">=2.8.1,<3",
+            "extras": ["security"],
+            "marker": 'python_version < "3.8"',
+        },
+        {"name": "werkzeug", "requirement": "==0.12.2"},
+    ]
+
+
+def test_match_pip_cached(mocker):
+    parse_requirement = mocker.patch(
+        "conda_parser.parse.parse_requirement", side_effect=[{"name": "six"}, None]
+    )
+    lines = ["six", "--no-deps", "six", "--no-deps"]
+    assert match_pip(lines) == [{"name": "six"}] * 2
+    assert parse_requirement.call_count == 2
+
+
 def test_clean_out_pip():
     """ testing removing pip from specs """
     specs = ["zlib=1.2.11=0", {"pip": ["werkzeug==0.12.2"]}]
@@ -107,6 +310,44 @@ def test_match_specs():
         assert (match_specs([testing])) == [expected]
 
 
+def test_fast_parse_spec_matches_matchspec():
+    """ the fast parser has to agree with MatchSpec for everything it parses """
+    fast = [
+        "numpy",
+        "ruamel.yaml",
+        "numpy 1.8.1",
+        "numpy==1.8.1",
+        "numpy ==1.8.1",
+        "python 3",
+        "numpy 1.8.*",
+        "numpy 1.8*",
+        "numpy 1.8.1 py27_0",
+        "numpy=1.8.1=py27_0",
+        "scikit-learn=0.21.2=py37hd81dba3_0",
+        "numpy=1.8",
+        "python=3.7.4",
+        "numpy >=1.8",
+        "numpy>=1.8",
+        "numpy >=1.8,<2",
+        "openssl >1.0,<=1.1.1",
+    ]
+    for dep in fast:
+        spec = MatchSpec(dep)
+        assert fast_parse_spec(dep) == (str(spec.name), str(spec.version or ""))
+
+    # these are left to MatchSpec
+    for dep in ["numpy 1.8|1.8*", "PyYAML", "numpy[version='>=1.8']", "numpy !=1.8"]:
+        assert fast_parse_spec(dep) is None
+
+
+def test_match_specs_cached(mocker):
+    parse_spec = mocker.patch(
+        "conda_parser.parse.parse_spec", return_value=("numpy", "")
+    )
+    assert match_specs(["numpy", "numpy"]) == [{"name": "numpy", "requirement": ""}] * 2
+    assert parse_spec.call_count == 1
+
+
 def test_clean_channels():
     inputs = [
         (["defaults", "anaconda"], ["defaults", "anaconda"]),
@@ -118,3 +359,141 @@ def test_clean_channels():
 
     for _input, _output in inputs:
         assert clean_channels(_input) == _output
+
+
+def _bench_environment(*specs):
+    return {
+        "channels": ["conda-forge"],
+        "dependencies": [dict(zip(("name", "requirement"), s.split())) for s in specs],
+    }
+
+
+@pytest.fixture
+def previous_lockfile(local_mirror):
+    lockfile, _ = solve_environment(_bench_environment("bench-0003 2.0", "bench-0012"))
+    assert {"name": "bench-0003", "requirement": "2.0"} in lockfile
+    return lockfile
+
+
+def test_solve_environment_reuses_previous(mocker, previous_lockfile):
+    solve = mocker.spy(executor, "solve_final_state")
+
+    # bench-0003 isn't pinned anymore, but 2.0 still satisfies it
+    lockfile, _ = solve_environment(
+        _bench_environment("bench-0003", "bench-0012"), previous=previous_lockfile
+    )
+    assert sorted(lockfile, key=str) == sorted(previous_lockfile, key=str)
+
+    # packages only bench-0012 needed are gone
+    lockfile, _ = solve_environment(
+        _bench_environment("bench-0003"), previous=previous_lockfile
+    )
+    assert {entry["name"] for entry in lockfile} == {
+        "bench-0000",
+        "bench-0001",
+        "bench-0002",
+        "bench-0003",
+    }
+    assert solve.call_count == 0
+
+
+def test_solve_environment_pinned_to_previous(mocker, previous_lockfile):
+    solve = mocker.spy(executor, "solve_final_state")
+
+    lockfile, _ = solve_environment(
+        _bench_environment("bench-0003", "bench-0012", "bench-0015"),
+        previous=previous_lockfile,
+    )
+
+    # a fresh solve would update bench-0003 to 4.0
+    assert lockfile_diff(previous_lockfile, lockfile) == {
+        "added": [{"name": "bench-0015", "requirement": "4.0"}],
+        "removed": [],
+        "changed": [],
+    }
+    assert solve.call_count == 1
+    assert "bench-0003 ==2.0" in solve.call_args[0][4]
+
+
+def test_solve_pinned_unsatisfiable(local_mirror):
+    # bench-0010 3.0 needs bench-0000 >=3, so the pin is dropped
+    records = executor.solve_final_state(
+        str(local_mirror / "env"),
+        ["conda-forge"],
+        ["bench-0010 3.0"],
+        pins=["bench-0000 ==1.0"],
+    )
+    versions = {record["name"]: record["version"] for record in records}
+    assert versions["bench-0000"] == "4.0"
+
+
+def test_locked_pins():
+    locked = {"numpy": "1.16.4", "blas": "1.0", "mkl": "2019.4"}
+    pins = locked_pins(["numpy >=1.17", "mkl", "scipy"], locked)
+    assert pins == ["blas ==1.0", "mkl ==2019.4"]
+
+
+def test_lockfile_diff():
+    before = [
+        {"name": "numpy", "requirement": "1.16.4"},
+        {"name": "blas", "requirement": "1.0"},
+    ]
+    after = [
+        {"name": "numpy", "requirement": "1.17.0"},
+        {"name": "six", "requirement": "1.12.0"},
+    ]
+    assert lockfile_diff(before, after) == {
+        "added": [{"name": "six", "requirement": "1.12.0"}],
+        "removed": [{"name": "blas", "requirement": "1.0"}],
+        "changed": [{"name": "numpy", "previous": "1.16.4", "requirement": "1.17.0"}],
+    }
+
+
+def test_dependency_graph():
+    manifest = [{"name": "numpy", "requirement": ""}]
+    lockfile = [
+        {"name": "python", "requirement": "3.7.4"},
+        {"name": "numpy", "requirement": "1.16.4"},
+        {"name": "openssl", "requirement": "1.1.1c"},
+    ]
+    depends = {
+        "numpy": ["python >=3.7,<3.8.0a0", "__glibc >=2.17", "mkl >=2019.4"],
+        "python": ["openssl>=1.1.1c,<1.1.2a"],
+    }
+
+    assert dependency_graph(manifest, lockfile, depends) == {
+        "edges": [
+            {"from": "numpy", "to": "python", "spec": "python >=3.7,<3.8.0a0"},
+            {"from": "python", "to": "openssl", "spec": "openssl>=1.1.1c,<1.1.2a"},
+        ],
+        "packages": {
+            "numpy": {"direct": True, "required_by": []},
+            "openssl": {"direct": False, "required_by": ["python"]},
+            "python": {"direct": False, "required_by": ["numpy"]},
+        },
+    }
+
+
+def test_parse_environment_graph(local_mirror):
+    body = "channels: [conda-forge]\ndependencies: [bench-0003 2.0, bench-0012]\n"
+    result = parse_environment("environment.yml", body, force_solve=True, graph=True)
+    graph = result["graph"]
+
+    names = {entry["name"] for entry in result["lockfile"]}
+    assert set(graph["packages"]) == names
+    assert {n for n, p in graph["packages"].items() if p["direct"]} == {
+        "bench-0003",
+        "bench-0012",
+    }
+    # everything else is only there because something needs it
+    assert all(p["required_by"] or p["direct"] for p in graph["packages"].values())
+    assert graph["edges"]
+    for edge in graph["edges"]:
+        assert edge["spec"].startswith(edge["to"] + " ")
+        assert edge["from"] in graph["packages"][edge["to"]]["required_by"]
+
+    # reusing the lockfile, without a solve, gives the same graph
+    reused = parse_environment(
+        "environment.yml", body, True, previous=result["lockfile"], graph=True
+    )
+    assert reused["graph"] == graph
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from conda_parser.exceptions import PackageNotFound, SolveFailed
+from conda_parser.executor import ProcessSolverExecutor
+
+
+def test_process_executor_call():
+    executor = ProcessSolverExecutor(1, timeout=60, function=int)
+    try:
+        assert executor.call("42") == 42
+
+        # an exception in the solve fails it, but keeps the process
+        with pytest.raises(SolveFailed, match="ValueError"):
+            executor.call("not a number")
+        assert executor.replaced == 0
+    finally:
+        executor.shutdown()
+
+
+def test_process_executor_replaces_timed_out_process():
+    executor = ProcessSolverExecutor(1, timeout=3, function=time.sleep)
+    try:
+        with pytest.raises(SolveFailed, match="timed out after 3 seconds"):
+            executor.call(60)
+        assert executor.replaced == 1
+        assert executor._idle.get().process.is_alive()
+    finally:
+        executor.shutdown()
+
+
+def _not_found(spec):
+    raise PackageNotFound(f"\n  - {spec}")
+
+
+def test_process_executor_not_found():
+    executor = ProcessSolverExecutor(1, timeout=60, function=_not_found)
+    try:
+        with pytest.raises(PackageNotFound) as e:
+            executor.call("whoami")
+        assert str(e.value) == "\n  - whoami"
+        assert executor.replaced == 0
+    finally:
+        executor.shutdown()
+
+
+def test_process_executor_solves(local_mirror):
+    """ conda solves for real on the processes, eg: without detecting CUDA """
+    executor = ProcessSolverExecutor(1, timeout=300)
+    try:
+        records = executor.solve(
+            str(local_mirror / "env"), ["conda-forge"], ["bench-0010 3.0"]
+        )
+        versions = {record["name"]: record["version"] for record in records}
+        assert versions["bench-0010"] == "3.0"
+        assert executor.replaced == 0
+    finally:
+        executor.shutdown()
@@ -1,16 +1,36 @@
 import io
 import json
+import pstats
 
 import pytest
 
 from flask import url_for
 
+from conda_parser.exceptions import SolveFailed
+from conda_parser.index import preload
+from conda_parser.parse import lockfile_digest
+from conda_parser.profiling import Profiler
+
 
 def test_index(client):
     """ Sanity check """
     assert client.get(url_for("index")).status_code == 200
 
 
+def test_ready(client, fake_channels):
+    response = client.get(url_for("readiness"))
+    assert response.status == "503 SERVICE UNAVAILABLE"
+    assert json.loads(response.data)["ready"] == False
+
+    preload()
+    response = client.get(url_for("readiness"))
+    data = json.loads(response.data)
+
+    assert response.status == "200 OK"
+    assert set(data["channels"]) == {"defaults", "anaconda", "conda-forge"}
+    assert fake_channels.call_count == 3
+
+
 def _post_multipart(client, name, view="parse", force_solve=True):
     with open(name, "rb") as all_styles:
         data = {"file": (io.BytesIO(all_styles.read()), name)}
@@ -76,25 +96,180 @@ def test_parse_file_no_force_lockfile(client, mocker, fake_numpy_deps):
     assert {"name": "numpy-base", "requirement": "1.16.4"} in data["lockfile"]
 
 
-def test_parse_not_found_force(client, mocker, record_not_found):
+def test_parse_not_found_force(client, mocker, urllib3_index):
     """ testing parsing POST """
-    mocker.patch(
-        "conda.api.Solver.solve_final_state", side_effect=[record_not_found, []]
-    )
+    solve = mocker.patch("conda.api.Solver.solve_final_state", return_value=[])
 
     response = _post_urlencoded(client, "tests/fixtures/just_numpy.yml", "parse")
     assert response.status == "200 OK"
     assert json.loads(response.data) == {
-        "bad_specs": ["whoami -> ==1.25.3"],
+        "bad_specs": ["numpy 1.16.4"],
         "channels": ["anaconda", "defaults"],
         "lockfile": [],
+        "lockfile_digest": lockfile_digest([]),
         "manifest": [{"name": "numpy", "requirement": "1.16.4"}],
+        "pip": [],
     }
+    assert solve.call_count == 0  # there was nothing left to solve
 
 
-def test_package(client, mocker, solved_urllib3, expected_result_urllib3):
-    mocker.patch("conda.api.Solver.solve_final_state", side_effect=solved_urllib3)
+def test_parse_not_found_transitive(client, mocker, record_not_found):
+    """ a missing dependency of a dependency can't be left out """
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=record_not_found)
+
+    response = _post_urlencoded(client, "tests/fixtures/just_numpy.yml", "parse")
+    data = json.loads(response.data)
+
+    assert response.status == "404 NOT FOUND"
+    assert data["text"] == "Error: Package(s) not found: \n  - whoami -> ==1.25.3"
+
+
+def test_parse_ndjson(client, mocker, fake_numpy_deps):
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps)
+    with open("tests/fixtures/just_numpy.yml", "rb") as f:
+        data = {"file": (io.BytesIO(f.read()), "just_numpy.yml")}
+
+    response = client.post(
+        url_for("parse", force_solve=1),
+        data=data,
+        content_type="multipart/form-data",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status == "200 OK"
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.data.splitlines()]
+
+    assert lines[0] == {"manifest": {"name": "numpy", "requirement": "1.16.4"}}
+    assert lines[1] == {"lockfile": {"name": "blas", "requirement": "1.0"}}
+    assert len(lines) == 1 + len(fake_numpy_deps()) + 3
+    assert list(lines[-3]) == ["lockfile_digest"]
+    assert lines[-2] == {"channels": ["anaconda", "defaults"]}
+    assert lines[-1] == {"bad_specs": []}
+
+
+def test_parse_ndjson_error(client, mocker, record_not_found):
+    """ an error after the 200 is sent is the last line """
+    solve = mocker.patch("conda.api.Solver.solve_final_state")
+
+    def post():
+        return client.post(
+            url_for("parse", force_solve=1),
+            data={"filename": "environment.yml", "file": "dependencies: [numpy]"},
+            content_type="application/x-www-form-urlencoded",
+            headers={"Accept": "application/x-ndjson"},
+        )
+
+    solve.side_effect = record_not_found
+    response = post()
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert response.status == "200 OK"
+    assert lines[0] == {"manifest": {"name": "numpy", "requirement": ""}}
+    assert lines[-1] == {"error": "Package(s) not found: \n  - whoami -> ==1.25.3"}
+
+    solve.side_effect = SolveFailed("Solve timed out after 1 seconds")
+    lines = [json.loads(line) for line in post().data.splitlines()]
+    assert lines[-1] == {"error": "Solving failed: Solve timed out after 1 seconds"}
+
+
+def test_parse_batch_ndjson(client):
+    response = client.post(
+        url_for("parse_batch"),
+        json=[
+            {"filename": "environment.yml", "file": "dependencies: [numpy]"},
+            {"filename": "environment.yml", "file": "name: nothing"},
+        ],
+        headers={"Accept": "application/x-ndjson"},
+    )
+    lines = [json.loads(line) for line in response.data.splitlines()]
+
+    assert lines == [
+        {"index": 0, "manifest": {"name": "numpy", "requirement": ""}},
+        {"index": 0, "lockfile": None},
+        {"index": 0, "channels": ["defaults"]},
+        {"index": 0, "bad_specs": []},
+        {"index": 1, "error": "No `dependencies:` in your environment.yml"},
+    ]
+
+
+def test_parse_batch_invalid_items(client):
+    """ an item that isn't strings is that item's error, not the batch's """
+    response = client.post(
+        url_for("parse_batch"),
+        json=[
+            {"filename": "environment.yml", "file": ["dependencies: [numpy]"]},
+            {"filename": 1, "file": "dependencies: [numpy]"},
+            {"filename": "environment.yml", "file": 1},
+            {"filename": "environment.yml", "file": "dependencies: [numpy]"},
+        ],
+    )
+    assert response.status == "200 OK"
+
+    assert response.json[:3] == [
+        {"error": "`file` must be a string"},
+        {"error": "`filename` must be a string"},
+        {"error": "`file` must be a string"},
+    ]
+    assert response.json[3]["manifest"] == [{"name": "numpy", "requirement": ""}]
+
+
+def test_parse_too_large(app, client):
+    app.config["MAX_CONTENT_LENGTH"] = 10
+    response = client.post(
+        url_for("parse"),
+        data={"filename": "environment.yml", "file": "dependencies: [numpy]"},
+    )
+    assert response.status == "413 REQUEST ENTITY TOO LARGE"
+    assert response.json["error"] == 413
+
+
+def test_parse_batch_json(client, mocker, fake_numpy_deps):
+    solve = mocker.patch(
+        "conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps
+    )
+    with open("tests/fixtures/just_numpy.yml") as f:
+        just_numpy = f.read()
+
+    response = client.post(
+        url_for("parse_batch", force_solve=1),
+        json=[
+            {"filename": "environment.yml", "file": just_numpy},
+            {"filename": "README.md", "file": just_numpy},
+            {"filename": "environment.yml", "file": just_numpy},
+        ],
+    )
+    assert response.status == "200 OK"
+    data = json.loads(response.data)
 
+    assert len(data) == 3
+    assert {"name": "numpy-base", "requirement": "1.16.4"} in data[0]["lockfile"]
+    assert data[1] == {"error": "Please provide a `.yml` or `.yaml` environment file"}
+    assert data[2] == data[0]
+    assert solve.call_count == 1
+
+
+def test_parse_batch_multipart(client):
+    data = {"file": []}
+    for name in ["just_numpy.yml", "no_dependencies.yml"]:
+        with open(f"tests/fixtures/{name}", "rb") as f:
+            data["file"].append((io.BytesIO(f.read()), name))
+
+    response = client.post(
+        url_for("parse_batch"), data=data, content_type="multipart/form-data"
+    )
+    assert response.status == "200 OK"
+    data = json.loads(response.data)
+
+    assert data[0]["manifest"] == [{"name": "numpy", "requirement": "1.16.4"}]
+    assert data[0]["lockfile"] == None
+    assert data[1] == {"error": "No `dependencies:` in your no_dependencies.yml"}
+
+
+def test_parse_batch_bad_json(client):
+    response = client.post(url_for("parse_batch"), json={"file": "not a list"})
+    assert response.status == "400 BAD REQUEST"
+
+
+def test_package(client, urllib3_index, expected_result_urllib3):
     # name and channel
     response = client.get(
         url_for("package", channel="anaconda", name="urllib3"), follow_redirects=True
@@ -113,11 +288,60 @@ def test_package(client, mocker, solved_urllib3, expected_result_urllib3):
     data = json.loads(response.data)
 
     assert data == expected_result_urllib3
+    assert urllib3_index.call_count == 1  # the index is loaded once
 
 
-def test_package_download(client, mocker, solved_urllib3, expected_result_urllib3):
+def test_package_solve(client, mocker, solved_urllib3, expected_result_urllib3):
     mocker.patch("conda.api.Solver.solve_final_state", side_effect=solved_urllib3)
 
+    response = client.get(
+        url_for(
+            "package", channel="anaconda", name="urllib3", version="1.25.3", solve=True
+        ),
+        follow_redirects=True,
+    )
+    assert response.status == "200 OK"
+    data = json.loads(response.data)
+
+    assert data == expected_result_urllib3
+
+
+def test_package_cached(client, mocker, solved_urllib3):
+    solve = mocker.patch(
+        "conda.api.Solver.solve_final_state", side_effect=solved_urllib3
+    )
+
+    for _ in range(2):
+        response = client.get(
+            url_for("package", channel="anaconda", name="urllib3", solve=True)
+        )
+        assert response.status == "200 OK"
+
+    # the download redirect is served from the same cached record
+    response = client.get(
+        url_for("package", channel="anaconda", name="urllib3", download=True, solve=1)
+    )
+    assert response.location.endswith("urllib3-1.25.3-py36_0.tar.bz2")
+    assert solve.call_count == 1
+
+
+def test_package_cached_solve(client, mocker, urllib3_index, solved_urllib3):
+    """ an index lookup's cached record isn't returned for a solve """
+    solved = [dict(r.dump(), version="1.25.4") for r in solved_urllib3()]
+    solve = mocker.patch("conda_parser.executor.solve_final_state", return_value=solved)
+
+    response = client.get(url_for("package", channel="anaconda", name="urllib3"))
+    assert response.json["version"] == "1.25.3"
+    assert solve.call_count == 0
+
+    response = client.get(
+        url_for("package", channel="anaconda", name="urllib3", solve=1)
+    )
+    assert response.json["version"] == "1.25.4"
+    assert solve.call_count == 1
+
+
+def test_package_download(client, urllib3_index, expected_result_urllib3):
     # name and channel
     response = client.get(
         url_for("package", channel="anaconda", name="urllib3", download=True)
@@ -128,11 +352,25 @@ def test_package_download(client, mocker, solved_urllib3, expected_result_urllib
     )
 
 
-def test_package_error(client, mocker, record_not_found):
+def test_package_error(client, urllib3_index):
+    response = client.get(
+        url_for("package", channel="anaconda", name="whoami", version="1.25.3"),
+        follow_redirects=True,
+    )
+    data = json.loads(response.data)
+
+    assert response.status == "404 NOT FOUND"
+    assert data["error"] == 404
+    assert data["text"] == "Error: Package(s) not found: \n  - whoami==1.25.3"
+
+
+def test_package_solve_error(client, mocker, record_not_found):
     mocker.patch("conda.api.Solver.solve_final_state", side_effect=record_not_found)
 
     response = client.get(
-        url_for("package", channel="anaconda", name="whoami", version="1.25.3"),
+        url_for(
+            "package", channel="anaconda", name="whoami", version="1.25.3", solve=True
+        ),
         follow_redirects=True,
     )
     data = json.loads(response.data)
@@ -149,3 +387,245 @@ def test_missing_parameter(client):
     assert response.status == "404 NOT FOUND"
     assert data["error"] == 404
     assert data["text"] == "Error: Please provide a `name=` query parameter"
+
+
+def test_parse_etag(client):
+    with open("tests/fixtures/just_numpy.yml", "rb") as f:
+        body = f.read()
+
+    def post(headers=None):
+        data = {"file": (io.BytesIO(body), "just_numpy.yml")}
+        return client.post(
+            url_for("parse"),
+            data=data,
+            content_type="multipart/form-data",
+            headers=headers or {},
+        )
+
+    response = post()
+    assert response.status == "200 OK"
+    etag = response.headers["ETag"]
+
+    response = post({"If-None-Match": etag})
+    assert response.status == "304 NOT MODIFIED"
+    assert response.data == b""
+
+    response = post({"If-None-Match": '"something-else"'})
+    assert response.status == "200 OK"
+    assert response.headers["ETag"] == etag
+
+
+def test_parse_platforms(client, local_mirror):
+    response = client.post(
+        url_for("parse", platforms="osx-64,win-64"),
+        data={"filename": "environment.yml", "file": "dependencies: [bench-0003]"},
+        content_type="application/x-www-form-urlencoded",
+    )
+
+    assert response.status == "200 OK"
+    assert "ETag" not in response.headers
+    lockfiles = response.json["lockfiles"]
+    assert sorted(lockfiles) == ["osx-64", "win-64"]
+    assert {"name": "bench-0003", "requirement": "4.0"} in lockfiles["win-64"]
+
+
+def test_parse_platforms_ndjson(client, local_mirror):
+    response = client.post(
+        url_for("parse", platforms=["osx-64", "win-64"]),
+        data={"filename": "environment.yml", "file": "dependencies: [bench-0000]"},
+        content_type="application/x-www-form-urlencoded",
+        headers={"Accept": "application/x-ndjson"},
+    )
+
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    entry = {"name": "bench-0000", "requirement": "4.0"}
+    assert {"lockfiles": entry, "platform": "osx-64"} in lines
+    assert {"lockfiles": entry, "platform": "win-64"} in lines
+
+
+def test_parse_previous(client, local_mirror):
+    def post(body, **params):
+        data = {"filename": "environment.yml", "file": body}
+        data.update(params.pop("data", {}))
+        return client.post(
+            url_for("parse", force_solve=1, **params),
+            data=data,
+            content_type="application/x-www-form-urlencoded",
+        )
+
+    first = post("dependencies: [bench-0003 2.0, bench-0012]").json
+    assert "lockfile_diff" not in first
+
+    second = post(
+        "dependencies: [bench-0003, bench-0012, bench-0015]",
+        previous=first["lockfile_digest"],
+    ).json
+    assert second["lockfile_diff"] == {
+        "added": [{"name": "bench-0015", "requirement": "4.0"}],
+        "removed": [],
+        "changed": [],
+    }
+
+    # the same, posting the lockfile itself
+    previous = json.dumps(first["lockfile"])
+    third = post(
+        "dependencies: [bench-0003, bench-0012, bench-0015]",
+        data={"previous_lockfile": previous},
+    ).json
+    assert third == second
+
+
+def test_lockfile(client, local_mirror):
+    response = client.post(
+        url_for("parse", force_solve=1, refs=1),
+        data={"filename": "environment.yml", "file": "dependencies: [bench-0003]"},
+        content_type="application/x-www-form-urlencoded",
+    )
+    assert "lockfile" not in response.json
+    digest = response.json["lockfile_digest"]
+
+    response = client.get(url_for("lockfile", digest=digest))
+    assert response.status == "200 OK"
+    assert {"name": "bench-0003", "requirement": "4.0"} in response.json["lockfile"]
+    assert lockfile_digest(response.json["lockfile"]) == digest
+    assert response.headers["ETag"] == f'"{digest}"'
+    assert "public" in response.headers["Cache-Control"]
+
+    response = client.get(
+        url_for("lockfile", digest=digest), headers={"If-None-Match": f'"{digest}"'}
+    )
+    assert response.status == "304 NOT MODIFIED"
+
+    response = client.get(url_for("lockfile", digest="0" * 64))
+    assert response.status == "404 NOT FOUND"
+
+
+def test_parse_refs_platforms(client, local_mirror):
+    response = client.post(
+        url_for("parse", platforms="osx-64,win-64", refs=1),
+        data={"filename": "environment.yml", "file": "dependencies: [bench-0003]"},
+        content_type="application/x-www-form-urlencoded",
+        headers={"Accept": "application/x-ndjson"},
+    )
+    lines = [json.loads(line) for line in response.data.splitlines()]
+
+    assert not any("lockfiles" in line for line in lines)
+    [digests] = [
+        line["lockfile_digests"] for line in lines if "lockfile_digests" in line
+    ]
+    assert set(digests) == {"osx-64", "win-64"}
+    for digest in digests.values():
+        assert client.get(url_for("lockfile", digest=digest)).status == "200 OK"
+
+
+def test_parse_previous_errors(client):
+    response = client.post(
+        url_for("parse", previous="0" * 64),
+        data={"filename": "environment.yml", "file": "dependencies: [numpy]"},
+        content_type="application/x-www-form-urlencoded",
+    )
+    assert response.status == "404 NOT FOUND"
+
+    response = client.post(
+        url_for("parse"),
+        data={
+            "filename": "environment.yml",
+            "file": "dependencies: [numpy]",
+            "previous_lockfile": '[{"name": "numpy"}]',
+        },
+        content_type="application/x-www-form-urlencoded",
+    )
+    assert response.status == "400 BAD REQUEST"
+    assert "previous_lockfile" in response.json["text"]
+
+
+def test_parse_force_no_etag(client, mocker, fake_numpy_deps):
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps)
+    response = _post_multipart(client, "tests/fixtures/just_numpy.yml", "parse")
+
+    assert response.status == "200 OK"
+    assert "ETag" not in response.headers
+
+
+def test_metrics(client, mocker, fake_numpy_deps):
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps)
+    _post_multipart(client, "tests/fixtures/just_numpy.yml", "parse")
+
+    response = client.get(url_for("metrics_page"))
+    text = response.data.decode("utf-8")
+
+    assert response.status == "200 OK"
+    assert (
+        'conda_parser_requests_total{endpoint="parse",method="POST",status="200"} 1'
+        in text
+    )
+    for stage in ("read_environment", "match_specs", "find_bad_specs"):
+        assert f'conda_parser_stage_seconds_count{{stage="{stage}"}} 1' in text
+    assert 'conda_parser_stage_seconds_count{stage="solve_final_state"} 1' in text
+    assert 'conda_parser_cache_requests_total{cache="solve",result="miss"} 1' in text
+
+
+def test_parse_profile_header(client, mocker, tmp_path, fake_numpy_deps):
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps)
+    profiler = Profiler(str(tmp_path), 60, token="secret")
+    mocker.patch("conda_parser.profiling.PROFILER", profiler)
+    with open("tests/fixtures/just_numpy.yml", "rb") as f:
+        data = {"file": (io.BytesIO(f.read()), "just_numpy.yml")}
+
+    client.post(
+        url_for("parse", force_solve=1),
+        data=data,
+        content_type="multipart/form-data",
+        headers={"X-Conda-Parser-Profile": "secret"},
+    )
+
+    [path] = tmp_path.glob("*.json")
+    metadata = json.loads(path.read_text())
+    assert metadata["trigger"] == "header"
+    assert metadata["specs"] == ["numpy 1.16.4"]
+    assert metadata["channels"] == ["anaconda", "defaults"]
+
+
+def test_parse_profile_streamed(client, mocker, tmp_path, fake_numpy_deps):
+    """ a streamed solve is profiled until its last line is sent """
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps)
+    profiler = Profiler(str(tmp_path), 60, token="secret")
+    mocker.patch("conda_parser.profiling.PROFILER", profiler)
+
+    response = client.post(
+        url_for("parse", force_solve=1),
+        data={"filename": "environment.yml", "file": "dependencies: [numpy]"},
+        content_type="application/x-www-form-urlencoded",
+        headers={"Accept": "application/x-ndjson", "X-Conda-Parser-Profile": "secret"},
+    )
+    assert response.data.splitlines()[-1] == b'{"bad_specs": []}'
+    response.close()
+
+    [path] = tmp_path.glob("*.json")
+    metadata = json.loads(path.read_text())
+    assert metadata["specs"] == ["numpy"]
+    stats = pstats.Stats(str(path).replace(".json", ".prof"))
+    assert any(name == "solve_final_state" for _, _, name in stats.stats)
+
+
+def test_parse_graph(client, local_mirror):
+    data = {"filename": "environment.yml", "file": "dependencies: [bench-0012]"}
+    response = client.post(
+        url_for("parse", force_solve=1, graph=1, platforms="osx-64,win-64"),
+        data=data,
+        content_type="application/x-www-form-urlencoded",
+    )
+    graphs = response.json["graphs"]
+
+    assert set(graphs) == {"osx-64", "win-64"}
+    for platform, lockfile in response.json["lockfiles"].items():
+        assert set(graphs[platform]["packages"]) == {e["name"] for e in lockfile}
+        assert graphs[platform]["packages"]["bench-0012"]["direct"]
+
+    # without graph=1 there's no graph
+    response = client.post(
+        url_for("parse", force_solve=1),
+        data=data,
+        content_type="application/x-www-form-urlencoded",
+    )
+    assert "graph" not in response.json
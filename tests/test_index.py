@@ -0,0 +1,101 @@
+import runpy
+
+import pytest
+
+from conda.models.records import PackageRecord
+
+from conda_parser.index import (
+    ChannelIndex,
+    RepodataRefresher,
+    get_index,
+    preload,
+    preloaded_at,
+)
+
+
+def _record(name, version, build_number=0):
+    return PackageRecord(
+        name=name,
+        version=version,
+        build=f"py37_{build_number}",
+        build_number=build_number,
+        channel="https://conda.anaconda.org/conda-forge/linux-64",
+        subdir="linux-64",
+        fn=f"{name}-{version}-py37_{build_number}.tar.bz2",
+    )
+
+
+def test_channel_index_query(mocker):
+    records = [
+        _record("numpy", "1.9.3"),
+        _record("numpy", "1.16.4", 0),
+        _record("numpy", "1.16.4", 1),
+        _record("numpy", "1.10.0"),
+        _record("scipy", "1.3.0"),
+    ]
+    mocker.patch.object(ChannelIndex, "_load_records", return_value=records)
+    index = ChannelIndex("conda-forge")
+
+    # newest version, then highest build number
+    assert index.query("numpy").version == "1.16.4"
+    assert index.query("numpy").build_number == 1
+    assert index.query("numpy <1.10").version == "1.9.3"
+    assert index.query("numpy ==1.10.0").version == "1.10.0"
+    assert index.query("numpy >2") is None
+    assert index.query("pandas") is None
+
+
+def test_preload_swaps_in_refreshed_indexes(fake_channels):
+    preload(["conda-forge"])
+    before = get_index("conda-forge")
+    assert preloaded_at() is not None
+
+    preload(["conda-forge"], refresh=True)
+    assert get_index("conda-forge") is not before
+    assert fake_channels.call_args[0] == (True,)
+
+
+def test_channel_index_signature(mocker):
+    records = [_record("numpy", "1.16.4"), _record("scipy", "1.3.0")]
+    load = mocker.patch.object(ChannelIndex, "_load_records", return_value=records)
+
+    first = ChannelIndex("conda-forge").repodata_signature()
+    assert ChannelIndex("conda-forge").repodata_signature() == first
+
+    load.return_value = records[:1]
+    assert ChannelIndex("conda-forge").repodata_signature() != first
+
+
+def test_refresher_retries_until_loaded(fake_channels):
+    refresher = RepodataRefresher(3600, ["conda-forge"], retry=60)
+    assert refresher.wait() == 60
+
+    preload(["conda-forge"])
+    assert refresher.wait() == 3600
+    assert RepodataRefresher(0, ["conda-forge"], retry=60).wait() == 0
+
+
+def test_refresher_retries_failed_load(mocker, fake_channels):
+    """ an index that failed to load on first use isn't loaded """
+    refresher = RepodataRefresher(3600, ["conda-forge"], retry=60)
+    index = get_index("conda-forge")
+    mocker.patch.object(index, "load", side_effect=OSError("no repodata"))
+    with pytest.raises(OSError):
+        index.records("numpy")
+
+    assert refresher.wait() == 60
+
+
+def test_gunicorn_starts_without_repodata(mocker):
+    """ a failed preload is logged, not fatal, the workers keep trying """
+    conf = runpy.run_path("gunicorn.conf.py")
+    mocker.patch("conda_parser.index.preload", side_effect=OSError("offline"))
+    mocker.patch("conda_parser.preload_imports")
+    server = mocker.Mock()
+
+    conf["on_starting"](server)
+    assert server.log.exception.call_count == 1
+
+    refresher = mocker.patch("conda_parser.index.start_refresher")
+    conf["post_fork"](server, mocker.Mock())
+    refresher.assert_called_once_with(retry=True)
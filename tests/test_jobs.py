@@ -0,0 +1,137 @@
+import concurrent.futures
+import json
+import time
+
+import pytest
+
+from flask import url_for
+
+from conda_parser.cache import LRUCache
+from conda_parser.exceptions import QueueFull, SolveFailed
+from conda_parser.executor import ProcessSolverExecutor
+from conda_parser.jobs import JobQueue, _run
+
+
+@pytest.fixture
+def thread_pool(mocker):
+    """ Mocks don't cross process boundaries, so run jobs on a thread instead """
+    pool = concurrent.futures.ThreadPoolExecutor(1)
+    mocker.patch.object(JobQueue, "_pool", return_value=pool)
+    yield pool
+    pool.shutdown()
+
+
+def test_parse_async(client, mocker, thread_pool, fake_numpy_deps):
+    mocker.patch("conda.api.Solver.solve_final_state", side_effect=fake_numpy_deps)
+    with open("tests/fixtures/just_numpy.yml") as f:
+        data = {"file": f.read(), "filename": "just_numpy.yml"}
+
+    response = client.post(
+        url_for("parse", force_solve=1, **{"async": 1}),
+        data=data,
+        content_type="application/x-www-form-urlencoded",
+    )
+    assert response.status == "202 ACCEPTED"
+    job_id = json.loads(response.data)["id"]
+
+    thread_pool.shutdown(wait=True)  # wait for the job to finish
+    response = client.get(url_for("job", job_id=job_id))
+    data = json.loads(response.data)
+
+    assert data["status"] == "done"
+    assert {"name": "numpy-base", "requirement": "1.16.4"} in data["result"]["lockfile"]
+
+
+def test_job_solves(local_mirror):
+    """ a job solves for real, on its process's own solver process """
+    jobs = JobQueue(1, 1, 300, LRUCache())
+    try:
+        job_id = jobs.submit(
+            "environment.yml",
+            "channels: [conda-forge]\ndependencies: [bench-0010 3.0]",
+            True,
+        )
+        for _ in range(600):
+            status = jobs.status(job_id)
+            if status["status"] != "pending":
+                break
+            time.sleep(0.5)
+
+        assert status["status"] == "done", status
+        assert {"name": "bench-0010", "requirement": "3.0"} in status["result"][
+            "lockfile"
+        ]
+    finally:
+        jobs._pool().shutdown()
+
+
+def test_job_not_found(client):
+    response = client.get(url_for("job", job_id="nope"))
+    assert response.status == "404 NOT FOUND"
+
+
+def test_job_queue_full(thread_pool):
+    jobs = JobQueue(1, 0, 60, LRUCache())
+    with pytest.raises(QueueFull):
+        jobs.submit("environment.yml", "dependencies: [numpy]", False)
+
+
+def test_job_timeout(mocker):
+    future = concurrent.futures.Future()
+    pool = mocker.Mock(submit=mocker.Mock(return_value=future))
+    mocker.patch.object(JobQueue, "_pool", return_value=pool)
+    clock = mocker.patch("time.monotonic", return_value=0.0)
+
+    jobs = JobQueue(1, 1, 60, LRUCache())
+    job_id = jobs.submit("environment.yml", "dependencies: [numpy]", True)
+    assert jobs.status(job_id)["status"] == "pending"
+
+    future.set_running_or_notify_cancel()  # running jobs can't be cancelled
+    clock.return_value = 61.0
+    assert jobs.status(job_id) == {
+        "id": job_id,
+        "status": "failed",
+        "error": "Timed out after 60 seconds",
+    }
+
+    # it's still running, so it still takes up the queue
+    assert jobs.queued() == 1
+    with pytest.raises(QueueFull):
+        jobs.submit("environment.yml", "dependencies: [numpy]", True)
+
+    # a late result is ignored
+    future.set_result({"lockfile": []})
+    assert jobs.status(job_id)["status"] == "failed"
+    assert jobs.queued() == 0
+
+
+def test_job_timeout_queued(mocker):
+    future = concurrent.futures.Future()
+    pool = mocker.Mock(submit=mocker.Mock(return_value=future))
+    mocker.patch.object(JobQueue, "_pool", return_value=pool)
+    clock = mocker.patch("time.monotonic", return_value=0.0)
+
+    jobs = JobQueue(1, 10, 60, LRUCache())
+    job_id = jobs.submit("environment.yml", "dependencies: [numpy]", True)
+
+    clock.return_value = 61.0
+    assert jobs.status(job_id)["error"] == "Timed out after 60 seconds"
+    assert future.cancelled()
+    assert jobs.queued() == 0
+
+
+def test_job_deadline_kills_solve(mocker):
+    """ a job's solve is killed at its deadline, freeing the job's process """
+    executor = ProcessSolverExecutor(1, timeout=60, function=time.sleep)
+    mocker.patch(
+        "conda_parser.jobs.parse_environment",
+        side_effect=lambda *args: executor.call(60),
+    )
+    try:
+        started = time.monotonic()
+        with pytest.raises(SolveFailed, match="timed out"):
+            _run("environment.yml", "", True, deadline=time.time() + 2)
+        assert time.monotonic() - started < 30
+        assert executor.replaced == 1
+    finally:
+        executor.shutdown()
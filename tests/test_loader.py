@@ -0,0 +1,96 @@
+import pytest
+import yaml
+
+from conda_parser.exceptions import EnvironmentFileError
+from conda_parser.loader import load_environment
+from conda_parser.parse import FILTER_KEYS
+
+
+@pytest.mark.parametrize(
+    "fixture", ["all_styles.yml", "just_numpy.yml", "with_pip.yml", "numpy.yml.lock"]
+)
+def test_load_environment_same_as_yaml(fixture):
+    """ The kept keys come out the same as yaml.load's """
+    with open(f"tests/fixtures/{fixture}", "rb") as f:
+        body = f.read()
+    environment = yaml.load(body, Loader=yaml.CLoader)
+
+    assert load_environment(body, FILTER_KEYS) == {
+        k: v for k, v in environment.items() if k in FILTER_KEYS
+    }
+
+
+def test_load_environment_aliases():
+    body = "name: &n x\nignored: [*n]\ndependencies: [*n, y]\nchannels: [defaults]"
+
+    assert load_environment(body, FILTER_KEYS) == {
+        "dependencies": ["x", "y"],
+        "channels": ["defaults"],
+    }
+
+
+def _billion_laughs(levels):
+    lines = ["a0: &a0 [lol, lol, lol, lol, lol, lol, lol, lol, lol, lol]"]
+    for i in range(1, levels):
+        aliases = ", ".join([f"*a{i - 1}"] * 10)
+        lines.append(f"a{i}: &a{i} [{aliases}]")
+    lines.append(f"dependencies: *a{levels - 1}")
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize(
+    "body, message",
+    [
+        ("", "empty"),
+        ("- numpy\n- scipy", "must be a mapping"),
+        ("dependencies: " + "[" * 9 + "]" * 9, "nests more than 8 deep"),
+        (_billion_laughs(9), "more than 1000 values"),
+        ("dependencies: [*missing]", "undefined alias"),
+        ("dependencies: [x]\n---\ndependencies: [y]", "single document"),
+    ],
+)
+def test_load_environment_limits(body, message):
+    with pytest.raises(EnvironmentFileError, match=message):
+        load_environment(body, FILTER_KEYS, max_nodes=1000, max_depth=8)
+
+
+def test_load_environment_max_size():
+    with pytest.raises(EnvironmentFileError, match="over 100 bytes"):
+        load_environment("dependencies: [numpy]" + " " * 100, FILTER_KEYS, max_size=100)
+
+
+def test_load_environment_unsafe_tags():
+    with pytest.raises(yaml.YAMLError):
+        load_environment("dependencies: !!python/name:os.system x", FILTER_KEYS)
+
+
+def test_load_environment_max_size_bytes():
+    """ the limit is in bytes, however many characters they make """
+    body = "dependencies: [numpy] # " + "é" * 40
+    with pytest.raises(EnvironmentFileError, match="over 100 bytes"):
+        load_environment(body, FILTER_KEYS, max_size=100)
+    assert load_environment(body, FILTER_KEYS, max_size=200) == {
+        "dependencies": ["numpy"]
+    }
+
+
+@pytest.mark.parametrize("body", [None, 1, ["dependencies: [numpy]"]])
+def test_load_environment_not_text(body):
+    with pytest.raises(EnvironmentFileError, match="must be text"):
+        load_environment(body, FILTER_KEYS)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "base: &b {dependencies: [x], channels: [c]}\n<<: *b\ndependencies: [y]",
+        "dependencies: [y]\n<<: [{dependencies: [x], name: n}, {prefix: p}]",
+    ],
+)
+def test_load_environment_merge_key(body):
+    """ a top level `<<` is merged like yaml.load does, given keys winning """
+    environment = yaml.load(body, Loader=yaml.CLoader)
+
+    assert load_environment(body, FILTER_KEYS) == {
+        k: v for k, v in environment.items() if k in FILTER_KEYS
+    }
@@ -0,0 +1,50 @@
+from conda_parser.metrics import Metrics, merge, render
+
+
+def test_metrics_render():
+    metrics = Metrics()
+    metrics.inc("conda_parser_bad_specs_total", 2)
+    metrics.inc("conda_parser_requests_total", endpoint="parse", status="200")
+    metrics.observe("conda_parser_stage_seconds", 0.003, stage="match_specs")
+    metrics.observe("conda_parser_stage_seconds", 20.0, stage="match_specs")
+
+    text = render(merge([metrics.snapshot()]))
+
+    assert "# TYPE conda_parser_stage_seconds histogram" in text
+    assert "conda_parser_bad_specs_total 2\n" in text
+    assert 'conda_parser_requests_total{endpoint="parse",status="200"} 1\n' in text
+    assert 'conda_parser_stage_seconds_bucket{stage="match_specs",le="0.001"} 0' in text
+    assert 'conda_parser_stage_seconds_bucket{stage="match_specs",le="0.005"} 1' in text
+    assert 'conda_parser_stage_seconds_bucket{stage="match_specs",le="+Inf"} 2' in text
+    assert 'conda_parser_stage_seconds_sum{stage="match_specs"} 20.003' in text
+    assert 'conda_parser_stage_seconds_count{stage="match_specs"} 2' in text
+
+
+def test_metrics_merge_workers():
+    first, second = Metrics(), Metrics()
+    first.inc("conda_parser_bad_specs_total")
+    second.inc("conda_parser_bad_specs_total", 2)
+    first.observe("conda_parser_request_seconds", 0.5, endpoint="parse")
+    second.observe("conda_parser_request_seconds", 0.5, endpoint="parse")
+
+    merged = merge([first.snapshot(), second.snapshot()])
+
+    assert merged["counters"][("conda_parser_bad_specs_total", ())] == 3
+    histogram = merged["histograms"][
+        ("conda_parser_request_seconds", (("endpoint", "parse"),))
+    ]
+    assert sum(histogram[:-1]) == 2
+    assert histogram[-1] == 1.0
+
+
+def test_metrics_directory(tmp_path):
+    (tmp_path / "1.json").write_text(
+        '{"counters": [["conda_parser_bad_specs_total", [], 5]], "histograms": []}'
+    )
+    metrics = Metrics(str(tmp_path), flush_every=60)
+    metrics.inc("conda_parser_bad_specs_total")
+
+    merged = merge(metrics.snapshots())
+
+    assert merged["counters"][("conda_parser_bad_specs_total", ())] == 6
+    assert len(list(tmp_path.glob("*.json"))) == 2
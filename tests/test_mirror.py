@@ -0,0 +1,101 @@
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+from flask import url_for
+
+from benchmarks.channel import write_channel
+from conda_parser import mirror
+from conda_parser.executor import solve_final_state
+from conda_parser.info import package_info
+from conda_parser.parse import solve_environment
+
+
+def test_mirror_solve(local_mirror):
+    lockfile, bad_specs = solve_environment(
+        {
+            "channels": ["conda-forge", "defaults"],
+            "dependencies": [
+                {"name": "bench-0010", "requirement": ">=1.0"},
+                {"name": "not-mirrored", "requirement": ""},
+            ],
+        }
+    )
+
+    assert {"name": "bench-0010", "requirement": "4.0"} in lockfile
+    assert bad_specs == ["not-mirrored"]
+
+
+def test_mirror_solve_uncached(local_mirror):
+    # straight to conda, without the index loading the repodata first
+    records = solve_final_state(str(local_mirror / "env"), ["defaults"], ["bench-0005"])
+    assert "bench-0005" in [record["name"] for record in records]
+
+
+def test_mirror_package_info(local_mirror):
+    record = package_info("conda-forge", "bench-0003", "2.0")
+    assert record["url"].startswith("https://conda.anaconda.org/conda-forge/")
+    assert record["channel"].startswith("https://conda.anaconda.org/conda-forge")
+    assert str(local_mirror) not in str(record)
+
+    record = package_info("defaults", "bench-0003", "2.0", solve=True)
+    assert record["url"].startswith("https://repo.anaconda.com/pkgs/main/")
+
+
+def test_mirror_package_download(client, local_mirror):
+    response = client.get(
+        url_for("package", channel="conda-forge", name="bench-0003", download=1)
+    )
+    assert response.location.startswith("https://conda.anaconda.org/conda-forge/")
+
+
+def test_upstream_url(monkeypatch):
+    monkeypatch.setattr(mirror, "_root", "file:///mirror")
+
+    assert (
+        mirror.upstream_url("file:///mirror/pkgs/r/noarch/x-1.0-0.tar.bz2")
+        == "https://repo.anaconda.com/pkgs/r/noarch/x-1.0-0.tar.bz2"
+    )
+    assert (
+        mirror.upstream_url("file:///mirror/bioconda/linux-64")
+        == "https://conda.anaconda.org/bioconda/linux-64"
+    )
+    assert mirror.upstream_url("file:///elsewhere/x") == "file:///elsewhere/x"
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """ An http server of a channel, which knows If-Modified-Since """
+    root = tmp_path / "upstream"
+    write_channel(str(root), "conda-forge", "linux-64", packages=3)
+    handler = functools.partial(
+        http.server.SimpleHTTPRequestHandler, directory=str(root)
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield root, f"http://127.0.0.1:{server.server_port}/conda-forge"
+    server.shutdown()
+
+
+def test_sync(tmp_path, upstream):
+    root, url = upstream
+    directory = str(tmp_path / "mirror")
+    upstreams = {"conda-forge": [url]}
+
+    synced = mirror.sync(directory, ["conda-forge"], ["linux-64"], upstreams)
+    assert synced == [(f"{url}/linux-64/repodata.json", True)]
+    path = os.path.join(directory, "conda-forge", "linux-64", "repodata.json")
+    with open(path) as f, open(root / "conda-forge/linux-64/repodata.json") as g:
+        assert f.read() == g.read()
+
+    # unchanged upstream isn't downloaded again, changed upstream is
+    synced = mirror.sync(directory, ["conda-forge"], ["linux-64"], upstreams)
+    assert synced == [(f"{url}/linux-64/repodata.json", False)]
+
+    upstream_path = root / "conda-forge/linux-64/repodata.json"
+    os.utime(upstream_path, (0, os.path.getmtime(upstream_path) + 10))
+    synced = mirror.sync(directory, ["conda-forge"], ["linux-64"], upstreams)
+    assert synced == [(f"{url}/linux-64/repodata.json", True)]
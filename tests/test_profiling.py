@@ -0,0 +1,61 @@
+import json
+import pstats
+import time
+
+from conda_parser.profiling import Profiler
+
+
+def _slow_request():
+    time.sleep(0.1)
+
+
+def test_profile_over_threshold(tmp_path):
+    profiler = Profiler(str(tmp_path), threshold=0.02, interval=0.001)
+    profiler.start()
+    profiler.annotate(specs=["numpy"], channels=["defaults"])
+    _slow_request()
+    path = profiler.finish(method="POST", path="/parse?")
+
+    with open(path) as f:
+        metadata = json.load(f)
+    assert metadata["trigger"] == "threshold"
+    assert metadata["specs"] == ["numpy"]
+    assert metadata["samples"] > 0
+    with open(path.replace(".json", ".folded")) as f:
+        assert "_slow_request (test_profiling.py:" in f.read()
+
+
+def test_profile_under_threshold(tmp_path):
+    profiler = Profiler(str(tmp_path), threshold=60)
+    profiler.start()
+    assert profiler.finish() is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profile_header(tmp_path):
+    profiler = Profiler(str(tmp_path), threshold=60, token="secret")
+    profiler.start("wrong")
+    assert profiler.finish() is None
+
+    profiler.start("secret")
+    _slow_request()
+    path = profiler.finish()
+
+    stats = pstats.Stats(path.replace(".json", ".prof"))
+    assert any(name == "_slow_request" for _, _, name in stats.stats)
+
+
+def test_profile_header_needs_token(tmp_path):
+    profiler = Profiler(str(tmp_path), threshold=60)
+    profiler.start("1")
+    _slow_request()
+    assert profiler.finish() is None
+
+
+def test_profile_keep(tmp_path):
+    profiler = Profiler(str(tmp_path), threshold=60, keep=1, token="1")
+    for _ in range(3):
+        profiler.start("1")
+        profiler.finish()
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    assert len(list(tmp_path.glob("*.prof"))) == 1
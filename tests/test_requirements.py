@@ -0,0 +1,78 @@
+import pytest
+
+from conda_parser.requirements import parse_requirement
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("requests", {"name": "requests", "requirement": ""}),
+        ("requests==2.22.0", {"name": "requests", "requirement": "==2.22.0"}),
+        ("Django >= 2.2, < 3", {"name": "Django", "requirement": ">=2.2,<3"}),
+        ("zope.interface (~=4.6)", {"name": "zope.interface", "requirement": "~=4.6"}),
+        ("flask==1.* # the web bit", {"name": "flask", "requirement": "==1.*"}),
+        (
+            "flask==1.0 --hash=sha256:0123abcd",
+            {"name": "flask", "requirement": "==1.0"},
+        ),
+        (
+            "requests[security, socks]>=2.8",
+            {
+                "name": "requests",
+                "requirement": ">=2.8",
+                "extras": ["security", "socks"],
+            },
+        ),
+        (
+            "pywin32 >=1.0 ; sys_platform == 'win32'",
+            {
+                "name": "pywin32",
+                "requirement": ">=1.0",
+                "marker": "sys_platform == 'win32'",
+            },
+        ),
+        (
+            "pkg @ https://example.com/pkg-1.0.whl",
+            {
+                "name": "pkg",
+                "requirement": "",
+                "url": "https://example.com/pkg-1.0.whl",
+            },
+        ),
+        (
+            "git+https://github.com/a/b.git@v1#egg=b",
+            {
+                "name": "b",
+                "requirement": "",
+                "url": "git+https://github.com/a/b.git@v1#egg=b",
+            },
+        ),
+        (
+            "--editable=git+https://github.com/a/b#subdirectory=c&egg=b-c",
+            {
+                "name": "b-c",
+                "requirement": "",
+                "url": "git+https://github.com/a/b#subdirectory=c&egg=b-c",
+            },
+        ),
+    ],
+)
+def test_parse_requirement(line, expected):
+    assert parse_requirement(line) == expected
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "",
+        "# a comment",
+        "-r requirements.txt",
+        "--index-url https://pypi.org/simple",
+        "./local/package",
+        "https://example.com/pkg-1.0.whl",
+        "not a requirement!",
+        "numpy >=>1",
+    ],
+)
+def test_parse_requirement_not_a_requirement(line):
+    assert parse_requirement(line) is None
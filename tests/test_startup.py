@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+
+# imports the package, then answers a health check and a manifest-only parse
+STARTUP = """
+import json, sys
+
+import conda_parser
+
+imported = sorted(sys.modules)
+client = conda_parser.create_app().test_client()
+index = client.get("/")
+parse = client.post(
+    "/parse",
+    data={"filename": "environment.yml", "file": "dependencies:\\n  - numpy\\n"},
+)
+print(json.dumps({
+    "imported": imported,
+    "served": sorted(sys.modules),
+    "statuses": [index.status_code, parse.status_code],
+    "manifest": parse.get_json()["manifest"],
+}))
+"""
+
+
+def conda_modules(modules):
+    return [m for m in modules if m == "conda" or m.startswith("conda.")]
+
+
+def test_startup_is_lazy():
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP], check=True, stdout=subprocess.PIPE
+    ).stdout
+    startup = json.loads(output.decode().splitlines()[-1])
+
+    assert "flask" not in startup["imported"]
+    assert conda_modules(startup["imported"]) == []
+    assert startup["statuses"] == [200, 200]
+    assert startup["manifest"] == [{"name": "numpy", "requirement": ""}]
+    assert conda_modules(startup["served"]) == []
+
+
+def test_preload_imports():
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, conda_parser; conda_parser.preload_imports(); "
+            "print(' '.join(sys.modules))",
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    modules = output.decode().split()
+
+    for module in ("flask", "conda.api", "conda_parser.app", "conda_parser.parse"):
+        assert module in modules
@@ -0,0 +1,55 @@
+from conda_parser.cache import LRUCache, SQLiteCache, TieredCache
+from conda_parser.parse import lockfile_digest
+from conda_parser.store import LockfileStore
+
+LOCKFILE = [
+    {"name": "python", "requirement": "3.7.4"},
+    {"name": "numpy", "requirement": "1.16.4"},
+]
+
+
+def _store(disk=None):
+    return LockfileStore(TieredCache(LRUCache(), disk), LRUCache())
+
+
+def test_lockfile_store():
+    store = _store()
+    key = store.put(LOCKFILE)
+
+    assert key == lockfile_digest(LOCKFILE)
+    assert store.put(list(reversed(LOCKFILE))) == key
+    assert store.get(key) == sorted(LOCKFILE, key=lambda entry: entry["name"])
+    assert store.get("0" * 64) is None
+
+
+def test_lockfile_store_put_isnt_counted():
+    """ puts don't count as lookups in the /stats hits and misses """
+    store = _store()
+    store.put(LOCKFILE)
+    store.put(LOCKFILE)
+
+    assert store.cache.memory.stats()["hits"] == 0
+    assert store.cache.memory.stats()["misses"] == 0
+    assert len(store.cache.memory) == 1
+
+
+def test_lockfile_store_shares_entries():
+    store = _store()
+    first = store.put(LOCKFILE)
+    second = store.put(LOCKFILE[:1] + [{"name": "numpy", "requirement": "1.17.0"}])
+
+    # both lockfiles hold the same python entry
+    python = [store.cache.get(key)[-1] for key in (first, second)]
+    assert python[0] == ("python", "3.7.4")
+    assert python[0] is python[1]
+    assert store.share(("python", "3.7.4")) is python[0]
+
+
+def test_lockfile_store_disk(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.db"), table="lockfile_sets")
+    key = _store(disk).put(LOCKFILE)
+
+    # another worker reads it back from disk, and shares its entries again
+    store = _store(SQLiteCache(str(tmp_path / "cache.db"), table="lockfile_sets"))
+    assert store.get(key) == sorted(LOCKFILE, key=lambda entry: entry["name"])
+    assert store.cache.memory.get(key)[0] is store.share(("numpy", "1.16.4"))